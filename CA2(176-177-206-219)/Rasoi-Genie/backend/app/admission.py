@@ -0,0 +1,183 @@
+# admission.py - per-user rate limits and a global concurrency budget for LLM-backed generation
+#
+# Every agent/structured /generate-menu request the menu cache can't answer is
+# checked against the user's token bucket and the number of LLM generations
+# already admitted; over either limit the API answers 429 with Retry-After
+# instead of queueing more provider calls. Admitted requests go to
+# jobs.llm_job_queue, whose workers match the AGENT_MAX_CONCURRENCY run slots,
+# so they never wait on the workers that serve local plans and cache hits
+# (which are not admitted at all). Identical requests
+# from a user that is still waiting are coalesced onto the first job by
+# jobs.MenuJobQueue.
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable
+
+from . import metrics
+from .ratelimit import TokenBucket
+
+GENERATE_RATE_PER_MINUTE = float(os.getenv("GENERATE_RATE_PER_MINUTE", 6))
+GENERATE_BURST = float(os.getenv("GENERATE_BURST", 3))
+GENERATE_MAX_TRACKED_USERS = int(os.getenv("GENERATE_MAX_TRACKED_USERS", 10000))
+# LLM runs at once across API requests and batches; also the number of jobs.llm_job_queue workers
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", 3))
+AGENT_MAX_QUEUED = int(os.getenv("AGENT_MAX_QUEUED", 12))
+# Assumed run time until the first agent run has been measured (for Retry-After)
+AGENT_RUN_SECONDS_ESTIMATE = float(os.getenv("AGENT_RUN_SECONDS_ESTIMATE", 30))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a generation request is over its user's rate or the global budget"""
+
+    def __init__(self, detail: str, retry_after: float, reason: str):
+        super().__init__(detail)
+        self.retry_after = retry_after
+        self.reason = reason  # "rate_limited" or "saturated"
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class UserRateLimiter:
+    """One TokenBucket per user, the least recently used dropped past max_users.
+
+    A dropped user simply starts again with a full bucket. A rate of 0
+    disables limiting.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float, max_users: int):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_users = max_users
+        self.allowed = 0
+        self.limited = 0
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, user_id: Hashable) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, capacity=self.burst)
+                while len(self._buckets) > self.max_users:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+            return bucket
+
+    def check(self, user_id: Hashable):
+        """Take one token for user_id or raise AdmissionRejected"""
+        wait = self._bucket(user_id).try_acquire()
+        with self._lock:
+            if wait:
+                self.limited += 1
+            else:
+                self.allowed += 1
+        if wait:
+            raise AdmissionRejected("Too many menu generations, please wait before trying again", wait, "rate_limited")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate_per_minute": round(self.rate * 60, 3),
+                "burst": self.burst,
+                "tracked_users": len(self._buckets),
+                "allowed": self.allowed,
+                "limited": self.limited
+            }
+
+
+class ConcurrencyBudget:
+    """At most max_concurrent LLM generations running and max_queued more admitted behind them.
+
+    admit()/release() bracket a request from submission to completion (a
+    cached menu found at submission isn't admitted); run() brackets the LLM
+    work itself, blocking for a slot. Batch runs only use run(), so they share
+    the provider budget without counting against API admission.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, run_seconds_estimate: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.admitted = 0
+        self.running = 0
+        self.rejected = 0
+        self.completed_runs = 0
+        self._avg_run_seconds = run_seconds_estimate
+        self._slots = threading.Semaphore(max_concurrent)
+        self._lock = threading.Lock()
+
+    def _retry_after(self) -> float:
+        # Roughly how long until the backlog ahead of a new request has drained by one slot's worth
+        waves = max(1, self.admitted - self.max_concurrent + 1) / self.max_concurrent
+        return self._avg_run_seconds * max(1.0, waves)
+
+    def admit(self):
+        with self._lock:
+            if self.admitted >= self.max_concurrent + self.max_queued:
+                self.rejected += 1
+                raise AdmissionRejected("Menu generation is at capacity, please try again shortly",
+                                        self._retry_after(), "saturated")
+            self.admitted += 1
+
+    def release(self):
+        with self._lock:
+            self.admitted -= 1
+
+    @contextmanager
+    def run(self):
+        waited_from = time.perf_counter()
+        self._slots.acquire()
+        started = time.perf_counter()
+        metrics.MENU_STAGE_SECONDS.labels("agent_slot_wait").observe(started - waited_from)
+        with self._lock:
+            self.running += 1
+        try:
+            yield
+        finally:
+            self._slots.release()
+            with self._lock:
+                self.running -= 1
+                self.completed_runs += 1
+                # Exponentially weighted, so Retry-After follows the provider's current latency
+                self._avg_run_seconds += 0.2 * ((time.perf_counter() - started) - self._avg_run_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queued": self.max_queued,
+                "admitted": self.admitted,
+                "running": self.running,
+                "rejected": self.rejected,
+                "completed_runs": self.completed_runs,
+                "avg_run_seconds": round(self._avg_run_seconds, 3)
+            }
+
+
+user_limiter = UserRateLimiter(GENERATE_RATE_PER_MINUTE, GENERATE_BURST, GENERATE_MAX_TRACKED_USERS)
+agent_budget = ConcurrencyBudget(AGENT_MAX_CONCURRENCY, AGENT_MAX_QUEUED, AGENT_RUN_SECONDS_ESTIMATE)
+
+
+def admit(user_id: Hashable):
+    """Admit one LLM-backed generation for user_id; the caller must agent_budget.release() it"""
+    try:
+        agent_budget.admit()
+        try:
+            # After the budget check, so a saturated service doesn't also burn the user's tokens
+            user_limiter.check(user_id)
+        except AdmissionRejected:
+            agent_budget.release()
+            raise
+    except AdmissionRejected as e:
+        metrics.GENERATIONS_REJECTED.labels(e.reason).inc()
+        raise
+
+
+def stats() -> Dict[str, Any]:
+    return {"user_rate": user_limiter.stats(), "agent_budget": agent_budget.stats()}
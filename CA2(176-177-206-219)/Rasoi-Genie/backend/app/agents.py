@@ -9,275 +9,201 @@ from langchain_community.tools import DuckDuckGoSearchRun
 from langchain.chains.summarize import load_summarize_chain
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import WebBaseLoader
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
 
-from typing import Dict, List, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import json
 import random
+import threading
+import time
 from datetime import datetime, timedelta
 import os
 
-class IndianMenuDatabase:
-    """Simulated database of Indian dishes - replace with actual DB queries later"""
-    
-    DISHES = {
-        "north_indian": {
-            "breakfast": {
-                "veg": ["Aloo Paratha", "Chole Bhature", "Poha", "Upma", "Idli Sambhar", "Masala Dosa"],
-                "non_veg": ["Egg Paratha", "Keema Paratha", "Chicken Sandwich"],
-                "vegan": ["Poha", "Upma", "Vegetable Dalia", "Ragi Dosa"]
-            },
-            "lunch": {
-                "veg": ["Dal Tadka + Roti", "Rajma + Rice", "Chole + Rice", "Palak Paneer + Roti", 
-                       "Bhindi Masala + Roti", "Aloo Gobi + Roti", "Mix Veg + Roti"],
-                "non_veg": ["Chicken Curry + Rice", "Mutton Curry + Roti", "Fish Curry + Rice"],
-                "vegan": ["Dal Tadka + Roti", "Chana Masala + Rice", "Vegetable Curry + Roti"]
-            },
-            "dinner": {
-                "veg": ["Paneer Butter Masala + Roti", "Dal Makhani + Rice", "Stuffed Paratha + Raita"],
-                "non_veg": ["Butter Chicken + Naan", "Lamb Biryani", "Fish Fry + Rice"],
-                "vegan": ["Mixed Dal + Roti", "Vegetable Biryani", "Stuffed Roti + Pickle"]
-            },
-            "snacks": {
-                "veg": ["Samosa", "Pakora", "Dhokla", "Kachori", "Sandwich"],
-                "non_veg": ["Chicken Tikka", "Seekh Kebab", "Egg Roll"],
-                "vegan": ["Bhel Puri", "Roasted Chana", "Fruit Chaat"]
-            }
-        },
-        "south_indian": {
-            "breakfast": {
-                "veg": ["Idli Sambhar", "Masala Dosa", "Uttapam", "Rava Upma", "Medu Vada"],
-                "non_veg": ["Egg Dosa", "Chicken 65"],
-                "vegan": ["Plain Dosa", "Coconut Rice", "Lemon Rice"]
-            },
-            "lunch": {
-                "veg": ["Sambhar Rice", "Rasam Rice", "Curd Rice", "Vegetable Curry + Rice"],
-                "non_veg": ["Fish Curry + Rice", "Chicken Curry + Rice", "Mutton Biryani"],
-                "vegan": ["Sambhar Rice", "Tamarind Rice", "Coconut Chutney + Rice"]
-            },
-            "dinner": {
-                "veg": ["Paneer Masala + Rice", "Mixed Vegetable Curry + Rice"],
-                "non_veg": ["Chicken Biryani", "Fish Fry + Rice"],
-                "vegan": ["Vegetable Biryani", "Dal Rice"]
-            },
-            "snacks": {
-                "veg": ["Murukku", "Banana Chips", "Coconut Laddu"],
-                "non_veg": ["Chicken 65", "Fish Fry"],
-                "vegan": ["Roasted Groundnuts", "Coconut Barfi"]
-            }
-        },
-        "gujarati": {
-            "breakfast": {
-                "veg": ["Dhokla", "Khandvi", "Thepla", "Fafda Jalebi", "Poha"],
-                "vegan": ["Plain Thepla", "Dhokla", "Khakhra"]
-            },
-            "lunch": {
-                "veg": ["Dal Dhokli", "Undhiyu", "Gujarati Kadhi + Rice", "Bhindi Shaak + Rotli"],
-                "vegan": ["Mixed Dal + Rotli", "Vegetable Curry + Rice"]
-            },
-            "dinner": {
-                "veg": ["Gujarati Thali", "Khichdi Kadhi", "Stuffed Paratha"],
-                "vegan": ["Simple Khichdi", "Vegetable Curry + Rotli"]
-            },
-            "snacks": {
-                "veg": ["Dhokla", "Kachori", "Chakri", "Sev Mamra"],
-                "vegan": ["Khakhra", "Roasted Chana"]
-            }
-        },
-        "marathi": {
-            "breakfast": {
-                "veg": ["Poha", "Upma", "Misal Pav", "Sabudana Khichdi", "Thalipeeth"],
-                "non_veg": ["Chicken Vada Pav", "Egg Curry"], # Added some non-veg options for demonstration
-                "vegan": ["Poha", "Upma", "Sabudana Khichdi"]
-            },
-            "lunch": {
-                "veg": ["Dal Rice", "Bharleli Vangi", "Alu Vadi", "Zunka Bhakar"],
-                "non_veg": ["Mutton Curry", "Chicken Thali"], # Added non-veg options
-                "vegan": ["Dal Rice", "Vegetable Curry + Rice"]
-            },
-            "dinner": {
-                "veg": ["Puran Poli", "Bhakri + Pitla", "Vegetable Curry + Rice"],
-                "non_veg": ["Chicken Biryani", "Fish Fry"], # Added non-veg options
-                "vegan": ["Simple Dal + Rice", "Vegetable Curry + Bhakri"]
-            },
-            "snacks": {
-                "veg": ["Vada Pav", "Bhel Puri", "Kothimbir Vadi"],
-                "non_veg": ["Chicken Kothimbir Vadi"], # Added non-veg options
-                "vegan": ["Bhel Puri", "Roasted Chana"]
-            }
-        },
-        "bengali": {
-            "breakfast": {
-                "veg": ["Luchi Aloo Dum", "Poha", "Cholar Dal + Luchi"],
-                "non_veg": ["Fish Curry + Rice", "Egg Curry + Luchi"],
-                "vegan": ["Poha", "Aloo Dum + Rice"]
-            },
-            "lunch": {
-                "veg": ["Dal Rice", "Aloo Posto", "Begun Bhaja + Rice"],
-                "non_veg": ["Fish Curry + Rice", "Chicken Curry + Rice", "Prawn Malai Curry"],
-                "vegan": ["Dal Rice", "Aloo Posto + Rice"]
-            },
-            "dinner": {
-                "veg": ["Khichuri", "Mixed Vegetable + Rice"],
-                "non_veg": ["Fish Curry + Rice", "Mutton Curry + Rice"],
-                "vegan": ["Simple Khichuri", "Dal Rice"]
-            },
-            "snacks": {
-                "veg": ["Jhal Muri", "Beguni", "Ghugni"],
-                "non_veg": ["Fish Fry", "Chicken Cutlet"],
-                "vegan": ["Jhal Muri", "Roasted Chana"]
-            }
-        },
-        "punjabi": {
-            "breakfast": {
-                "veg": ["Chole Bhature", "Aloo Paratha", "Sarson da Saag + Makki Roti"],
-                "non_veg": ["Keema Paratha", "Egg Paratha"],
-                "vegan": ["Plain Paratha", "Sarson da Saag + Makki Roti"]
-            },
-            "lunch": {
-                "veg": ["Dal Makhani + Naan", "Rajma + Rice", "Palak Paneer + Roti"],
-                "non_veg": ["Butter Chicken + Naan", "Mutton Curry + Rice"],
-                "vegan": ["Chana Masala + Rice", "Mixed Dal + Roti"]
-            },
-            "dinner": {
-                "veg": ["Paneer Tikka Masala + Naan", "Dal Tadka + Rice"],
-                "non_veg": ["Chicken Tikka Masala + Naan", "Lamb Curry + Rice"],
-                "vegan": ["Mixed Vegetable + Roti", "Dal Rice"]
-            },
-            "snacks": {
-                "veg": ["Samosa", "Pakora", "Kulcha"],
-                "non_veg": ["Chicken Tikka", "Seekh Kebab"],
-                "vegan": ["Chana Chaat", "Fruit Chaat"]
-            }
-        }
-    }
-    
-    NUTRITIONAL_BALANCE = {
-        "high_protein": ["Dal", "Paneer", "Chicken", "Fish", "Egg", "Chana", "Rajma"],
-        "high_fiber": ["Bhindi", "Palak", "Mixed Veg", "Salad", "Gobi", "Begun"],
-        "low_oil": ["Steamed", "Boiled", "Grilled", "Idli", "Upma"],
-        "diabetic_friendly": ["Dal", "Vegetables", "Grilled items", "Salad", "Upma", "Poha"]
-    }
+from . import grocery, metrics, resilience, web_cache
+from .catalog import dish_catalog, infer_diet
+from .dishes import DISH_INDEX, DishAttributes, DishIndex, IndianMenuDatabase  # re-exported for existing callers
+from .nutrition import nutrition_scorer
+from .planner import COMPATIBLE_DIETS, DAYS, _normalize_key, menu_planner
+from .schema import MenuResponse
+
+# Structured mode: shortlisted dishes per meal shown to the LLM, and extra calls for invalid slots
+STRUCTURED_CANDIDATES = int(os.getenv("STRUCTURED_CANDIDATES", 15))
+STRUCTURED_MAX_REPAIRS = int(os.getenv("STRUCTURED_MAX_REPAIRS", 1))
+# Send the JSON schema as response_format too (only for models the provider supports JSON mode on)
+STRUCTURED_JSON_MODE = os.getenv("STRUCTURED_JSON_MODE", "0") == "1"
 
 class MenuGenerationTools:
     """Tools for the LangChain agent to use"""
     
     def __init__(self):
         self.db = IndianMenuDatabase()
+        self.index = DISH_INDEX
     
     def get_dishes_by_criteria(self, cuisine: str, meal_type: str, diet_type: str, count: int = 5) -> List[str]:
         """Get dishes based on cuisine, meal type, and diet preference"""
         try:
-            cuisines = [c.strip() for c in cuisine.split(',') if c.strip()]
-            all_dishes = []
-            for c in cuisines:
-                dishes = self.db.DISHES.get(c, {}).get(meal_type, {}).get(diet_type, [])
-                all_dishes.extend(dishes)
-            
-            dishes_result = random.sample(list(set(all_dishes)), min(count, len(list(set(all_dishes))))) if all_dishes else []
+            cuisines = tuple(c.strip() for c in cuisine.split(',') if c.strip())
+            pool = self.index.pool(cuisines, meal_type, diet_type)
             
             # This is the key change: return a more informative string
-            if not dishes_result:
-                return f"No dishes found in internal database for cuisine(s) {cuisines}, meal {meal_type}, diet {diet_type}."
-            return dishes_result
+            if not pool:
+                return f"No dishes found in internal database for cuisine(s) {list(cuisines)}, meal {meal_type}, diet {diet_type}."
+            return random.sample(pool, min(int(count), len(pool)))
         except Exception as e:
             return f"An error occurred while fetching dishes: {e}"
     
+    def slot_candidates(self, preferences: Dict[str, Any]) -> Dict[str, List[Tuple[str, float]]]:
+        """Weighted (dish, weight) candidates per meal, the same ones the local planner samples from"""
+        return menu_planner.slot_candidates(preferences)
+    
     def check_nutritional_balance(self, dishes: List[str], health_conditions: List[str]) -> Dict[str, Any]:
         """Check if the meal plan is nutritionally balanced"""
-        balance_score = 0
-        recommendations = []
-        
-        protein_dishes = [dish for dish in dishes if any(protein in dish for protein in self.db.NUTRITIONAL_BALANCE["high_protein"])]
-        if len(protein_dishes) >= 2:
-            balance_score += 25
-        else:
-            recommendations.append("Add more protein sources like Dal, Paneer, or Chicken")
-        
-        fiber_dishes = [dish for dish in dishes if any(fiber in dish for fiber in self.db.NUTRITIONAL_BALANCE["high_fiber"])]
-        if len(fiber_dishes) >= 3:
-            balance_score += 25
-        else:
-            recommendations.append("Include more vegetables like Bhindi, Palak, or Mixed Vegetables")
-        
-        if len(set(dishes)) == len(dishes):
-            balance_score += 25
-        else:
-            recommendations.append("Ensure variety - avoid repeating similar dishes")
-        
-        if "diabetes" in health_conditions:
-            diabetic_friendly = [dish for dish in dishes if any(friendly in dish for friendly in self.db.NUTRITIONAL_BALANCE["diabetic_friendly"])]
-            if len(diabetic_friendly) >= len(dishes) * 0.6:
-                balance_score += 25
-            else:
-                recommendations.append("Choose more diabetic-friendly options like Dal and Vegetables")
-        else:
-            balance_score += 25
-        
-        return {
-            "balance_score": balance_score,
-            "recommendations": recommendations,
-            "is_balanced": balance_score >= 75
-        }
+        return self.check_nutritional_balance_batch([dishes], health_conditions)[0]
     
-    def generate_grocery_list(self, weekly_menu: Dict) -> Dict[str, List[str]]:
-        """Generate grocery list from weekly menu"""
-        grocery_categories = {
-            "vegetables": [],
-            "grains_pulses": [],
-            "dairy_proteins": [],
-            "spices_condiments": [],
-            "others": []
-        }
-        
-        ingredient_mapping = {
-            "Dal": ("grains_pulses", ["Toor Dal", "Moong Dal", "Masoor Dal"]),
-            "Paneer": ("dairy_proteins", ["Paneer", "Milk"]),
-            "Chicken": ("dairy_proteins", ["Chicken"]),
-            "Rice": ("grains_pulses", ["Basmati Rice"]),
-            "Roti": ("grains_pulses", ["Wheat Flour"]),
-            "Bhindi": ("vegetables", ["Bhindi (Okra)"]),
-            "Aloo": ("vegetables", ["Potatoes"]),
-            "Palak": ("vegetables", ["Spinach"]),
-            "Gobi": ("vegetables", ["Cauliflower"]),
-            "Fish": ("dairy_proteins", ["Fresh Fish"]),
-            "Egg": ("dairy_proteins", ["Eggs"]),
-            "Chole": ("grains_pulses", ["Chickpeas"]),
-            "Rajma": ("grains_pulses", ["Kidney Beans"])
-        }
-        
-        all_dishes = []
-        for day_menu in weekly_menu.values():
-            all_dishes.extend(day_menu.values())
-        
-        for dish in all_dishes:
-            for ingredient, (category, items) in ingredient_mapping.items():
-                if ingredient in dish:
-                    grocery_categories[category].extend(items)
-        
-        for category in grocery_categories:
-            grocery_categories[category] = list(set(grocery_categories[category]))
-        
-        return grocery_categories
+    def check_nutritional_balance_batch(self, weeks: List[List[str]], health_conditions: List[str]) -> List[Dict[str, Any]]:
+        """Score many candidate weeks in one vectorized pass"""
+        return nutrition_scorer.score_weeks(weeks, health_conditions)
+    
+    def generate_grocery_list(self, weekly_menu: Dict, servings: int = 1) -> Dict[str, Any]:
+        """Quantified grocery list from the precompiled dish -> ingredient index (no LLM call)"""
+        return grocery.build_grocery_list([grocery.grocery_index.menu_totals(weekly_menu)], servings)
+
+class AgentProgressCallback(BaseCallbackHandler):
+    """Reports agent iterations and tool calls through emit(event, data) while a run is in progress"""
+
+    def __init__(self, emit: Callable[[str, Dict[str, Any]], None]):
+        self.emit = emit
+        self.iteration = 0
+
+    def _llm_started(self):
+        self.iteration += 1
+        self.emit("progress", {"stage": "thinking", "iteration": self.iteration})
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._llm_started()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._llm_started()
+
+    def on_agent_action(self, action, **kwargs):
+        self.emit("progress", {"stage": "tool_call", "iteration": self.iteration, "tool": action.tool, "tool_input": str(action.tool_input)[:200]})
+
+    def on_tool_end(self, output, **kwargs):
+        self.emit("progress", {"stage": "tool_result", "iteration": self.iteration, "output": str(output)[:200]})
+
+class GenerationMetricsCallback(BaseCallbackHandler):
+    """Times the LLM and tool calls of one menu generation and totals its token usage"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.calls = 0
+        self.tokens = 0
+        self._started: Dict[Any, float] = {}
+        self._tools: Dict[Any, tuple] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id=None, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        self._llm_finished(run_id)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        for kind in ("prompt", "completion"):
+            tokens = usage.get(f"{kind}_tokens") or 0
+            if tokens:
+                metrics.LLM_TOKENS.labels(self.mode, kind).inc(tokens)
+                self.tokens += tokens
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs):
+        self._llm_finished(run_id)
+
+    def _llm_finished(self, run_id):
+        self.calls += 1
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            metrics.LLM_CALL_SECONDS.labels(self.mode).observe(time.perf_counter() - started)
+
+    def on_tool_start(self, serialized, input_str, *, run_id=None, **kwargs):
+        self._tools[run_id] = ((serialized or {}).get("name", "unknown"), time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id=None, **kwargs):
+        self._tool_finished(run_id)
+
+    def on_tool_error(self, error, *, run_id=None, **kwargs):
+        self._tool_finished(run_id)
+
+    def _tool_finished(self, run_id):
+        tool = self._tools.pop(run_id, None)
+        if tool is not None:
+            metrics.TOOL_CALL_SECONDS.labels(tool[0]).observe(time.perf_counter() - tool[1])
+
+    def finish(self):
+        metrics.LLM_CALLS_PER_MENU.labels(self.mode).observe(self.calls)
+        metrics.LLM_TOKENS_PER_MENU.labels(self.mode).observe(self.tokens)
+
+class ResilientChatModel(BaseChatModel):
+    """Sends each call through resilience.call_with_deadline: a timeout, an optional
+    hedge to a secondary model, and breaker accounting. Agents and structured
+    mode use it exactly like the client it wraps."""
+
+    primary: BaseChatModel
+    hedge: Optional[BaseChatModel] = None
+    call_timeout: float = resilience.LLM_CALL_TIMEOUT_SECONDS
+    hedge_after: float = resilience.LLM_HEDGE_AFTER_SECONDS
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.primary._llm_type}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        def call(model):
+            return lambda: model._generate(messages, stop=stop, **kwargs)
+        return resilience.call_with_deadline(call(self.primary), self.call_timeout,
+                                             call(self.hedge) if self.hedge else None, self.hedge_after)
+
+    def _combine_llm_outputs(self, llm_outputs):
+        # Keeps the provider's token_usage for GenerationMetricsCallback
+        return self.primary._combine_llm_outputs(llm_outputs)
 
 class IndianMenuAgent:
     """Main agent class for generating Indian meal plans"""
     
-    def __init__(self, together_api_key: str):
+    def __init__(self, together_api_key: str, llm=None, search=None, hedge_llm=None):
+        """llm replaces the Together client, e.g. with a recorded-response model for offline runs;
+        search (anything with .run(query)) replaces DuckDuckGoSearchRun; hedge_llm replaces
+        the LLM_HEDGE_MODEL client"""
         self.together_api_key = together_api_key
-        try:
-            os.environ["TOGETHER_API_KEY"] = together_api_key
-            self.llm = ChatTogether(
-                temperature=0.7,
-                model="meta-llama/Llama-3-8b-chat-hf"
-            )
-        except Exception as e:
-            print(f"Warning: Could not initialize Together AI client: {e}")
-            self.llm = None
+        self.llm = llm
+        self.search = search
+        if self.llm is None:
+            try:
+                os.environ["TOGETHER_API_KEY"] = together_api_key
+                self.llm = self._together_client("meta-llama/Llama-3-8b-chat-hf")
+                if hedge_llm is None and resilience.LLM_HEDGE_MODEL:
+                    hedge_llm = self._together_client(resilience.LLM_HEDGE_MODEL)
+            except Exception as e:
+                print(f"Warning: Could not initialize Together AI client: {e}")
+                self.llm = None
+        if self.llm is not None:
+            self.llm = ResilientChatModel(primary=self.llm, hedge=hedge_llm)
             
         self.tools_handler = MenuGenerationTools()
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True) if self.llm else None
         self.tools = self._create_tools() if self.llm else []
-        self.agent_executor = self._create_agent() if self.llm else None
+        self.agent = self._create_agent() if self.llm else None
+
+    @staticmethod
+    def _together_client(model: str) -> ChatTogether:
+        # Our own deadline (resilience) is the real timeout; this one just frees the HTTP connection
+        return ChatTogether(temperature=0.7, model=model, timeout=resilience.LLM_CALL_TIMEOUT_SECONDS,
+                            max_retries=resilience.LLM_MAX_RETRIES)
+
+    @property
+    def agent_executor(self) -> AgentExecutor:
+        """Fresh executor per run; the LLM client, tools and agent runnable are shared"""
+        return self._create_executor() if self.agent else None
 
     def _parse_get_dishes_input(self, input_str: str) -> str:
         """Parse input for get_dishes_by_criteria to ensure count is an integer"""
@@ -293,16 +219,30 @@ class IndianMenuAgent:
     def _create_tools(self) -> List[Tool]:
         """Create tools for the agent, including new web search tools."""
         
-        search = DuckDuckGoSearchRun()
+        search = self.search or DuckDuckGoSearchRun()
         
+        def summarize(url: str) -> str:
+            loader = WebBaseLoader(url)
+            docs = loader.load()
+            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+            split_docs = text_splitter.split_documents(docs)
+            summarize_chain = load_summarize_chain(self.llm, chain_type="stuff")
+            summary = summarize_chain.run(split_docs)
+            _ingest_web_text(summary, url)
+            return summary
+
+        def search_and_ingest(query: str) -> str:
+            results = search.run(query)
+            _ingest_web_text(results, query)
+            return results
+
+        def search_for_new_dishes(query: str) -> str:
+            _tool_usage.web_searches = getattr(_tool_usage, "web_searches", 0) + 1
+            return web_cache.search_cache.fetch(query, search_and_ingest)
+
         def get_summary(url: str) -> str:
             try:
-                loader = WebBaseLoader(url)
-                docs = loader.load()
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-                split_docs = text_splitter.split_documents(docs)
-                summarize_chain = load_summarize_chain(self.llm, chain_type="stuff")
-                return summarize_chain.run(split_docs)
+                return web_cache.summary_cache.fetch(url, summarize)
             except Exception as e:
                 return f"Error summarizing URL {url}: {e}"
         
@@ -325,7 +265,7 @@ class IndianMenuAgent:
             Tool(
                 name="search_for_new_dishes",
                 description="Searches the web for latest Indian dish ideas, recipes, or trends. Use this tool if the internal database does not return results or if the user requests modern/new dishes. Input should be a specific search query like 'latest Punjabi breakfast dishes' or 'new vegan dinner recipes'.",
-                func=search.run
+                func=search_for_new_dishes
             ),
             Tool(
                 name="summarize_web_content",
@@ -341,8 +281,8 @@ class IndianMenuAgent:
         health_conditions = parts[1].split(",") if len(parts) > 1 and parts[1] else []
         return self.tools_handler.check_nutritional_balance(dishes, health_conditions)
     
-    def _create_agent(self) -> AgentExecutor:
-        """Create the main agent executor"""
+    def _create_agent(self):
+        """Create the ReAct agent runnable shared by every run"""
         
         prompt_template = """
 You are an expert Indian cuisine meal planner. Your goal is to create balanced, diverse, and delicious weekly meal plans.
@@ -381,19 +321,25 @@ Thought: {agent_scratchpad}
             prompt=prompt
         )
         
+        return agent
+
+    def _create_executor(self) -> AgentExecutor:
+        """Create the executor for a single run, with its own conversation memory"""
         return AgentExecutor(
-            agent=agent,
+            agent=self.agent,
             tools=self.tools,
-            memory=self.memory,
+            memory=ConversationBufferMemory(memory_key="chat_history", return_messages=True),
             verbose=True,
             max_iterations=15,
+            max_execution_time=resilience.LLM_RUN_DEADLINE_SECONDS,
             handle_parsing_errors=True
         )
     
-    def generate_weekly_menu(self, preferences: Dict[str, Any]) -> Dict[str, Any]:
+    def generate_weekly_menu(self, preferences: Dict[str, Any], callbacks: Optional[List[BaseCallbackHandler]] = None) -> Dict[str, Any]:
         """Generate a weekly menu based on user preferences"""
         
-        if not self.agent_executor:
+        agent_executor = self.agent_executor
+        if not agent_executor:
             return self._fallback_menu_generation(preferences)
         
         prompt = f"""
@@ -423,8 +369,11 @@ Thought: {agent_scratchpad}
         """
         
         try:
-            response = self.agent_executor.invoke({"input": prompt})
-            return self._parse_agent_response(response["output"], preferences)
+            _tool_usage.web_searches = 0
+            response = agent_executor.invoke({"input": prompt}, config={"callbacks": callbacks} if callbacks else None)
+            menu_result = self._parse_agent_response(response["output"], preferences)
+            menu_result["web_searches"] = _tool_usage.web_searches
+            return menu_result
         except Exception as e:
             print(f"Error in agent execution: {e}")
             return self._fallback_menu_generation(preferences)
@@ -437,9 +386,11 @@ Thought: {agent_scratchpad}
             
             if start_idx != -1 and end_idx != -1:
                 json_str = response[start_idx:end_idx]
-                menu_data = json.loads(json_str)
+                menu_data = _menu_grid(json.loads(json_str))
             else:
                 raise ValueError("No JSON found in response")
+            if not menu_data:
+                raise ValueError("No day-by-meal menu in response")
             
             return {
                 "menu": menu_data,
@@ -451,6 +402,132 @@ Thought: {agent_scratchpad}
             print(f"Error parsing agent response: {e}")
             return self._fallback_menu_generation(preferences)
     
+    def generate_structured_menu(self, preferences: Dict[str, Any], callbacks: Optional[List[BaseCallbackHandler]] = None) -> Dict[str, Any]:
+        """Generate a weekly menu from one JSON-schema LLM call instead of the ReAct loop.
+
+        Candidate dishes are fetched locally and put in the prompt, so the model
+        only has to choose. The reply is checked slot by slot; missing or repeated
+        dishes, catalog dishes outside the user's diet and cuisines, and new dishes
+        whose name says they don't fit the diet (meat for a veg user), are asked
+        for again (at most STRUCTURED_MAX_REPAIRS more calls, listing only those
+        slots, and none after LLM_RUN_DEADLINE_SECONDS). Anything still invalid is
+        filled by the local planner.
+        """
+        if not self.llm:
+            return self._fallback_menu_generation(preferences)
+
+        slots = self.tools_handler.slot_candidates(preferences)
+        meals = list(slots)
+        allowed = {meal: {dish for dish, _ in candidates} for meal, candidates in slots.items()}
+        shortlist = {meal: [dish for dish, _ in sorted(candidates, key=lambda c: c[1], reverse=True)]
+                     for meal, candidates in slots.items()}
+        config = {"callbacks": callbacks} if callbacks else None
+        diet_type = _normalize_key(preferences.get("diet_type") or "")
+        if diet_type not in COMPATIBLE_DIETS:
+            diet_type = "veg"
+
+        menu = {day: {} for day in DAYS}
+        missing = [(day, meal) for day in DAYS for meal in meals]
+        llm_calls = 0
+        deadline = time.monotonic() + resilience.LLM_RUN_DEADLINE_SECONDS
+        while missing and llm_calls <= STRUCTURED_MAX_REPAIRS and time.monotonic() < deadline:
+            prompt, json_schema = self._structured_prompt(preferences, menu, missing, shortlist)
+            llm = self.llm.bind(response_format={"type": "json_object", "schema": json_schema}) if STRUCTURED_JSON_MODE else self.llm
+            try:
+                reply = llm.invoke(prompt, config=config).content
+            except Exception as e:
+                print(f"Error in structured generation: {e}")
+                break
+            llm_calls += 1
+            missing = self._accept_slots(_extract_json(reply), menu, missing, allowed, diet_type)
+
+        llm_slots = len(DAYS) * len(meals) - len(missing)
+        for day, meal in missing:
+            menu[day][meal] = ""
+            menu[day][meal] = menu_planner.replace_slot(menu, day, meal, preferences) or f"Simple {meal.title()}"
+        menu = {day: {meal: menu[day][meal] for meal in meals} for day in DAYS}
+
+        result = {
+            "menu": menu,
+            "preferences_used": preferences,
+            "generated_at": datetime.now().isoformat(),
+            "generation_mode": "structured",
+            "llm_calls": llm_calls,
+            "planner_slots": len(missing)
+        }
+        if not llm_slots:
+            result.update(fallback_used=True, message="Generated using fallback system")
+        MenuResponse(**result)  # raises if the menu doesn't have the response shape
+        return result
+
+    def _structured_prompt(self, preferences: Dict, menu: Dict[str, Dict[str, str]], missing: List[Tuple[str, str]],
+                           shortlist: Dict[str, List[str]]) -> Tuple[str, Dict[str, Any]]:
+        """Prompt and JSON schema asking for the missing (day, meal) slots only"""
+        taken = {dish for meals in menu.values() for dish in meals.values()}
+        wanted: Dict[str, List[str]] = {}
+        for day, meal in missing:
+            wanted.setdefault(day, []).append(meal)
+        json_schema = {
+            "type": "object",
+            "properties": {
+                day: {"type": "object", "properties": {meal: {"type": "string"} for meal in meals}, "required": meals}
+                for day, meals in wanted.items()
+            },
+            "required": list(wanted)
+        }
+        candidates = "\n".join(
+            f"- {meal}: {', '.join([dish for dish in dishes if dish not in taken][:STRUCTURED_CANDIDATES]) or 'none left, suggest one'}"
+            for meal, dishes in shortlist.items() if any(meal in meals for meals in wanted.values())
+        )
+        if taken:
+            task = (f"Part of the week is already planned. Choose dishes for the remaining {len(missing)} slots only.\n"
+                    f"Already in the plan (do not use again): {', '.join(sorted(taken))}")
+        else:
+            task = "Plan every meal from Monday to Sunday."
+
+        prompt = f"""You are an expert Indian cuisine meal planner.
+{task}
+
+Preferences:
+- Diet Type: {preferences.get('diet_type')}
+- Cuisines: {', '.join(preferences.get('cuisine', []))}
+- Cooking Time: {preferences.get('cooking_time')}
+- Health Conditions: {', '.join(preferences.get('health_conditions', [])) or 'none'}
+
+Candidate dishes from our catalog, best fit first:
+{candidates}
+
+Prefer the candidates. A different well-known Indian dish is fine if it suits the diet, cuisines and cooking time.
+No dish may appear more than once in the week, and the week should be nutritionally balanced for the health conditions.
+
+Respond with a single JSON object matching this JSON schema and nothing else:
+{json.dumps(json_schema)}
+"""
+        return prompt, json_schema
+
+    def _accept_slots(self, reply: Optional[Dict[str, Any]], menu: Dict[str, Dict[str, str]],
+                      missing: List[Tuple[str, str]], allowed: Dict[str, set], diet_type: str) -> List[Tuple[str, str]]:
+        """Copy valid dishes from a reply into menu; returns the slots that are still missing"""
+        if not reply:
+            return missing
+        days = {str(day).strip().lower(): meals for day, meals in reply.items() if isinstance(meals, dict)}
+        taken = {dish for meals in menu.values() for dish in meals.values()}
+        still_missing = []
+        for day, meal in missing:
+            meals = {str(m).strip().lower(): dish for m, dish in days.get(day.lower(), {}).items()}
+            dish = meals.get(meal)
+            dish = dish.strip() if isinstance(dish, str) else ""
+            # Known dishes must fit this slot; unknown ones are the model's own suggestions,
+            # kept unless their name puts them outside the diet
+            if dish and dish not in taken and (dish in allowed[meal] or (
+                    DISH_INDEX.attributes(dish) is None
+                    and infer_diet(dish, diet_type) in COMPATIBLE_DIETS[diet_type])):
+                menu[day][meal] = dish
+                taken.add(dish)
+            else:
+                still_missing.append((day, meal))
+        return still_missing
+    
     def _fallback_menu_generation(self, preferences: Dict) -> Dict[str, Any]:
         """Fallback menu generation if agent fails"""
         days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
@@ -462,23 +539,20 @@ Thought: {agent_scratchpad}
         
         used_dishes = set()
         
+        # One shuffled pool per (meal, cuisine), drawn from in cuisine order for the whole week
+        slot_pools = {
+            meal: [random.sample(pool, len(pool)) for pool in (DISH_INDEX.lookup(c, meal, diet_type) for c in cuisines) if pool]
+            for meal in meals
+        }
+        
         for day in days:
             fallback_menu[day] = {}
             for meal in meals:
-                dish_found = False
-                for cuisine in cuisines:
-                    dishes = self.tools_handler.get_dishes_by_criteria(cuisine, meal, diet_type, 20)
-                    # Check if the result is a list and not the "no dishes" string
-                    if isinstance(dishes, list) and dishes:
-                        available_dishes = [dish for dish in dishes if dish not in used_dishes]
-                        if available_dishes:
-                            selected_dish = random.choice(available_dishes)
-                            fallback_menu[day][meal] = selected_dish
-                            used_dishes.add(selected_dish)
-                            dish_found = True
-                            break
-                
-                if not dish_found:
+                selected_dish = next((dish for pool in slot_pools[meal] for dish in pool if dish not in used_dishes), None)
+                if selected_dish:
+                    fallback_menu[day][meal] = selected_dish
+                    used_dishes.add(selected_dish)
+                else:
                     fallback_menu[day][meal] = f"Simple {meal.title()} ({diet_type})"
         
         return {
@@ -487,4 +561,75 @@ Thought: {agent_scratchpad}
             "generated_at": datetime.now().isoformat(),
             "fallback_used": True,
             "message": "Generated using fallback system"
-        }
\ No newline at end of file
+        }
+
+
+# Per-thread count of search_for_new_dishes calls during the current agent run
+_tool_usage = threading.local()
+
+
+def _ingest_web_text(text: str, context: str):
+    """Feed fetched web text to the dish catalog; never fails the tool call"""
+    try:
+        dish_catalog.ingest_text(text, context)
+    except Exception as e:
+        print(f"Warning: dish discovery failed for {context!r}: {e}")
+
+
+def _extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """The JSON object in an LLM reply, tolerating prose or code fences around it"""
+    start, end = text.find('{'), text.rfind('}') + 1
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _menu_grid(data: Any) -> Optional[Dict[str, Dict[str, str]]]:
+    """The {day: {meal: dish}} part of an agent's JSON, or None if it has no such grid.
+
+    Notes the agent adds next to the days (a nutritional analysis, say) and
+    non-text dishes are dropped; a grid nested under another key is unwrapped.
+    """
+    if not isinstance(data, dict):
+        return None
+    days = {day.lower(): day for day in DAYS}
+    grid = {}
+    for key, meals in data.items():
+        day = days.get(str(key).strip().lower())
+        if day and isinstance(meals, dict):
+            dishes = {str(meal).strip().lower(): dish.strip() for meal, dish in meals.items()
+                      if isinstance(dish, str) and dish.strip()}
+            if dishes:
+                grid[day] = dishes
+    if grid:
+        return grid
+    # e.g. {"weekly_menu": {"Monday": {...}}, "nutritional_analysis": "..."}
+    return next((nested for nested in map(_menu_grid, data.values()) if nested), None)
+
+
+_shared_agent = None
+_shared_agent_lock = threading.Lock()
+
+def get_menu_agent(together_api_key: str) -> IndianMenuAgent:
+    """Return the process-wide IndianMenuAgent, building it on first use.
+
+    The LLM client, tools and agent runnable are safe to share between threads;
+    per-run state (executor and memory) is created inside generate_weekly_menu.
+    """
+    global _shared_agent
+    if _shared_agent is None:
+        with _shared_agent_lock:
+            if _shared_agent is None:
+                _shared_agent = IndianMenuAgent(together_api_key=together_api_key)
+    return _shared_agent
+
+def set_menu_agent(agent: Optional[IndianMenuAgent]):
+    """Replace the process-wide agent (offline runs and benchmarks); None rebuilds it on next use"""
+    global _shared_agent
+    with _shared_agent_lock:
+        _shared_agent = agent
+
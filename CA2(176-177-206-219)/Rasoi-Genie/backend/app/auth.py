@@ -1,21 +1,52 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
+from typing import NamedTuple
 import os
+import secrets
 
-from . import models, database
+from . import models, database, crud
+from .cache import TTLCache
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
 
 SECRET_KEY = os.getenv("SECRET_KEY", "fallback-secret")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 120))
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", 60))
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", 10000))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # admin endpoints are disabled when unset
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+class CurrentUser(NamedTuple):
+    """The authenticated principal; a plain value so it can be cached across requests"""
+    id: int
+    username: str
+    email: str
+
+# username -> CurrentUser, so authenticated requests skip the users table lookup
+principal_cache = TTLCache(maxsize=AUTH_CACHE_MAX_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+
+def invalidate_user(*usernames):
+    for username in usernames:
+        if username:
+            principal_cache.delete(username)
+
+@event.listens_for(models.User, "after_update")
+def _user_updated(mapper, connection, target):
+    # Drop both the old and the new username in case it was renamed
+    old_usernames = inspect(target).attrs.username.history.deleted or ()
+    invalidate_user(target.username, *old_usernames)
+
+@event.listens_for(models.User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    invalidate_user(target.username)
+
 def create_access_token(data, expires_delta=None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -36,18 +67,28 @@ def verify_token(token):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_current_user(
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(database.get_db)
-):
+    db: AsyncSession = Depends(database.get_async_db)
+) -> CurrentUser:
     payload = verify_token(token)
     username = payload["sub"]
+    user_id = payload.get("uid")  # absent in tokens issued before it was added
 
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    user = principal_cache.get(username)
+    if user is None or (user_id is not None and user.id != user_id):
+        db_user = await crud.get_user_by_username_async(db, username)
+        if not db_user or (user_id is not None and db_user.id != user_id):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        user = CurrentUser(id=db_user.id, username=db_user.username, email=db_user.email)
+        principal_cache.set(username, user)
     return user
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Guards operator endpoints with the shared ADMIN_TOKEN (X-Admin-Token header)"""
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
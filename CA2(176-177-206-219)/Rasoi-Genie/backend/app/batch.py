@@ -0,0 +1,198 @@
+# batch.py - precompute menus for many users at once (nightly job)
+#
+#     python -m app.batch --mode agent --concurrency 4 --rate-per-minute 30
+#     python -m app.batch --mode local --health diabetes --cuisine gujarati
+#
+# Users are grouped by normalized preferences and one menu is generated per
+# group, so a thousand "veg / north indian / diabetes" users cost one LLM run.
+# Agent-mode generations go through the preference-keyed menu cache, so the
+# batch also warms it for click-time requests. Local-mode runs draw a new seed
+# each run (or take --seed), so every night's batch plans a different week.
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from . import catalog, crud, database, generation
+from .cache import preference_key
+from .ratelimit import TokenBucket
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+BATCH_LLM_RATE_PER_MINUTE = float(os.getenv("BATCH_LLM_RATE_PER_MINUTE", 30))
+BATCH_WRITE_CHUNK = int(os.getenv("BATCH_WRITE_CHUNK", 1000))
+
+
+class PreferenceGroup:
+    """Users whose preferences normalize to the same cache key"""
+
+    def __init__(self, key: str, preferences: Dict[str, Any]):
+        self.key = key
+        self.preferences = preferences  # the first member's, used for generation
+        self.members: Dict[int, Dict[str, Any]] = {}
+
+
+class BatchReport:
+    """Progress counters, safe to read from another thread while the batch runs"""
+
+    def __init__(self, mode: str, seed: int):
+        self.mode = mode
+        self.seed = seed
+        self.status = "loading"
+        self.users = 0
+        self.groups = 0
+        self.groups_done = 0
+        self.groups_failed = 0
+        self.fallback_used = 0
+        self.menus_written = 0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed or (time.monotonic() - self.started)
+        remaining = self.groups - self.groups_done - self.groups_failed
+        groups_per_second = (self.groups_done + self.groups_failed) / elapsed if elapsed else 0.0
+        return {
+            "mode": self.mode,
+            "seed": self.seed,
+            "status": self.status,
+            "users": self.users,
+            "groups": self.groups,
+            "groups_done": self.groups_done,
+            "groups_failed": self.groups_failed,
+            "fallback_used": self.fallback_used,
+            "menus_written": self.menus_written,
+            "elapsed_seconds": round(elapsed, 2),
+            "groups_per_second": round(groups_per_second, 3),
+            "menus_per_second": round(self.menus_written / elapsed, 2) if elapsed else 0.0,
+            "eta_seconds": round(remaining / groups_per_second, 1) if groups_per_second and remaining else None
+        }
+
+
+def group_users(user_preferences) -> List[PreferenceGroup]:
+    groups: Dict[str, PreferenceGroup] = {}
+    interned: Dict[str, Dict[str, Any]] = {}  # users with identical dicts share one object
+    for user_id, preferences in user_preferences:
+        preferences = interned.setdefault(json.dumps(preferences, sort_keys=True), preferences)
+        key = preference_key(preferences, namespace="batch")
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = PreferenceGroup(key, preferences)
+        group.members[user_id] = preferences
+    # Biggest cohorts first, so most users have a fresh menu early in the run
+    return sorted(groups.values(), key=lambda g: len(g.members), reverse=True)
+
+
+def group_seed(run_seed: int, group: PreferenceGroup) -> int:
+    """Local planner seed for one group in a run; the same run_seed reproduces the run"""
+    return int(hashlib.sha256(f"{run_seed}:{group.key}".encode()).hexdigest()[:16], 16)
+
+
+def precompute_menus(mode: Optional[str] = None, user_ids: Optional[Sequence[int]] = None,
+                     concurrency: int = BATCH_CONCURRENCY, rate_per_minute: float = BATCH_LLM_RATE_PER_MINUTE,
+                     force_fresh: bool = False, write_chunk: int = BATCH_WRITE_CHUNK, seed: Optional[int] = None,
+                     on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Generate and store a new active menu for every user with preferences (or just user_ids).
+
+    At most `concurrency` groups are generated at once and LLM calls are paced
+    to `rate_per_minute` (0 = unlimited). Results are written from this thread
+    as groups finish. seed only affects local mode: each group is planned with
+    a seed derived from it (random per run if unset). Returns the final report.
+    """
+    mode = generation.resolve_mode(mode)
+    report = BatchReport(mode, random.getrandbits(32) if seed is None else seed)
+    limiter = TokenBucket(rate_per_minute / 60.0, capacity=max(1, concurrency))
+
+    def progress():
+        if on_progress:
+            on_progress(report.to_dict())
+
+    db = database.SessionLocal()
+    try:
+        groups = group_users(crud.iter_preferences(db, user_ids))
+        report.users = sum(len(group.members) for group in groups)
+        report.groups = len(groups)
+        report.status = "running"
+        progress()
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="menu-batch") as pool:
+            futures = {pool.submit(generation.generate_menu, group.preferences, mode, force_fresh, None, limiter,
+                                   group_seed(report.seed, group)): group
+                       for group in groups}
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    menu_result = future.result()
+                    report.menus_written += crud.save_weekly_menus(db, group.members, menu_result, write_chunk)
+                    report.groups_done += 1
+                    report.fallback_used += bool(menu_result.get("fallback_used"))
+                except Exception as e:
+                    db.rollback()
+                    print(f"Error precomputing menus for {len(group.members)} users: {e}")
+                    report.groups_failed += 1
+                progress()
+
+        report.status = "completed"
+    except Exception:
+        report.status = "failed"
+        raise
+    finally:
+        db.close()
+        report.elapsed = time.monotonic() - report.started
+        progress()
+    return report.to_dict()
+
+
+def _print_progress(min_interval: float = 2.0):
+    last = [0.0]
+    lock = threading.Lock()
+
+    def on_progress(state: Dict[str, Any]):
+        with lock:
+            if state["status"] == "running" and time.monotonic() - last[0] < min_interval:
+                return
+            last[0] = time.monotonic()
+        finished = state["groups_done"] + state["groups_failed"]
+        print(f"[{state['status']}] groups {finished}/{state['groups']} ({state['groups_failed']} failed), "
+              f"menus {state['menus_written']}/{state['users']}, {state['menus_per_second']} menus/s, "
+              f"{state['groups_per_second']} groups/s, elapsed {state['elapsed_seconds']}s"
+              + (f", eta {state['eta_seconds']}s" if state["eta_seconds"] else ""))
+    return on_progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute weekly menus for all users with preferences")
+    parser.add_argument("--mode", choices=generation.GENERATION_MODES, default=None,
+                        help=f"default: {generation.DEFAULT_GENERATION_MODE} (MENU_GENERATION_MODE)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--rate-per-minute", type=float, default=BATCH_LLM_RATE_PER_MINUTE,
+                        help="LLM calls per minute across all workers, 0 for unlimited")
+    parser.add_argument("--force-fresh", action="store_true", help="skip the menu cache")
+    parser.add_argument("--seed", type=int, default=None, help="local mode: repeat the run that reported this seed")
+    parser.add_argument("--diet", default=None, help="only users with this diet type")
+    parser.add_argument("--cuisine", action="append", default=[], help="only users with this cuisine (repeatable)")
+    parser.add_argument("--health", action="append", default=[], help="only users with this health condition (repeatable)")
+    args = parser.parse_args()
+
+    catalog.dish_catalog.load()
+    user_ids = None
+    if args.diet or args.cuisine or args.health:
+        db = database.SessionLocal()
+        try:
+            user_ids = crud.find_users_by_preferences(db, diet_type=args.diet, cuisine=args.cuisine,
+                                                      health_conditions=args.health)
+        finally:
+            db.close()
+
+    report = precompute_menus(mode=args.mode, user_ids=user_ids, concurrency=args.concurrency,
+                              rate_per_minute=args.rate_per_minute, force_fresh=args.force_fresh, seed=args.seed,
+                              on_progress=_print_progress())
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
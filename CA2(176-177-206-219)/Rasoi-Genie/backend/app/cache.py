@@ -0,0 +1,222 @@
+# cache.py - in-process TTL/LRU cache and the preference-keyed menu cache
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, Optional
+
+MENU_CACHE_TTL_SECONDS = int(os.getenv("MENU_CACHE_TTL_SECONDS", 6 * 60 * 60))
+MENU_CACHE_MAX_ENTRIES = int(os.getenv("MENU_CACHE_MAX_ENTRIES", 1024))
+MENU_CACHE_REDIS_URL = os.getenv("MENU_CACHE_REDIS_URL")
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    A ttl or maxsize of 0 disables the cache (every get is a miss).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether key holds an unexpired entry, without counting a hit or miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def normalize_preferences(preferences: Dict[str, Any]) -> Dict[str, Any]:
+    """Canonical form of a preference dict: trimmed, lower-cased, list order ignored"""
+    def clean_list(values):
+        return sorted({str(v).strip().lower() for v in (values or []) if str(v).strip()})
+
+    return {
+        "diet_type": str(preferences.get("diet_type") or "").strip().lower(),
+        "cuisine": clean_list(preferences.get("cuisine")),
+        "meals": clean_list(preferences.get("meals")),
+        "cooking_time": str(preferences.get("cooking_time") or "").strip().lower(),
+        "health_conditions": clean_list(preferences.get("health_conditions"))
+    }
+
+
+def preference_key(preferences: Dict[str, Any], namespace: str = "menu") -> str:
+    """Stable cache key for a preference dict"""
+    canonical = json.dumps(normalize_preferences(preferences), sort_keys=True, separators=(",", ":"))
+    return f"{namespace}:{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+
+class RedisBackend:
+    """Shared cache tier so all replicas reuse each other's menus"""
+
+    def __init__(self, url: str, ttl: int):
+        import redis  # only needed when MENU_CACHE_REDIS_URL is set
+
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        self.client.setex(key, self.ttl, json.dumps(value))
+
+    def exists(self, key: str) -> bool:
+        return bool(self.client.exists(key))
+
+
+class MenuCache:
+    """Cache of generated menus keyed by normalized preferences.
+
+    Lookups hit the local LRU first, then the optional Redis tier. Every hit is
+    a full agent run (and its LLM spend) saved.
+    """
+
+    def __init__(self, ttl: int, maxsize: int, redis_url: Optional[str] = None):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared = None
+        self.shared_hits = 0
+        self.shared_errors = 0
+        self.bypassed = 0
+        if redis_url and ttl > 0:
+            try:
+                self.shared = RedisBackend(redis_url, ttl)
+            except Exception as e:
+                print(f"Warning: Could not initialize Redis menu cache: {e}")
+
+    def get(self, preferences: Dict[str, Any], namespace: str = "menu") -> Optional[Dict[str, Any]]:
+        key = preference_key(preferences, namespace)
+        result = self.local.get(key)
+        if result is None and self.shared is not None:
+            try:
+                result = self.shared.get(key)
+            except Exception as e:
+                self.shared_errors += 1
+                print(f"Warning: Redis menu cache read failed: {e}")
+            if result is not None:
+                self.shared_hits += 1
+                self.local.set(key, result)
+        if result is None:
+            return None
+
+        # Hand out a copy stamped with the time it was served
+        result = copy.deepcopy(result)
+        result["generated_at"] = datetime.now().isoformat()
+        result["cache_hit"] = True
+        return result
+
+    def contains(self, preferences: Dict[str, Any], namespace: str = "menu") -> bool:
+        """Whether get() would probably hit, without counting it in the stats"""
+        key = preference_key(preferences, namespace)
+        if key in self.local:
+            return True
+        if self.shared is not None:
+            try:
+                return self.shared.exists(key)
+            except Exception as e:
+                self.shared_errors += 1
+                print(f"Warning: Redis menu cache read failed: {e}")
+        return False
+
+    def set(self, preferences: Dict[str, Any], result: Dict[str, Any], namespace: str = "menu"):
+        key = preference_key(preferences, namespace)
+        value = copy.deepcopy(result)
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value)
+            except Exception as e:
+                self.shared_errors += 1
+                print(f"Warning: Redis menu cache write failed: {e}")
+
+    def record_bypass(self):
+        """Count a request that skipped the cache with force_fresh"""
+        self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        local = self.local.stats()
+        hits = local["hits"]
+        lookups = local["hits"] + local["misses"]
+        misses = lookups - hits - self.shared_hits
+        return {
+            **local,
+            "misses": misses,
+            "hits": hits + self.shared_hits,
+            "hit_ratio": round((hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            "local_hits": hits,
+            "shared_hits": self.shared_hits,
+            "shared_backend": "redis" if self.shared is not None else None,
+            "shared_errors": self.shared_errors,
+            "bypassed": self.bypassed,
+            "agent_runs_saved": hits + self.shared_hits
+        }
+
+
+menu_cache = MenuCache(
+    ttl=MENU_CACHE_TTL_SECONDS,
+    maxsize=MENU_CACHE_MAX_ENTRIES,
+    redis_url=MENU_CACHE_REDIS_URL
+)
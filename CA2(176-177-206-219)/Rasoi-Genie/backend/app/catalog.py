@@ -0,0 +1,274 @@
+# catalog.py - grows the dish catalog from agent menus and web search results
+#
+# IndianMenuDatabase is the seed. Dishes the agent puts in a menu, and dish
+# names found in search_for_new_dishes / summarize_web_content text, are
+# normalized, deduplicated against everything already known, tagged with the
+# cuisine, meal and diet they were found for (plus NUTRITIONAL_BALANCE bits),
+# and stored as dish_slots rows. Eligible slots are added to DISH_INDEX at
+# startup and as they are ingested, so get_dishes_by_criteria and the planner
+# offer them without another search.
+#
+# Dishes from agent menus are used straight away; names scraped from web text
+# only once they have been seen DISCOVERED_WEB_MIN_SIGHTINGS times.
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import crud, database
+from .dishes import DISH_INDEX, DishIndex, IndianMenuDatabase
+from .nutrition import dish_features
+from .planner import _normalize_key
+
+DISH_DISCOVERY_ENABLED = os.getenv("DISH_DISCOVERY_ENABLED", "true").lower() in ("1", "true", "yes")
+DISCOVERED_WEB_MIN_SIGHTINGS = int(os.getenv("DISCOVERED_WEB_MIN_SIGHTINGS", 2))
+MAX_DISHES_PER_TEXT = 40
+
+CUISINES = tuple(IndianMenuDatabase.DISHES)
+MEALS = ("breakfast", "lunch", "dinner", "snacks")
+
+# Words in a query, URL or dish name that place it in a cuisine / meal
+CUISINE_KEYWORDS = {
+    "north_indian": ("north indian", "mughlai", "awadhi", "kashmiri", "delhi", "lucknowi", "rajasthani"),
+    "south_indian": ("south indian", "kerala", "tamil", "chettinad", "andhra", "udupi", "karnataka", "hyderabadi"),
+    "gujarati": ("gujarati", "kathiyawadi", "surti"),
+    "marathi": ("marathi", "maharashtrian", "kolhapuri", "malvani", "puneri"),
+    "bengali": ("bengali", "kolkata", "bangla"),
+    "punjabi": ("punjabi", "amritsari"),
+}
+MEAL_KEYWORDS = {
+    "breakfast": ("breakfast", "nashta", "tiffin"),
+    "lunch": ("lunch",),
+    "dinner": ("dinner", "supper"),
+    "snacks": ("snack", "chaat", "tea time", "tea-time", "evening"),
+}
+NON_VEG_WORDS = ("chicken", "mutton", "fish", "egg", "keema", "prawn", "lamb", "meat", "gosht", "murgh",
+                 "machher", "maach", "jhinga", "shrimp", "crab", "hilsa", "ilish", "bhetki", "pomfret")
+DAIRY_WORDS = ("paneer", "ghee", "butter", "makhani", "malai", "dahi", "curd", "raita", "lassi", "kheer",
+               "cheese", "milk", "cream", "rabdi", "basundi", "shrikhand", "khoa", "mawa")
+
+# A phrase only counts as a dish if it has one of these words: every word of
+# the seed catalog's names, plus common dish words it doesn't use yet
+GENERIC_WORDS = {"simple", "plain", "mix", "mixed", "veg", "vegetable", "stuffed", "roasted", "da"}
+EXTRA_DISH_WORDS = {
+    "pulao", "pulav", "korma", "kofta", "chilla", "cheela", "appam", "pongal", "puttu", "bisibele", "bath",
+    "thoran", "avial", "kootu", "poriyal", "kurma", "handvo", "muthia", "khaman", "dabeli", "bhaji", "usal",
+    "amti", "kosha", "jhol", "dalna", "shukto", "chorchori", "bharta", "tikki", "kathi", "tandoori", "tehri",
+    "litti", "chokha", "nihari", "haleem", "rogan", "payasam", "ladoo", "sheera", "halwa", "kulfi", "sabzi",
+    "sabji", "bhurji", "paniyaram", "adai", "pesarattu", "akki", "neer", "kozhukattai", "thalipith", "pohe",
+    "khichu", "dhansak", "paya", "kadai", "dum", "pitha", "ghugni", "rasgulla", "sandesh", "chapati", "bhakri",
+}
+# Leading / trailing words that describe rather than name a dish
+FILLER_WORDS = {"best", "easy", "top", "popular", "healthy", "quick", "traditional", "authentic", "homemade",
+                "famous", "classic", "simple", "delicious", "new", "latest", "modern", "trending", "indian",
+                "recipe", "recipes", "dish", "dishes", "ideas", "menu", "the", "a", "an", "how", "to", "make",
+                "breakfast", "lunch", "dinner", "snack", "snacks", "veg", "vegan", "vegetarian", "style"}
+CONNECTORS = {"da", "di", "ka", "ki", "ke", "ni", "nu", "aur", "and", "with", "&", "+"}
+
+# "and" / "&" usually separate list items in web text, so they end a phrase
+_PHRASE = re.compile(r"[A-Z][A-Za-z']+(?:\s+(?:[A-Z][A-Za-z']+|da|di|ka|ki|ke|ni|nu|with|\+))*")
+
+
+def _dish_words() -> set:
+    words = {word.lower() for dish in DISH_INDEX.dishes for word in re.findall(r"[A-Za-z]+", dish)}
+    return (words - GENERIC_WORDS) | EXTRA_DISH_WORDS
+
+
+def dish_key(name: str) -> str:
+    """Normalized name used for deduplication: case, spacing and punctuation ignored"""
+    name = name.casefold().replace("&", " and ")
+    return " ".join(re.sub(r"[^\w+ ]", " ", name).split())
+
+
+def display_name(name: str) -> str:
+    """Title Case the words of a dish name, leaving connectors ("da", "with", "+") alone"""
+    words = name.split()
+    return " ".join(word if word.lower() in CONNECTORS else word[:1].upper() + word[1:] for word in words)
+
+
+def _keyword_match(text: str, keywords: Dict[str, tuple]) -> Optional[str]:
+    text = text.lower().replace("-", " ").replace("_", " ").replace("/", " ")
+    return next((value for value, words in keywords.items() if any(word in text for word in words)), None)
+
+
+# Whole words (optionally plural), so "Veggie" isn't an egg dish
+_NON_VEG = re.compile(rf"\b(?:{'|'.join(NON_VEG_WORDS)})s?\b", re.IGNORECASE)
+_DAIRY = re.compile(rf"\b(?:{'|'.join(DAIRY_WORDS)})s?\b", re.IGNORECASE)
+
+
+def infer_diet(name: str, context_diet: Optional[str] = None) -> str:
+    """Diet slot for a dish: meat or fish in the name wins; vegan only if the context asked for it and no dairy"""
+    if _NON_VEG.search(name):
+        return "non_veg"
+    if context_diet == "vegan" and not _DAIRY.search(name):
+        return "vegan"
+    return "veg"
+
+
+def _context_diet(context: str) -> Optional[str]:
+    context = context.lower().replace("-", " ").replace("_", " ")
+    if "vegan" in context:
+        return "vegan"
+    if "non veg" in context or "nonveg" in context or _NON_VEG.search(context):
+        return "non_veg"
+    if "veg" in context:
+        return "veg"
+    return None
+
+
+class DishCatalog:
+    """Extracts, tags and ingests discovered dishes into the DB and the shared DishIndex"""
+
+    def __init__(self, index: DishIndex, web_min_sightings: int = DISCOVERED_WEB_MIN_SIGHTINGS):
+        self.index = index
+        self.web_min_sightings = web_min_sightings
+        self._known = {dish_key(dish): dish for dish in index.dishes}
+        self._dish_words = _dish_words()
+        self._lock = threading.Lock()
+        self.menus_ingested = 0
+        self.texts_ingested = 0
+        self.sightings = 0
+        self.dishes_added = 0
+        self.errors = 0
+        self.agent_runs = 0
+        self.agent_runs_with_search = 0
+
+    # --- extraction -----------------------------------------------------------
+
+    def extract_dish_names(self, text: str) -> List[str]:
+        """Dish-like Title Case phrases in free text, deduplicated, in order of appearance"""
+        found = {}
+        for match in _PHRASE.finditer(text or ""):
+            words = match.group(0).split()
+            while words and (words[0].lower() in FILLER_WORDS or words[0].lower() in CONNECTORS):
+                words.pop(0)
+            while words and (words[-1].lower() in FILLER_WORDS or words[-1].lower() in CONNECTORS):
+                words.pop()
+            if not 1 <= len(words) <= 5 or not any(word.lower().strip("'") in self._dish_words for word in words):
+                continue
+            name = self._known.get(dish_key(" ".join(words))) or display_name(" ".join(words))
+            found.setdefault(dish_key(name), name)
+            if len(found) >= MAX_DISHES_PER_TEXT:
+                break
+        return list(found.values())
+
+    def sightings_from_text(self, text: str, context: str = "") -> List[crud.DishSighting]:
+        """(name, cuisine, meal, diet) for dishes in search or summary text; context is the query or URL.
+
+        The meal comes from the context, the cuisine from the dish name or the
+        context; names that can't be placed in a slot are skipped.
+        """
+        meal = _keyword_match(context, MEAL_KEYWORDS)
+        if meal is None:
+            return []
+        context_cuisine = _keyword_match(context, CUISINE_KEYWORDS)
+        context_diet = _context_diet(context)
+        sightings = []
+        for name in self.extract_dish_names(text):
+            cuisine = _keyword_match(name, CUISINE_KEYWORDS) or context_cuisine
+            if cuisine:
+                sightings.append((name, cuisine, meal, infer_diet(name, context_diet)))
+        return sightings
+
+    def sightings_from_menu(self, menu: Dict[str, Dict[str, str]], preferences: Dict[str, Any]) -> List[crud.DishSighting]:
+        """Slots for dishes an agent menu used that the catalog doesn't know yet"""
+        cuisines = [c for c in (_normalize_key(c) for c in preferences.get("cuisine") or []) if c in CUISINES]
+        diet = _normalize_key(preferences.get("diet_type") or "")
+        sightings = []
+        for meals in menu.values():
+            if not isinstance(meals, dict):  # e.g. a "nutritional_analysis" note next to the days
+                continue
+            for meal, dish in meals.items():
+                meal = _normalize_key(meal)
+                if not isinstance(dish, str) or meal not in MEALS or dish_key(dish) in self._known:
+                    continue
+                # The agent was asked for all the user's cuisines at once; only tag one we can tell
+                cuisine = _keyword_match(dish, CUISINE_KEYWORDS) or (cuisines[0] if len(cuisines) == 1 else None)
+                if cuisine and dish.strip():
+                    sightings.append((display_name(" ".join(dish.split())), cuisine, meal, infer_diet(dish, diet)))
+        return sightings
+
+    # --- ingestion ------------------------------------------------------------
+
+    def ingest(self, sightings: Iterable[crud.DishSighting], source: str) -> int:
+        """Record sightings and add newly eligible slots to the index; returns the number added"""
+        # Skip slots the index already has (seed dishes, or earlier discoveries)
+        sightings = [s for s in sightings if s[0] not in self.index.lookup(s[1], s[2], s[3])]
+        if not sightings or not DISH_DISCOVERY_ENABLED:
+            return 0
+        masks = {name: dish_features(name) for name, *_ in sightings}
+        db = database.SessionLocal()
+        try:
+            eligible = crud.record_dish_sightings(db, sightings, source, masks, self.web_min_sightings)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self.errors += 1
+            print(f"Warning: could not store discovered dishes: {e}")
+            return 0
+        finally:
+            db.close()
+        added = self._add(eligible)
+        with self._lock:
+            self.sightings += len(sightings)
+        return added
+
+    def ingest_menu(self, menu: Dict[str, Dict[str, str]], preferences: Dict[str, Any]) -> int:
+        with self._lock:
+            self.menus_ingested += 1
+        return self.ingest(self.sightings_from_menu(menu, preferences), source="agent")
+
+    def ingest_text(self, text: str, context: str = "") -> int:
+        with self._lock:
+            self.texts_ingested += 1
+        return self.ingest(self.sightings_from_text(text, context), source="web")
+
+    def _add(self, slots: Iterable[crud.DishSighting]) -> int:
+        added = 0
+        for name, cuisine, meal, diet in slots:
+            if self.index.add(name, cuisine, meal, diet):
+                added += 1
+                with self._lock:
+                    self._known.setdefault(dish_key(name), name)
+        with self._lock:
+            self.dishes_added += added
+        return added
+
+    def load(self) -> int:
+        """Add every eligible stored slot to the index (at startup)"""
+        db = database.SessionLocal()
+        try:
+            return self._add(crud.discovered_dish_slots(db, self.web_min_sightings))
+        except Exception as e:
+            print(f"Warning: could not load discovered dishes (run `python -m migrations`?): {e}")
+            return 0
+        finally:
+            db.close()
+
+    # --- reporting ------------------------------------------------------------
+
+    def record_agent_run(self, web_searches: int):
+        """Count an agent run, and whether it still needed a web search"""
+        with self._lock:
+            self.agent_runs += 1
+            self.agent_runs_with_search += bool(web_searches)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": DISH_DISCOVERY_ENABLED,
+                "catalog_dishes": len(self.index.dishes),
+                "discovered_dishes_added": self.dishes_added,
+                "menus_ingested": self.menus_ingested,
+                "texts_ingested": self.texts_ingested,
+                "sightings": self.sightings,
+                "errors": self.errors,
+                "web_min_sightings": self.web_min_sightings,
+                "agent_runs": self.agent_runs,
+                "agent_runs_with_web_search": self.agent_runs_with_search,
+                "web_search_share": round(self.agent_runs_with_search / self.agent_runs, 4) if self.agent_runs else 0.0
+            }
+
+
+dish_catalog = DishCatalog(DISH_INDEX)
@@ -0,0 +1,671 @@
+# crud.py - shared DB helpers used by the API routes and background jobs
+#
+# Statements are built once and executed either on a sync Session (job
+# workers, batch runs, migrations) or on an AsyncSession (API routes); the
+# *_async variants mirror the sync functions one to one.
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import grocery, menu_codec, models
+from .cache import TTLCache
+
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", 10000))
+
+
+# --- users -------------------------------------------------------------------
+
+def _user_by_username(username: str):
+    return select(models.User).where(models.User.username == username)
+
+
+def _user_by_email(email: str):
+    return select(models.User).where(models.User.email == email)
+
+
+def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
+    return db.scalars(_user_by_username(username)).first()
+
+
+async def get_user_by_username_async(db: AsyncSession, username: str) -> Optional[models.User]:
+    return (await db.scalars(_user_by_username(username))).first()
+
+
+def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
+    return db.scalars(_user_by_email(email)).first()
+
+
+async def get_user_by_email_async(db: AsyncSession, email: str) -> Optional[models.User]:
+    return (await db.scalars(_user_by_email(email))).first()
+
+
+def create_user(db: Session, username: str, email: str, hashed_password: str) -> models.User:
+    db_user = models.User(username=username, email=email, hashed_password=hashed_password)
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
+async def create_user_async(db: AsyncSession, username: str, email: str, hashed_password: str) -> models.User:
+    db_user = models.User(username=username, email=email, hashed_password=hashed_password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+def update_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+
+
+async def update_password_hash_async(db: AsyncSession, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    await db.commit()
+
+
+# --- preferences -------------------------------------------------------------
+
+def _preference_for(user_id: int):
+    return select(models.Preference).where(models.Preference.user_id == user_id)
+
+
+def _clean_values(values) -> List[str]:
+    return list(dict.fromkeys(v.strip() for v in values or [] if v and v.strip()))
+
+
+def preferences_to_dict(pref: models.Preference) -> Dict[str, Any]:
+    """A stored Preference in the shape the menu agent expects"""
+    return {
+        "diet_type": pref.diet_type,
+        "cuisine": pref.cuisine,
+        "meals": pref.meals,
+        "cooking_time": pref.cooking_time,
+        "health_conditions": pref.health_conditions
+    }
+
+
+def get_preference(db: Session, user_id: int) -> Optional[models.Preference]:
+    return db.scalars(_preference_for(user_id)).first()
+
+
+async def get_preference_async(db: AsyncSession, user_id: int) -> Optional[models.Preference]:
+    return (await db.scalars(_preference_for(user_id))).first()
+
+
+def get_preferences_dict(db: Session, user_id: int) -> Optional[Dict[str, Any]]:
+    pref = get_preference(db, user_id)
+    return preferences_to_dict(pref) if pref else None
+
+
+async def get_preferences_dict_async(db: AsyncSession, user_id: int) -> Optional[Dict[str, Any]]:
+    pref = await get_preference_async(db, user_id)
+    return preferences_to_dict(pref) if pref else None
+
+
+def _apply_preferences(existing: Optional[models.Preference], user_id: int, pref) -> Optional[models.Preference]:
+    """Update existing in place, or return a new row to add"""
+    row = existing or models.Preference(user_id=user_id)
+    row.diet_type = pref.diet_type
+    row.cooking_time = pref.cooking_time
+
+    # Keep rows for values that stay so the unique (preference, category, value) key
+    # isn't hit by an insert flushed before the matching delete
+    current = {(item.category, item.value): item for item in row.items}
+    items = []
+    for category in models.PreferenceItem.CATEGORIES:
+        for position, value in enumerate(_clean_values(getattr(pref, category))):
+            item = current.get((category, value)) or models.PreferenceItem(category=category, value=value)
+            item.position = position
+            items.append(item)
+    row.items = items
+    return None if existing else row
+
+
+def save_preferences(db: Session, user_id: int, pref):
+    new_pref = _apply_preferences(get_preference(db, user_id), user_id, pref)
+    if new_pref:
+        db.add(new_pref)
+    db.commit()
+
+
+async def save_preferences_async(db: AsyncSession, user_id: int, pref):
+    new_pref = _apply_preferences(await get_preference_async(db, user_id), user_id, pref)
+    if new_pref:
+        db.add(new_pref)
+    await db.commit()
+
+
+def _preference_pages(db: Session, user_ids: Optional[Sequence[int]], batch_size: int):
+    if user_ids is not None:
+        user_ids = sorted(set(user_ids))
+        for start in range(0, len(user_ids), batch_size):
+            chunk = user_ids[start:start + batch_size]
+            yield db.scalars(select(models.Preference).where(models.Preference.user_id.in_(chunk))).all()
+        return
+
+    last_id = 0
+    while True:
+        page = db.scalars(select(models.Preference)
+                          .where(models.Preference.id > last_id)
+                          .order_by(models.Preference.id)
+                          .limit(batch_size)).all()
+        if not page:
+            return
+        yield page
+        last_id = page[-1].id
+
+
+def iter_preferences(db: Session, user_ids: Optional[Sequence[int]] = None, batch_size: int = 1000):
+    """(user_id, preferences dict) for every user with preferences (or just user_ids), read in pages"""
+    for page in _preference_pages(db, user_ids, batch_size):
+        for pref in page:
+            yield pref.user_id, preferences_to_dict(pref)
+        db.expunge_all()
+
+
+# Cohort queries for batch precomputation and cache warming. Each wanted value is
+# an index range scan on preference_items (category, value, preference_id).
+
+def _spellings(value: str) -> List[str]:
+    # Stored as the frontend sent it ("north-indian"); callers may use catalog keys ("north_indian")
+    value = value.strip()
+    return list({value, value.replace("_", "-"), value.replace("-", "_")})
+
+
+def _cohort(diet_type: Optional[str], cuisine, meals, health_conditions):
+    query = select(models.Preference.user_id)
+    if diet_type:
+        query = query.where(models.Preference.diet_type.in_(_spellings(diet_type)))
+    for category, wanted in (("cuisine", cuisine), ("meals", meals), ("health_conditions", health_conditions)):
+        for value in _clean_values(wanted):
+            query = query.where(models.Preference.id.in_(
+                select(models.PreferenceItem.preference_id)
+                .where(models.PreferenceItem.category == category, models.PreferenceItem.value.in_(_spellings(value)))
+            ))
+    return query.order_by(models.Preference.user_id)
+
+
+def find_users_by_preferences(db: Session, diet_type: Optional[str] = None, cuisine=(), meals=(),
+                              health_conditions=()) -> List[int]:
+    """Ids of users whose preferences include every given value, e.g. health_conditions=["diabetes"], cuisine=["gujarati"]"""
+    return list(db.scalars(_cohort(diet_type, cuisine, meals, health_conditions)))
+
+
+async def find_users_by_preferences_async(db: AsyncSession, diet_type: Optional[str] = None, cuisine=(), meals=(),
+                                          health_conditions=()) -> List[int]:
+    return list(await db.scalars(_cohort(diet_type, cuisine, meals, health_conditions)))
+
+
+# --- dish catalog and preference snapshots ------------------------------------
+# Stored menus reference both by id. Rows are only ever added, so the mappings
+# are cached for the life of the process; ids a transaction inserts itself are
+# kept on its session and only cached once it commits.
+
+_dish_ids: Dict[str, int] = {}
+_dish_names: Dict[int, str] = {}
+_dish_lock = threading.Lock()
+
+# digest -> snapshot id, and snapshot id -> canonical JSON
+_snapshot_ids = TTLCache(maxsize=SNAPSHOT_CACHE_SIZE, ttl=24 * 60 * 60)
+_snapshot_data = TTLCache(maxsize=SNAPSHOT_CACHE_SIZE, ttl=24 * 60 * 60)
+
+
+def _pending(db: Session) -> Dict[str, Dict]:
+    return db.info.setdefault("catalog_pending", {"dishes": {}, "snapshots": {}})
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed_catalog(session):
+    pending = session.info.pop("catalog_pending", None)
+    if pending:
+        dishes = pending["dishes"]
+        _remember_dishes([row for row in dishes.values()], {name: dish_id for name, (dish_id, _) in dishes.items()})
+        for digest, (snapshot_id, data) in pending["snapshots"].items():
+            _remember_snapshot(digest, snapshot_id, data)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_uncommitted_catalog(session):
+    session.info.pop("catalog_pending", None)
+
+
+def _insert_new(db: Session, table, rows: List[Dict[str, Any]]):
+    """Insert rows keyed by a unique column, skipping any another worker added first"""
+    try:
+        with db.begin_nested():
+            db.execute(table.insert(), rows)
+    except IntegrityError:
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(table.insert(), [row])
+            except IntegrityError:
+                pass
+
+
+def _remember_dishes(rows, ids_by_name: Dict[str, int]):
+    with _dish_lock:
+        _dish_names.update(rows)
+        _dish_ids.update(ids_by_name)
+
+
+def _select_dishes(db: Session, names: List[str]):
+    """(id, name) rows for the names, and which id each requested name resolved to"""
+    rows = db.execute(select(models.Dish.id, models.Dish.name).where(models.Dish.name.in_(names))).all()
+    exact = {name: dish_id for dish_id, name in rows}
+    # A case-insensitive collation (MySQL) matches "dal tadka" to a stored "Dal Tadka"
+    folded = {name.strip().casefold(): dish_id for dish_id, name in rows}
+    matched = {name: exact.get(name) or folded.get(name.strip().casefold()) for name in names}
+    return rows, {name: dish_id for name, dish_id in matched.items() if dish_id is not None}
+
+
+def fits_dish_table(name: str) -> bool:
+    return len(name) <= models.DISH_NAME_MAX_LENGTH
+
+
+def dish_ids_for(db: Session, names: Sequence[str]) -> Dict[str, int]:
+    """Catalog id of every dish name, adding unknown dishes to the dishes table"""
+    too_long = [name for name in names if not fits_dish_table(name)]
+    if too_long:
+        raise ValueError(f"Dish name longer than {models.DISH_NAME_MAX_LENGTH} characters: {too_long[0][:60]}...")
+    pending = _pending(db)["dishes"]
+    ids = {name: _dish_ids.get(name) or pending.get(name, (None,))[0] for name in names}
+    missing = [name for name, dish_id in ids.items() if dish_id is None]
+    if missing:
+        rows, found = _select_dishes(db, missing)
+        _remember_dishes(rows, found)
+        ids.update(found)
+        new = [name for name in missing if name not in found]
+        if new:
+            _insert_new(db, models.Dish.__table__, [{"name": name} for name in new])
+            rows, inserted = _select_dishes(db, new)
+            names_by_id = dict(rows)
+            _pending(db)["dishes"].update((name, (dish_id, names_by_id[dish_id])) for name, dish_id in inserted.items())
+            ids.update(inserted)
+    return {name: ids[name] for name in names}
+
+
+def dish_names_for(db: Session, ids: Iterable[int]) -> Dict[int, str]:
+    ids = list(ids)
+    missing = [dish_id for dish_id in ids if dish_id not in _dish_names]
+    if missing:
+        rows = db.execute(select(models.Dish.id, models.Dish.name).where(models.Dish.id.in_(missing))).all()
+        with _dish_lock:
+            _dish_names.update(rows)
+    return {dish_id: _dish_names[dish_id] for dish_id in ids}
+
+
+def _remember_snapshot(digest: str, snapshot_id: int, data: str):
+    _snapshot_ids.set(digest, snapshot_id)
+    _snapshot_data.set(snapshot_id, data)
+
+
+def snapshot_id_for(db: Session, preferences: Dict[str, Any]) -> int:
+    """Id of the preference_snapshots row holding exactly these preferences"""
+    data = json.dumps(preferences, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(data.encode()).hexdigest()
+    pending = _pending(db)["snapshots"]
+    snapshot_id = _snapshot_ids.get(digest) or pending.get(digest, (None,))[0]
+    if snapshot_id is None:
+        lookup = select(models.PreferenceSnapshot.id).where(models.PreferenceSnapshot.digest == digest)
+        snapshot_id = db.scalar(lookup)
+        if snapshot_id is not None:
+            _remember_snapshot(digest, snapshot_id, data)
+        else:
+            _insert_new(db, models.PreferenceSnapshot.__table__, [{"digest": digest, "data": data}])
+            snapshot_id = db.scalar(lookup)
+            _pending(db)["snapshots"][digest] = (snapshot_id, data)
+    return snapshot_id
+
+
+def snapshot_data(db: Session, snapshot_id: int) -> Dict[str, Any]:
+    data = _snapshot_data.get(snapshot_id)
+    if data is None:
+        data = db.scalar(select(models.PreferenceSnapshot.data).where(models.PreferenceSnapshot.id == snapshot_id))
+        _snapshot_data.set(snapshot_id, data)
+    return json.loads(data)  # a fresh dict per caller
+
+
+# --- discovered dishes --------------------------------------------------------
+# Dishes the agent or web search turned up, placed in (cuisine, meal, diet)
+# slots. A slot is served once an agent menu used it, or once web text has
+# mentioned it web_min_sightings times.
+
+DishSighting = Tuple[str, str, str, str]  # (name, cuisine, meal, diet)
+
+
+def _eligible_slots(web_min_sightings: int):
+    slots = models.DishSlot
+    return (select(models.Dish.name, slots.cuisine, slots.meal, slots.diet)
+            .join(models.Dish, models.Dish.id == slots.dish_id)
+            .where((slots.source == "agent") | (slots.sightings >= web_min_sightings)))
+
+
+def record_dish_sightings(db: Session, sightings: Sequence[DishSighting], source: str,
+                          nutrition_masks: Dict[str, int], web_min_sightings: int) -> List[DishSighting]:
+    """Count one sighting per slot; returns the slots among them that are now eligible"""
+    # Overlong "names" are scraped sentences, not dishes
+    sightings = [sighting for sighting in dict.fromkeys(sightings) if fits_dish_table(sighting[0])]
+    if not sightings:
+        return []
+    ids = dish_ids_for(db, list(dict.fromkeys(name for name, *_ in sightings)))
+    dish_ids = set(ids.values())
+    now = datetime.now().isoformat()
+    table = models.DishSlot.__table__
+
+    existing = set(db.execute(select(table.c.dish_id, table.c.cuisine, table.c.meal, table.c.diet)
+                              .where(table.c.dish_id.in_(dish_ids))).all())
+    new = [{"dish_id": ids[name], "cuisine": cuisine, "meal": meal, "diet": diet, "source": source,
+            "sightings": 0, "first_seen": now}
+           for name, cuisine, meal, diet in sightings if (ids[name], cuisine, meal, diet) not in existing]
+    if new:
+        _insert_new(db, table, new)
+
+    # Increment in SQL so concurrent workers don't lose counts
+    values = {"sightings": table.c.sightings + 1, "last_seen": now}
+    if source == "agent":
+        values["source"] = "agent"
+    db.execute(
+        table.update().where(table.c.dish_id == bindparam("b_dish_id"), table.c.cuisine == bindparam("b_cuisine"),
+                             table.c.meal == bindparam("b_meal"), table.c.diet == bindparam("b_diet")).values(**values),
+        [{"b_dish_id": ids[name], "b_cuisine": cuisine, "b_meal": meal, "b_diet": diet} for name, cuisine, meal, diet in sightings]
+    )
+    dishes = models.Dish.__table__
+    masks = [{"b_id": ids[name], "b_mask": mask} for name, mask in nutrition_masks.items() if name in ids]
+    if masks:
+        db.execute(dishes.update().where(dishes.c.id == bindparam("b_id"), dishes.c.nutrition_mask.is_(None))
+                   .values(nutrition_mask=bindparam("b_mask")), masks)
+    return [tuple(row) for row in db.execute(_eligible_slots(web_min_sightings).where(models.DishSlot.dish_id.in_(dish_ids)))]
+
+
+def discovered_dish_slots(db: Session, web_min_sightings: int) -> List[DishSighting]:
+    return [tuple(row) for row in db.execute(_eligible_slots(web_min_sightings))]
+
+
+# --- weekly menus ------------------------------------------------------------
+
+def build_menu_preview(menu: Any) -> Dict[str, List[str]]:
+    """Day -> dish names, the shape MenuHistoryItem.menu_preview expects.
+
+    Non-grid menus are tolerated like grocery._menu_dishes does: a day may hold
+    a list of dishes, and anything else (e.g. an analysis string) is left out.
+    """
+    if not isinstance(menu, dict):
+        return {}
+    preview = {}
+    for day, meals in menu.items():
+        dishes = meals.values() if isinstance(meals, dict) else meals if isinstance(meals, list) else None
+        if dishes is not None:
+            preview[str(day)] = [dish for dish in dishes if isinstance(dish, str)]
+    return preview
+
+
+def _deactivate_menus(user_id: int):
+    return (update(models.WeeklyMenu)
+            .where(models.WeeklyMenu.user_id == user_id, models.WeeklyMenu.is_active == 1)
+            .values(is_active=0))
+
+
+def is_encodable_menu(menu: Any) -> bool:
+    """A {day: {meal: dish}} grid whose dish names all fit the dishes table"""
+    return menu_codec.is_encodable(menu) and all(fits_dish_table(name) for name in menu_codec.dish_names(menu))
+
+
+def _menu_columns(db: Session, menu: Any) -> Dict[str, Any]:
+    """Storage columns for a menu; the snapshot and user columns are set by the caller"""
+    grocery_data = json.dumps(grocery.grocery_index.menu_totals(menu))
+    if is_encodable_menu(menu):
+        # History previews are decoded from the blob, so no separate preview column
+        return {"menu_blob": menu_codec.encode_menu(menu, dish_ids_for(db, menu_codec.dish_names(menu))),
+                "menu_data": None, "menu_preview": None, "grocery_data": grocery_data}
+    # Not a {day: {meal: dish}} grid (or a dish name too long for the dishes table); keep it verbatim
+    return {"menu_blob": None, "menu_data": json.dumps(menu), "menu_preview": json.dumps(build_menu_preview(menu)),
+            "grocery_data": grocery_data}
+
+
+def _new_weekly_menu(db: Session, user_id: int, menu_result: Dict[str, Any]) -> models.WeeklyMenu:
+    return models.WeeklyMenu(
+        user_id=user_id,
+        snapshot_id=snapshot_id_for(db, menu_result["preferences_used"]),
+        created_at=menu_result["generated_at"],
+        is_active=1,
+        **_menu_columns(db, menu_result["menu"])
+    )
+
+
+def save_weekly_menu(db: Session, user_id: int, menu_result: Dict[str, Any]) -> models.WeeklyMenu:
+    """Persist a generated menu as the user's active WeeklyMenu"""
+    db.execute(_deactivate_menus(user_id))
+    new_menu = _new_weekly_menu(db, user_id, menu_result)
+    db.add(new_menu)
+    db.commit()
+    db.refresh(new_menu)
+    return new_menu
+
+
+async def save_weekly_menu_async(db: AsyncSession, user_id: int, menu_result: Dict[str, Any]) -> models.WeeklyMenu:
+    await db.execute(_deactivate_menus(user_id))
+    new_menu = await db.run_sync(_new_weekly_menu, user_id, menu_result)
+    db.add(new_menu)
+    await db.commit()
+    await db.refresh(new_menu)
+    return new_menu
+
+
+def save_weekly_menus(db: Session, user_preferences: Dict[int, Dict[str, Any]], menu_result: Dict[str, Any],
+                      chunk_size: int = 1000) -> int:
+    """Persist one generated menu as the active menu of many users.
+
+    The menu is encoded once; each chunk of users is one set-based deactivate
+    and one multi-row insert, committed together. preferences_used is each
+    user's own preferences. Returns the number of rows written.
+    """
+    columns = _menu_columns(db, menu_result["menu"])
+    user_ids = list(user_preferences)
+    table = models.WeeklyMenu.__table__
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        rows = [{
+            "user_id": user_id,
+            "snapshot_id": snapshot_id_for(db, user_preferences[user_id]),
+            "created_at": menu_result["generated_at"],
+            "is_active": 1,
+            "generation_prompt": None,
+            **columns
+        } for user_id in chunk]
+        db.execute(update(models.WeeklyMenu)
+                   .where(models.WeeklyMenu.user_id.in_(chunk), models.WeeklyMenu.is_active == 1)
+                   .values(is_active=0))
+        db.execute(insert(table), rows)
+        db.commit()
+    return len(user_ids)
+
+
+def _user_menu(user_id: int, menu_id: int):
+    return select(models.WeeklyMenu).where(models.WeeklyMenu.id == menu_id, models.WeeklyMenu.user_id == user_id)
+
+
+def _active_menu(user_id: int):
+    return (select(models.WeeklyMenu)
+            .where(models.WeeklyMenu.user_id == user_id, models.WeeklyMenu.is_active == 1)
+            .order_by(models.WeeklyMenu.id.desc()))
+
+
+def get_user_menu(db: Session, user_id: int, menu_id: int) -> Optional[models.WeeklyMenu]:
+    return db.scalars(_user_menu(user_id, menu_id)).first()
+
+
+async def get_user_menu_async(db: AsyncSession, user_id: int, menu_id: int) -> Optional[models.WeeklyMenu]:
+    return (await db.scalars(_user_menu(user_id, menu_id))).first()
+
+
+def get_active_menu(db: Session, user_id: int) -> Optional[models.WeeklyMenu]:
+    return db.scalars(_active_menu(user_id)).first()
+
+
+async def get_active_menu_async(db: AsyncSession, user_id: int) -> Optional[models.WeeklyMenu]:
+    return (await db.scalars(_active_menu(user_id))).first()
+
+
+def load_menu(db: Session, menu: models.WeeklyMenu) -> Dict[str, Any]:
+    """Decode a stored WeeklyMenu (compact or legacy JSON columns) into the menu result shape"""
+    if menu.menu_blob is not None:
+        menu_dict = menu_codec.decode_menu(menu.menu_blob, lambda ids: dish_names_for(db, ids))
+    else:
+        menu_dict = json.loads(menu.menu_data)
+
+    if menu.snapshot_id is not None:
+        preferences = snapshot_data(db, menu.snapshot_id)
+    else:
+        preferences = json.loads(menu.generation_prompt) if menu.generation_prompt else {}
+
+    return {
+        "menu": menu_dict,
+        "preferences_used": preferences,
+        "generated_at": menu.created_at
+    }
+
+
+async def load_menu_async(db: AsyncSession, menu: models.WeeklyMenu) -> Dict[str, Any]:
+    return await db.run_sync(load_menu, menu)
+
+
+# History reads the small preview columns only: menu_preview on JSON-era rows,
+# menu_blob (a few dozen bytes of dish ids) on compact ones
+
+def _history_page(user_id: int, limit: int, before_id: Optional[int]):
+    query = select(
+        models.WeeklyMenu.id,
+        models.WeeklyMenu.created_at,
+        models.WeeklyMenu.is_active,
+        models.WeeklyMenu.menu_preview,
+        models.WeeklyMenu.menu_blob
+    ).where(models.WeeklyMenu.user_id == user_id)
+    if before_id is not None:
+        query = query.where(models.WeeklyMenu.id < before_id)
+    return query.order_by(models.WeeklyMenu.id.desc()).limit(limit + 1)
+
+
+def _preview_from_json(data: Optional[str]) -> Dict[str, List[str]]:
+    """A stored preview or legacy menu_data as {day: [dish]}; {} if unreadable, so one bad row can't fail a page"""
+    try:
+        return build_menu_preview(json.loads(data)) if data else {}
+    except ValueError:
+        return {}
+
+
+def _legacy_previews(db: Session, rows) -> Dict[int, Dict[str, List[str]]]:
+    # Rows written before the preview column existed fall back to menu_data
+    legacy_ids = [row.id for row in rows if row.menu_preview is None and row.menu_blob is None]
+    if not legacy_ids:
+        return {}
+    legacy = db.execute(select(models.WeeklyMenu.id, models.WeeklyMenu.menu_data).where(models.WeeklyMenu.id.in_(legacy_ids)))
+    return {menu_id: _preview_from_json(menu_data) for menu_id, menu_data in legacy}
+
+
+def _history_result(db: Session, rows, limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    legacy_previews = _legacy_previews(db, rows)
+    grids = {row.id: menu_codec.decode_ids(row.menu_blob) for row in rows
+             if row.menu_preview is None and row.menu_blob is not None}
+    names = dish_names_for(db, {dish_id for _, _, ids in grids.values() for dish_id in ids if dish_id != menu_codec.NO_DISH})
+
+    items = []
+    for row in rows:
+        if row.id in grids:
+            preview = menu_codec.preview_from_ids(*grids[row.id], names)
+        elif row.menu_preview is not None:
+            preview = _preview_from_json(row.menu_preview)
+        else:
+            preview = legacy_previews[row.id]
+        items.append({
+            "id": row.id,
+            "generated_at": row.created_at,
+            "is_active": bool(row.is_active),
+            "menu_preview": preview
+        })
+    return items, (rows[-1].id if has_more else None)
+
+
+def get_menu_history(db: Session, user_id: int, limit: int, before_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """One page of a user's menus, newest first, plus the cursor for the next page"""
+    rows = db.execute(_history_page(user_id, limit, before_id)).all()
+    return _history_result(db, rows, limit)
+
+
+async def get_menu_history_async(db: AsyncSession, user_id: int, limit: int, before_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    rows = (await db.execute(_history_page(user_id, limit, before_id))).all()
+    return await db.run_sync(_history_result, rows, limit)
+
+
+# --- grocery lists -------------------------------------------------------------
+# Per-serving totals are stored with each menu when it is saved. Rows saved
+# before grocery_data existed, or under older ingredient rules, are computed
+# on first request and written back.
+
+def _stored_grocery_totals(user_id: int, menu_ids: Sequence[int]):
+    return select(models.WeeklyMenu.id, models.WeeklyMenu.grocery_data).where(
+        models.WeeklyMenu.user_id == user_id, models.WeeklyMenu.id.in_(menu_ids))
+
+
+def _refresh_grocery_totals(db: Session, menu_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    totals = {menu.id: grocery.grocery_index.menu_totals(load_menu(db, menu)["menu"])
+              for menu in db.scalars(select(models.WeeklyMenu).where(models.WeeklyMenu.id.in_(menu_ids)))}
+    table = models.WeeklyMenu.__table__
+    db.execute(table.update().where(table.c.id == bindparam("b_id")).values(grocery_data=bindparam("b_data")),
+               [{"b_id": menu_id, "b_data": json.dumps(data)} for menu_id, data in totals.items()])
+    db.commit()
+    return totals
+
+
+def _grocery_totals_result(db: Session, user_id: int, menu_ids: List[int], found: Dict[int, Dict[str, Any]],
+                           rows) -> Optional[List[Dict[str, Any]]]:
+    stale = []
+    for menu_id, data in rows:
+        totals = json.loads(data) if data else None
+        if totals is None or not grocery.is_current(totals):
+            stale.append(menu_id)
+        else:
+            found[menu_id] = totals
+    if stale:
+        found.update(_refresh_grocery_totals(db, stale))
+    for menu_id, _ in rows:
+        grocery.totals_cache.set((user_id, menu_id), found[menu_id])
+    if len(found) < len(menu_ids):
+        return None
+    return [found[menu_id] for menu_id in menu_ids]
+
+
+def _cached_grocery_totals(user_id: int, menu_ids: List[int]) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+    found = {}
+    for menu_id in menu_ids:
+        totals = grocery.totals_cache.get((user_id, menu_id))
+        if totals is not None:
+            found[menu_id] = totals
+    return found, [menu_id for menu_id in menu_ids if menu_id not in found]
+
+
+def get_grocery_totals(db: Session, user_id: int, menu_ids: Sequence[int]) -> Optional[List[Dict[str, Any]]]:
+    """Stored grocery totals of the user's menus in menu_ids order, or None if any of them isn't theirs"""
+    menu_ids = list(dict.fromkeys(menu_ids))
+    found, missing = _cached_grocery_totals(user_id, menu_ids)
+    rows = db.execute(_stored_grocery_totals(user_id, missing)).all() if missing else []
+    return _grocery_totals_result(db, user_id, menu_ids, found, rows)
+
+
+async def get_grocery_totals_async(db: AsyncSession, user_id: int, menu_ids: Sequence[int]) -> Optional[List[Dict[str, Any]]]:
+    menu_ids = list(dict.fromkeys(menu_ids))
+    found, missing = _cached_grocery_totals(user_id, menu_ids)
+    rows = (await db.execute(_stored_grocery_totals(user_id, missing))).all() if missing else []
+    return await db.run_sync(_grocery_totals_result, user_id, menu_ids, found, rows)
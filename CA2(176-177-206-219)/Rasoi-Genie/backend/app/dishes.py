@@ -0,0 +1,222 @@
+# dishes.py - built-in dish catalog and the in-memory index over it
+#
+# Kept free of LangChain so the planner, nutrition scoring, dish discovery and
+# the API can use the catalog without importing the agent stack (agents.py).
+import threading
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+class IndianMenuDatabase:
+    """Simulated database of Indian dishes - replace with actual DB queries later"""
+    
+    DISHES = {
+        "north_indian": {
+            "breakfast": {
+                "veg": ["Aloo Paratha", "Chole Bhature", "Poha", "Upma", "Idli Sambhar", "Masala Dosa"],
+                "non_veg": ["Egg Paratha", "Keema Paratha", "Chicken Sandwich"],
+                "vegan": ["Poha", "Upma", "Vegetable Dalia", "Ragi Dosa"]
+            },
+            "lunch": {
+                "veg": ["Dal Tadka + Roti", "Rajma + Rice", "Chole + Rice", "Palak Paneer + Roti", 
+                       "Bhindi Masala + Roti", "Aloo Gobi + Roti", "Mix Veg + Roti"],
+                "non_veg": ["Chicken Curry + Rice", "Mutton Curry + Roti", "Fish Curry + Rice"],
+                "vegan": ["Dal Tadka + Roti", "Chana Masala + Rice", "Vegetable Curry + Roti"]
+            },
+            "dinner": {
+                "veg": ["Paneer Butter Masala + Roti", "Dal Makhani + Rice", "Stuffed Paratha + Raita"],
+                "non_veg": ["Butter Chicken + Naan", "Lamb Biryani", "Fish Fry + Rice"],
+                "vegan": ["Mixed Dal + Roti", "Vegetable Biryani", "Stuffed Roti + Pickle"]
+            },
+            "snacks": {
+                "veg": ["Samosa", "Pakora", "Dhokla", "Kachori", "Sandwich"],
+                "non_veg": ["Chicken Tikka", "Seekh Kebab", "Egg Roll"],
+                "vegan": ["Bhel Puri", "Roasted Chana", "Fruit Chaat"]
+            }
+        },
+        "south_indian": {
+            "breakfast": {
+                "veg": ["Idli Sambhar", "Masala Dosa", "Uttapam", "Rava Upma", "Medu Vada"],
+                "non_veg": ["Egg Dosa", "Chicken 65"],
+                "vegan": ["Plain Dosa", "Coconut Rice", "Lemon Rice"]
+            },
+            "lunch": {
+                "veg": ["Sambhar Rice", "Rasam Rice", "Curd Rice", "Vegetable Curry + Rice"],
+                "non_veg": ["Fish Curry + Rice", "Chicken Curry + Rice", "Mutton Biryani"],
+                "vegan": ["Sambhar Rice", "Tamarind Rice", "Coconut Chutney + Rice"]
+            },
+            "dinner": {
+                "veg": ["Paneer Masala + Rice", "Mixed Vegetable Curry + Rice"],
+                "non_veg": ["Chicken Biryani", "Fish Fry + Rice"],
+                "vegan": ["Vegetable Biryani", "Dal Rice"]
+            },
+            "snacks": {
+                "veg": ["Murukku", "Banana Chips", "Coconut Laddu"],
+                "non_veg": ["Chicken 65", "Fish Fry"],
+                "vegan": ["Roasted Groundnuts", "Coconut Barfi"]
+            }
+        },
+        "gujarati": {
+            "breakfast": {
+                "veg": ["Dhokla", "Khandvi", "Thepla", "Fafda Jalebi", "Poha"],
+                "vegan": ["Plain Thepla", "Dhokla", "Khakhra"]
+            },
+            "lunch": {
+                "veg": ["Dal Dhokli", "Undhiyu", "Gujarati Kadhi + Rice", "Bhindi Shaak + Rotli"],
+                "vegan": ["Mixed Dal + Rotli", "Vegetable Curry + Rice"]
+            },
+            "dinner": {
+                "veg": ["Gujarati Thali", "Khichdi Kadhi", "Stuffed Paratha"],
+                "vegan": ["Simple Khichdi", "Vegetable Curry + Rotli"]
+            },
+            "snacks": {
+                "veg": ["Dhokla", "Kachori", "Chakri", "Sev Mamra"],
+                "vegan": ["Khakhra", "Roasted Chana"]
+            }
+        },
+        "marathi": {
+            "breakfast": {
+                "veg": ["Poha", "Upma", "Misal Pav", "Sabudana Khichdi", "Thalipeeth"],
+                "non_veg": ["Chicken Vada Pav", "Egg Curry"], # Added some non-veg options for demonstration
+                "vegan": ["Poha", "Upma", "Sabudana Khichdi"]
+            },
+            "lunch": {
+                "veg": ["Dal Rice", "Bharleli Vangi", "Alu Vadi", "Zunka Bhakar"],
+                "non_veg": ["Mutton Curry", "Chicken Thali"], # Added non-veg options
+                "vegan": ["Dal Rice", "Vegetable Curry + Rice"]
+            },
+            "dinner": {
+                "veg": ["Puran Poli", "Bhakri + Pitla", "Vegetable Curry + Rice"],
+                "non_veg": ["Chicken Biryani", "Fish Fry"], # Added non-veg options
+                "vegan": ["Simple Dal + Rice", "Vegetable Curry + Bhakri"]
+            },
+            "snacks": {
+                "veg": ["Vada Pav", "Bhel Puri", "Kothimbir Vadi"],
+                "non_veg": ["Chicken Kothimbir Vadi"], # Added non-veg options
+                "vegan": ["Bhel Puri", "Roasted Chana"]
+            }
+        },
+        "bengali": {
+            "breakfast": {
+                "veg": ["Luchi Aloo Dum", "Poha", "Cholar Dal + Luchi"],
+                "non_veg": ["Fish Curry + Rice", "Egg Curry + Luchi"],
+                "vegan": ["Poha", "Aloo Dum + Rice"]
+            },
+            "lunch": {
+                "veg": ["Dal Rice", "Aloo Posto", "Begun Bhaja + Rice"],
+                "non_veg": ["Fish Curry + Rice", "Chicken Curry + Rice", "Prawn Malai Curry"],
+                "vegan": ["Dal Rice", "Aloo Posto + Rice"]
+            },
+            "dinner": {
+                "veg": ["Khichuri", "Mixed Vegetable + Rice"],
+                "non_veg": ["Fish Curry + Rice", "Mutton Curry + Rice"],
+                "vegan": ["Simple Khichuri", "Dal Rice"]
+            },
+            "snacks": {
+                "veg": ["Jhal Muri", "Beguni", "Ghugni"],
+                "non_veg": ["Fish Fry", "Chicken Cutlet"],
+                "vegan": ["Jhal Muri", "Roasted Chana"]
+            }
+        },
+        "punjabi": {
+            "breakfast": {
+                "veg": ["Chole Bhature", "Aloo Paratha", "Sarson da Saag + Makki Roti"],
+                "non_veg": ["Keema Paratha", "Egg Paratha"],
+                "vegan": ["Plain Paratha", "Sarson da Saag + Makki Roti"]
+            },
+            "lunch": {
+                "veg": ["Dal Makhani + Naan", "Rajma + Rice", "Palak Paneer + Roti"],
+                "non_veg": ["Butter Chicken + Naan", "Mutton Curry + Rice"],
+                "vegan": ["Chana Masala + Rice", "Mixed Dal + Roti"]
+            },
+            "dinner": {
+                "veg": ["Paneer Tikka Masala + Naan", "Dal Tadka + Rice"],
+                "non_veg": ["Chicken Tikka Masala + Naan", "Lamb Curry + Rice"],
+                "vegan": ["Mixed Vegetable + Roti", "Dal Rice"]
+            },
+            "snacks": {
+                "veg": ["Samosa", "Pakora", "Kulcha"],
+                "non_veg": ["Chicken Tikka", "Seekh Kebab"],
+                "vegan": ["Chana Chaat", "Fruit Chaat"]
+            }
+        }
+    }
+    
+    NUTRITIONAL_BALANCE = {
+        "high_protein": ["Dal", "Paneer", "Chicken", "Fish", "Egg", "Chana", "Rajma"],
+        "high_fiber": ["Bhindi", "Palak", "Mixed Veg", "Salad", "Gobi", "Begun"],
+        "low_oil": ["Steamed", "Boiled", "Grilled", "Idli", "Upma"],
+        "diabetic_friendly": ["Dal", "Vegetables", "Grilled items", "Salad", "Upma", "Poha"]
+    }
+
+class DishAttributes(NamedTuple):
+    cuisines: FrozenSet[str]
+    meals: FrozenSet[str]
+    diets: FrozenSet[str]
+
+class DishIndex:
+    """Inverted index over IndianMenuDatabase.DISHES, built once at import.
+
+    Lookups return immutable tuples so callers can share them without copying.
+    Discovered dishes are added at runtime (see catalog.py); each add swaps in
+    new tuples and drops the memoized pools.
+    """
+
+    MAX_MEMOIZED_POOLS = 4096
+
+    def __init__(self, dishes: Dict[str, Dict[str, Dict[str, List[str]]]]):
+        slots = {}
+        attributes = {}
+        for cuisine, meals in dishes.items():
+            for meal_type, diets in meals.items():
+                for diet_type, names in diets.items():
+                    slots[(cuisine, meal_type, diet_type)] = tuple(dict.fromkeys(names))
+                    for name in names:
+                        attrs = attributes.setdefault(name, (set(), set(), set()))
+                        attrs[0].add(cuisine)
+                        attrs[1].add(meal_type)
+                        attrs[2].add(diet_type)
+
+        self._slots: Dict[Tuple[str, str, str], Tuple[str, ...]] = slots
+        self._attributes: Dict[str, DishAttributes] = {
+            name: DishAttributes(frozenset(c), frozenset(m), frozenset(d)) for name, (c, m, d) in attributes.items()
+        }
+        self._pools: Dict[Tuple[Tuple[str, ...], str, str], Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, cuisine: str, meal_type: str, diet_type: str) -> Tuple[str, ...]:
+        """Dishes for a single (cuisine, meal, diet) slot"""
+        return self._slots.get((cuisine, meal_type, diet_type), ())
+
+    def pool(self, cuisines: Tuple[str, ...], meal_type: str, diet_type: str) -> Tuple[str, ...]:
+        """Deduplicated dishes across several cuisines, in cuisine order (memoized)"""
+        key = (cuisines, meal_type, diet_type)
+        pools = self._pools  # if add() swaps the memo meanwhile, this result lands in the old one
+        pool = pools.get(key)
+        if pool is None:
+            pool = tuple(dict.fromkeys(dish for c in cuisines for dish in self.lookup(c, meal_type, diet_type)))
+            # Tool input comes from the LLM, so don't let arbitrary keys grow the memo forever
+            if len(pools) < self.MAX_MEMOIZED_POOLS:
+                pools[key] = pool
+        return pool
+
+    def add(self, dish: str, cuisine: str, meal_type: str, diet_type: str) -> bool:
+        """Place a dish in a slot; False if it was already there"""
+        with self._lock:
+            key = (cuisine, meal_type, diet_type)
+            slot = self._slots.get(key, ())
+            if dish in slot:
+                return False
+            self._slots[key] = slot + (dish,)
+            attrs = self._attributes.get(dish) or DishAttributes(frozenset(), frozenset(), frozenset())
+            self._attributes[dish] = DishAttributes(attrs.cuisines | {cuisine}, attrs.meals | {meal_type}, attrs.diets | {diet_type})
+            self._pools = {}
+            return True
+
+    def attributes(self, dish: str) -> Optional[DishAttributes]:
+        """Cuisines, meals and diets a dish appears under, or None if unknown"""
+        return self._attributes.get(dish)
+
+    @property
+    def dishes(self) -> Tuple[str, ...]:
+        return tuple(self._attributes)
+
+DISH_INDEX = DishIndex(IndianMenuDatabase.DISHES)
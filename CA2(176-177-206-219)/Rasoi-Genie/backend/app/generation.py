@@ -0,0 +1,158 @@
+# generation.py - chooses how a menu is produced and caches the expensive paths
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from . import admission, cache, catalog, metrics, resilience
+from .planner import menu_planner
+from .ratelimit import TokenBucket
+
+# "local": constraint planner over IndianMenuDatabase, no LLM round-trip
+# "agent": ReAct agent with web search, for discovering new dishes
+# "structured": one JSON-schema LLM call over a local shortlist, re-asking only for invalid slots
+GENERATION_MODES = ("local", "agent", "structured")
+DEFAULT_GENERATION_MODE = os.getenv("MENU_GENERATION_MODE", "agent")
+# Load the agent stack in the background after startup (off: on the first LLM generation)
+AGENT_WARMUP = os.getenv("AGENT_WARMUP", "true").lower() in ("1", "true", "yes")
+
+
+class AgentLoader:
+    """Imports the LangChain agent stack (app.agents) and builds the shared agent, once.
+
+    Importing LangChain takes seconds, so the API starts without it: warm_up()
+    does it on a background thread after startup, and the first LLM generation
+    waits for it if that hasn't finished yet. Local mode never needs it.
+    """
+
+    def __init__(self):
+        self.state = "not_loaded"  # -> loading -> ready | failed
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._agents = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def load(self):
+        """The agents module, with its shared agent built"""
+        if self._agents is None:
+            with self._lock:
+                if self._agents is None:
+                    self.state = "loading"
+                    start = time.perf_counter()
+                    try:
+                        from . import agents  # the slow import this class exists to defer
+                        agents.get_menu_agent(os.getenv("TOGETHER_API_KEY"))
+                    except Exception as e:
+                        self.state, self.error = "failed", str(e)
+                        raise
+                    self.load_seconds = round(time.perf_counter() - start, 3)
+                    self._agents, self.state, self.error = agents, "ready", None
+        return self._agents
+
+    def warm_up(self) -> threading.Thread:
+        def run():
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Warning: agent warmup failed, will retry on first LLM request: {e}")
+
+        thread = threading.Thread(target=run, name="agent-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "load_seconds": self.load_seconds, "error": self.error}
+
+
+agent_loader = AgentLoader()
+
+
+def resolve_mode(mode: Optional[str]) -> str:
+    mode = mode or DEFAULT_GENERATION_MODE
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown generation mode '{mode}', expected one of {', '.join(GENERATION_MODES)}")
+    return mode
+
+
+def _emit_slots(emit: Callable[[str, Dict[str, Any]], None], menu: Dict[str, Dict[str, str]]):
+    for day, meals in menu.items():
+        for meal, dish in meals.items():
+            emit("slot", {"day": day, "meal": meal, "dish": dish})
+
+
+def generate_menu(preferences: Dict[str, Any], mode: Optional[str] = None, force_fresh: bool = False,
+                  emit: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                  limiter: Optional[TokenBucket] = None, seed: Optional[int] = None) -> Dict[str, Any]:
+    """Produce a weekly menu result dict for the given preferences.
+
+    emit(event, data), when given, receives "progress" events while the menu is
+    being produced and a "slot" event per (day, meal) as soon as it is known.
+    limiter, when given, is acquired once per LLM call the generation makes
+    (cache hits and local plans don't consume tokens). seed picks the week a
+    local plan produces (default: fixed per preferences, random with
+    force_fresh). While resilience.llm_breaker is open, LLM modes are planned
+    locally instead (and not cached).
+    """
+    mode = resolve_mode(mode)
+    start = time.perf_counter()
+    if emit:
+        emit("progress", {"stage": "started", "mode": mode})
+
+    if mode == "local":
+        # Deterministic per preferences; force_fresh asks for a different week
+        if seed is None and force_fresh:
+            seed = random.getrandbits(64)
+        on_slot = (lambda day, meal, dish: emit("slot", {"day": day, "meal": meal, "dish": dish})) if emit else None
+        menu_result = menu_planner.plan(preferences, seed=seed, on_slot=on_slot)
+        metrics.record_generation(mode, "local", time.perf_counter() - start)
+        return menu_result
+
+    menu_result = None
+    outcome = "cache_hit"
+    if force_fresh:
+        cache.menu_cache.record_bypass()
+    else:
+        menu_result = cache.menu_cache.get(preferences, namespace=mode)
+        if menu_result is not None:
+            menu_result["preferences_used"] = preferences
+
+    if menu_result is None and not resilience.llm_breaker.allow():
+        # The provider is failing or slow right now; a local plan beats waiting for the fallback
+        menu_result = menu_planner.plan(preferences, seed=random.getrandbits(64) if force_fresh else None)
+        menu_result["message"] = "Generated locally while the menu assistant is unavailable"
+        outcome = "breaker_open"
+        if emit:
+            emit("progress", {"stage": "breaker_open"})
+    elif menu_result is None:
+        # Shared with every API and batch generation, so the provider sees at most AGENT_MAX_CONCURRENCY runs
+        with admission.agent_budget.run(), resilience.paced_by(limiter):
+            agents = agent_loader.load()
+            agent = agents.get_menu_agent(os.getenv("TOGETHER_API_KEY"))
+            usage = agents.GenerationMetricsCallback(mode)
+            callbacks = [usage, agents.AgentProgressCallback(emit)] if emit else [usage]
+            if mode == "structured":
+                menu_result = agent.generate_structured_menu(preferences, callbacks=callbacks)
+            else:
+                menu_result = agent.generate_weekly_menu(preferences, callbacks=callbacks)
+            usage.finish()
+        menu_result.setdefault("generation_mode", mode)
+        outcome = "fallback" if menu_result.get("fallback_used") else "llm"
+        # Fallback menus are a degraded answer; don't serve them to other users
+        if not menu_result.get("fallback_used"):
+            cache.menu_cache.set(preferences, menu_result, namespace=mode)
+            # Keep the dishes the LLM came up with, so later runs find them locally
+            catalog.dish_catalog.ingest_menu(menu_result["menu"], preferences)
+        if mode == "agent":
+            catalog.dish_catalog.record_agent_run(menu_result.get("web_searches", 0))
+    elif emit:
+        emit("progress", {"stage": "cache_hit"})
+
+    metrics.record_generation(mode, outcome, time.perf_counter() - start)
+    if emit:
+        _emit_slots(emit, menu_result["menu"])
+    return menu_result
@@ -0,0 +1,298 @@
+# grocery.py - quantified grocery lists for weekly menus, without an LLM call
+#
+# Dish names are matched against INGREDIENT_RULES with one compiled pattern
+# (whole words, any case, longest keyword first, so "Dal Makhani" isn't also
+# counted as plain "Dal") and the per-serving quantities of every keyword found
+# are added up. A menu's totals are computed once, stored on its WeeklyMenu row
+# (grocery_data) and kept in totals_cache; a list for N servings or several
+# weeks is a sum and a multiply over those totals.
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from .cache import TTLCache
+
+GROCERY_CACHE_TTL_SECONDS = int(os.getenv("GROCERY_CACHE_TTL_SECONDS", 24 * 60 * 60))
+GROCERY_CACHE_MAX_ENTRIES = int(os.getenv("GROCERY_CACHE_MAX_ENTRIES", 4096))
+
+# Bump when ITEMS or INGREDIENT_RULES change; stored totals of an older version are recomputed
+RULES_VERSION = 1
+
+CATEGORIES = ("vegetables", "grains_pulses", "dairy_proteins", "spices_condiments", "others")
+
+# item -> (category, unit)
+ITEMS = {
+    "Potatoes": ("vegetables", "g"),
+    "Onions": ("vegetables", "g"),
+    "Tomatoes": ("vegetables", "g"),
+    "Spinach": ("vegetables", "g"),
+    "Cauliflower": ("vegetables", "g"),
+    "Bhindi (Okra)": ("vegetables", "g"),
+    "Brinjal": ("vegetables", "g"),
+    "Green Peas": ("vegetables", "g"),
+    "Mixed Vegetables": ("vegetables", "g"),
+    "Fenugreek Leaves": ("vegetables", "g"),
+    "Colocasia Leaves": ("vegetables", "g"),
+    "Coriander Leaves": ("vegetables", "g"),
+    "Raw Banana": ("vegetables", "g"),
+    "Lemons": ("vegetables", "pcs"),
+    "Fresh Fruits": ("vegetables", "g"),
+    "Toor Dal": ("grains_pulses", "g"),
+    "Moong Dal": ("grains_pulses", "g"),
+    "Masoor Dal": ("grains_pulses", "g"),
+    "Urad Dal": ("grains_pulses", "g"),
+    "Chana Dal": ("grains_pulses", "g"),
+    "Chickpeas": ("grains_pulses", "g"),
+    "Kidney Beans": ("grains_pulses", "g"),
+    "Moth Beans": ("grains_pulses", "g"),
+    "Dried Peas": ("grains_pulses", "g"),
+    "Roasted Chana": ("grains_pulses", "g"),
+    "Rice": ("grains_pulses", "g"),
+    "Basmati Rice": ("grains_pulses", "g"),
+    "Rice Flour": ("grains_pulses", "g"),
+    "Poha (Flattened Rice)": ("grains_pulses", "g"),
+    "Puffed Rice": ("grains_pulses", "g"),
+    "Wheat Flour": ("grains_pulses", "g"),
+    "Maida": ("grains_pulses", "g"),
+    "Besan (Gram Flour)": ("grains_pulses", "g"),
+    "Semolina (Rava)": ("grains_pulses", "g"),
+    "Broken Wheat (Dalia)": ("grains_pulses", "g"),
+    "Ragi Flour": ("grains_pulses", "g"),
+    "Jowar Flour": ("grains_pulses", "g"),
+    "Thalipeeth Bhajani": ("grains_pulses", "g"),
+    "Sabudana": ("grains_pulses", "g"),
+    "Peanuts": ("grains_pulses", "g"),
+    "Paneer": ("dairy_proteins", "g"),
+    "Milk": ("dairy_proteins", "ml"),
+    "Curd": ("dairy_proteins", "g"),
+    "Butter": ("dairy_proteins", "g"),
+    "Ghee": ("dairy_proteins", "g"),
+    "Fresh Cream": ("dairy_proteins", "ml"),
+    "Chicken": ("dairy_proteins", "g"),
+    "Mutton": ("dairy_proteins", "g"),
+    "Fresh Fish": ("dairy_proteins", "g"),
+    "Prawns": ("dairy_proteins", "g"),
+    "Eggs": ("dairy_proteins", "pcs"),
+    "Tamarind": ("spices_condiments", "g"),
+    "Sambhar Masala": ("spices_condiments", "g"),
+    "Garam Masala": ("spices_condiments", "g"),
+    "Poppy Seeds": ("spices_condiments", "g"),
+    "Pickle": ("spices_condiments", "g"),
+    "Sugar": ("spices_condiments", "g"),
+    "Jaggery": ("spices_condiments", "g"),
+    "Cooking Oil": ("others", "ml"),
+    "Coconut": ("others", "g"),
+    "Coconut Milk": ("others", "ml"),
+    "Sev": ("others", "g"),
+    "Pav": ("others", "pcs"),
+    "Bread": ("others", "pcs"),
+}
+
+# Keyword in a dish name -> (item, quantity per serving) it brings in
+INGREDIENT_RULES: Dict[str, Tuple[Tuple[str, float], ...]] = {
+    # Dals and pulses
+    "Dal": (("Toor Dal", 40),),
+    "Mixed Dal": (("Toor Dal", 20), ("Moong Dal", 15), ("Masoor Dal", 15)),
+    "Dal Makhani": (("Urad Dal", 40), ("Kidney Beans", 10), ("Butter", 10), ("Fresh Cream", 15)),
+    "Dal Dhokli": (("Toor Dal", 40), ("Wheat Flour", 50)),
+    "Cholar Dal": (("Chana Dal", 40), ("Coconut", 10)),
+    "Sambhar": (("Toor Dal", 30), ("Mixed Vegetables", 50), ("Tamarind", 5), ("Sambhar Masala", 5)),
+    "Sambar": (("Toor Dal", 30), ("Mixed Vegetables", 50), ("Tamarind", 5), ("Sambhar Masala", 5)),
+    "Rasam": (("Toor Dal", 15), ("Tomatoes", 60), ("Tamarind", 5)),
+    "Rajma": (("Kidney Beans", 60),),
+    "Chole": (("Chickpeas", 60),),
+    "Chana": (("Chickpeas", 60),),
+    "Roasted Chana": (("Roasted Chana", 40),),
+    "Ghugni": (("Dried Peas", 60), ("Onions", 30)),
+    "Misal": (("Moth Beans", 60), ("Onions", 30), ("Sev", 20)),
+    "Kadhi": (("Curd", 100), ("Besan (Gram Flour)", 15)),
+    "Khichdi": (("Rice", 50), ("Moong Dal", 30), ("Ghee", 5)),
+    "Khichuri": (("Rice", 50), ("Moong Dal", 30), ("Ghee", 5)),
+    "Pitla": (("Besan (Gram Flour)", 40), ("Onions", 30)),
+    "Zunka": (("Besan (Gram Flour)", 50), ("Onions", 40)),
+    # Rice
+    "Rice": (("Rice", 80),),
+    "Biryani": (("Basmati Rice", 100), ("Onions", 50), ("Curd", 30), ("Garam Masala", 3)),
+    "Curd Rice": (("Rice", 80), ("Curd", 100)),
+    "Lemon": (("Lemons", 1),),
+    "Tamarind": (("Tamarind", 15),),
+    "Idli": (("Rice", 50), ("Urad Dal", 15)),
+    "Dosa": (("Rice", 60), ("Urad Dal", 15)),
+    "Masala Dosa": (("Rice", 60), ("Urad Dal", 15), ("Potatoes", 80)),
+    "Ragi Dosa": (("Ragi Flour", 60), ("Urad Dal", 10)),
+    "Uttapam": (("Rice", 60), ("Urad Dal", 15), ("Onions", 30), ("Tomatoes", 30)),
+    "Medu Vada": (("Urad Dal", 50),),
+    "Poha": (("Poha (Flattened Rice)", 60), ("Onions", 30), ("Peanuts", 10)),
+    "Bhel Puri": (("Puffed Rice", 40), ("Sev", 10), ("Onions", 20), ("Tamarind", 5)),
+    "Jhal Muri": (("Puffed Rice", 40), ("Onions", 20), ("Peanuts", 10)),
+    "Sev Mamra": (("Puffed Rice", 30), ("Sev", 20)),
+    "Murukku": (("Rice Flour", 40), ("Urad Dal", 10), ("Cooking Oil", 15)),
+    "Chakri": (("Rice Flour", 40), ("Cooking Oil", 15)),
+    "Sabudana Khichdi": (("Sabudana", 70), ("Peanuts", 20), ("Potatoes", 50)),
+    # Breads and flours
+    "Roti": (("Wheat Flour", 60),),
+    "Rotli": (("Wheat Flour", 60),),
+    "Chapati": (("Wheat Flour", 60),),
+    "Paratha": (("Wheat Flour", 80), ("Ghee", 10)),
+    "Thepla": (("Wheat Flour", 60), ("Fenugreek Leaves", 20)),
+    "Khakhra": (("Wheat Flour", 30),),
+    "Puran Poli": (("Wheat Flour", 40), ("Chana Dal", 40), ("Jaggery", 30)),
+    "Naan": (("Maida", 80),),
+    "Kulcha": (("Maida", 70),),
+    "Bhature": (("Maida", 80), ("Cooking Oil", 20)),
+    "Luchi": (("Maida", 60), ("Cooking Oil", 20)),
+    "Bhakri": (("Jowar Flour", 70),),
+    "Bhakar": (("Jowar Flour", 70),),
+    "Thalipeeth": (("Thalipeeth Bhajani", 70),),
+    "Upma": (("Semolina (Rava)", 60), ("Onions", 20)),
+    "Dalia": (("Broken Wheat (Dalia)", 50),),
+    "Pav": (("Pav", 2),),
+    "Vada Pav": (("Pav", 1), ("Potatoes", 100), ("Besan (Gram Flour)", 30)),
+    "Sandwich": (("Bread", 2), ("Mixed Vegetables", 50)),
+    "Roll": (("Maida", 50), ("Onions", 20)),
+    # Vegetables
+    "Aloo": (("Potatoes", 100),),
+    "Alu Vadi": (("Colocasia Leaves", 60), ("Besan (Gram Flour)", 30)),
+    "Posto": (("Poppy Seeds", 15),),
+    "Palak": (("Spinach", 150),),
+    "Gobi": (("Cauliflower", 150),),
+    "Bhindi": (("Bhindi (Okra)", 150),),
+    "Vangi": (("Brinjal", 150), ("Peanuts", 15)),
+    "Begun": (("Brinjal", 120),),
+    "Beguni": (("Brinjal", 80), ("Besan (Gram Flour)", 30)),
+    "Undhiyu": (("Mixed Vegetables", 200), ("Besan (Gram Flour)", 20)),
+    "Mix Veg": (("Mixed Vegetables", 150),),
+    "Vegetable": (("Mixed Vegetables", 150),),
+    "Stuffed": (("Mixed Vegetables", 60),),
+    "Kothimbir": (("Coriander Leaves", 50), ("Besan (Gram Flour)", 40)),
+    "Banana Chips": (("Raw Banana", 100), ("Cooking Oil", 15)),
+    "Fruit": (("Fresh Fruits", 150),),
+    # Dairy, eggs, meat and fish
+    "Paneer": (("Paneer", 80),),
+    "Butter Masala": (("Butter", 10), ("Fresh Cream", 15), ("Tomatoes", 60)),
+    "Butter Chicken": (("Chicken", 150), ("Butter", 15), ("Fresh Cream", 20), ("Tomatoes", 60)),
+    "Raita": (("Curd", 80),),
+    "Curd": (("Curd", 100),),
+    "Khandvi": (("Besan (Gram Flour)", 40), ("Curd", 40)),
+    "Chicken": (("Chicken", 150), ("Onions", 30)),
+    "Tikka": (("Curd", 30),),
+    "Mutton": (("Mutton", 150), ("Onions", 30)),
+    "Lamb": (("Mutton", 150), ("Onions", 30)),
+    "Keema": (("Mutton", 80),),
+    "Seekh Kebab": (("Mutton", 120), ("Onions", 20)),
+    "Fish": (("Fresh Fish", 150),),
+    "Prawn": (("Prawns", 120),),
+    "Malai": (("Coconut Milk", 60),),
+    "Egg": (("Eggs", 2),),
+    # Snacks and sweets
+    "Samosa": (("Maida", 40), ("Potatoes", 60), ("Green Peas", 20), ("Cooking Oil", 20)),
+    "Pakora": (("Besan (Gram Flour)", 40), ("Onions", 40), ("Cooking Oil", 20)),
+    "Kachori": (("Maida", 40), ("Moong Dal", 20), ("Cooking Oil", 20)),
+    "Dhokla": (("Besan (Gram Flour)", 60),),
+    "Fafda": (("Besan (Gram Flour)", 50), ("Cooking Oil", 15)),
+    "Jalebi": (("Maida", 30), ("Sugar", 30)),
+    "Cutlet": (("Potatoes", 40), ("Bread", 1)),
+    "Groundnuts": (("Peanuts", 40),),
+    "Coconut": (("Coconut", 40),),
+    "Laddu": (("Sugar", 20), ("Ghee", 5)),
+    "Barfi": (("Sugar", 20), ("Milk", 50)),
+    # Gravies, sides and methods
+    "Curry": (("Onions", 40), ("Tomatoes", 40)),
+    "Masala": (("Onions", 30), ("Tomatoes", 30)),
+    "Fry": (("Cooking Oil", 15),),
+    "Pickle": (("Pickle", 15),),
+    "Thali": (("Rice", 50), ("Wheat Flour", 40), ("Toor Dal", 30), ("Mixed Vegetables", 100), ("Curd", 50)),
+}
+
+
+class GroceryIndex:
+    """Dish name -> per-serving (item, quantity) pairs, matched once per dish and remembered"""
+
+    MAX_MEMOIZED_DISHES = 8192
+
+    def __init__(self, rules: Dict[str, Tuple[Tuple[str, float], ...]]):
+        unknown = {item for ingredients in rules.values() for item, _ in ingredients} - set(ITEMS)
+        if unknown:
+            raise ValueError(f"Ingredient rules use unknown items: {', '.join(sorted(unknown))}")
+        self._rules = {keyword.casefold(): ingredients for keyword, ingredients in rules.items()}
+        keywords = sorted(rules, key=len, reverse=True)
+        self._pattern = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")\b", re.IGNORECASE)
+        self._dishes: Dict[str, Tuple[Tuple[str, float], ...]] = {}
+        self._lock = threading.Lock()
+
+    def ingredients(self, dish: str) -> Tuple[Tuple[str, float], ...]:
+        found = self._dishes.get(dish)
+        if found is None:
+            found = tuple(pair for keyword in self._pattern.findall(dish)
+                          for pair in self._rules[keyword.casefold()])
+            # Dish names come from LLM menus, so don't let arbitrary names grow the memo forever
+            with self._lock:
+                if len(self._dishes) < self.MAX_MEMOIZED_DISHES:
+                    self._dishes[dish] = found
+        return found
+
+    def menu_totals(self, menu: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-serving item totals for one menu, and the dishes no rule matched.
+
+        This is what gets stored on the WeeklyMenu row.
+        """
+        items: Dict[str, float] = {}
+        unmatched: List[str] = []
+        for dish in _menu_dishes(menu):
+            ingredients = self.ingredients(dish)
+            if not ingredients and dish not in unmatched:
+                unmatched.append(dish)
+            for item, quantity in ingredients:
+                items[item] = items.get(item, 0) + quantity
+        return {"version": RULES_VERSION, "items": items, "unmatched": unmatched}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rules": len(self._rules), "items": len(ITEMS), "dishes_indexed": len(self._dishes),
+                "max_dishes_indexed": self.MAX_MEMOIZED_DISHES, "totals_cache": totals_cache.stats()}
+
+
+def _menu_dishes(menu: Dict[str, Any]) -> Iterable[str]:
+    # {day: {meal: dish}}; legacy rows may hold {day: [dish, ...]}
+    for meals in menu.values():
+        dishes = meals.values() if isinstance(meals, dict) else meals if isinstance(meals, list) else ()
+        for dish in dishes:
+            if isinstance(dish, str):
+                yield dish
+
+
+def is_current(totals: Dict[str, Any]) -> bool:
+    return totals.get("version") == RULES_VERSION
+
+
+def _amount(quantity: float, unit: str) -> Tuple[float, str]:
+    """Shopping-friendly amount: whole pieces, grams/ml rounded up to 10, kg/l past 1000"""
+    if unit == "pcs":
+        return math.ceil(quantity), unit
+    quantity = math.ceil(quantity / 10) * 10
+    if quantity >= 1000:
+        return round(quantity / 1000, 2), {"g": "kg", "ml": "l"}[unit]
+    return quantity, unit
+
+
+def build_grocery_list(weeks: Sequence[Dict[str, Any]], servings: int = 1) -> Dict[str, Any]:
+    """Merge the stored totals of one or more menus and scale them to `servings`"""
+    merged: Dict[str, float] = {}
+    unmatched: List[str] = []
+    for totals in weeks:
+        for item, quantity in totals["items"].items():
+            merged[item] = merged.get(item, 0) + quantity
+        unmatched.extend(dish for dish in totals["unmatched"] if dish not in unmatched)
+
+    categories: Dict[str, List[Dict[str, Any]]] = {category: [] for category in CATEGORIES}
+    for item in sorted(merged):
+        category, unit = ITEMS[item]
+        quantity, unit = _amount(merged[item] * servings, unit)
+        categories[category].append({"item": item, "quantity": quantity, "unit": unit})
+    return {"servings": servings, "weeks": len(weeks), "categories": categories, "unmatched_dishes": unmatched}
+
+
+grocery_index = GroceryIndex(INGREDIENT_RULES)
+# (user_id, menu_id) -> stored totals; menus are never edited in place (regenerating saves a new row)
+totals_cache = TTLCache(maxsize=GROCERY_CACHE_MAX_ENTRIES, ttl=GROCERY_CACHE_TTL_SECONDS)
@@ -0,0 +1,177 @@
+# jobs.py - bounded background job queues for long-running menu generation
+#
+# menu_job_queue runs /generate-menu requests that need no LLM run (local
+# plans, cache hits); llm_job_queue runs the ones that do, with one worker per
+# agent run slot; batch_job_queue runs admin precompute batches. A request
+# waiting on the provider, or an hours-long batch, never holds a worker that
+# a quick request is waiting for.
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from . import metrics
+from .admission import AGENT_MAX_CONCURRENCY, AGENT_MAX_QUEUED
+
+MENU_JOB_WORKERS = int(os.getenv("MENU_JOB_WORKERS", 4))
+MENU_JOB_MAX_PENDING = int(os.getenv("MENU_JOB_MAX_PENDING", 32))
+MENU_JOB_RESULT_TTL_SECONDS = int(os.getenv("MENU_JOB_RESULT_TTL_SECONDS", 3600))
+BATCH_JOB_WORKERS = int(os.getenv("BATCH_JOB_WORKERS", 1))
+BATCH_JOB_MAX_PENDING = int(os.getenv("BATCH_JOB_MAX_PENDING", 2))
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds the maximum number of unfinished jobs"""
+
+
+class MenuJob:
+    """State of a single submitted job, polled through /menu-jobs/{id}"""
+
+    def __init__(self, user_id: int, key: Optional[Hashable] = None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.key = key  # identical unfinished submissions share this job
+        self.status = "queued"  # queued/running/completed/failed
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now().isoformat()
+        self.finished_at: Optional[str] = None
+        self.future: Optional[Future] = None
+        self.progress: Optional[Dict[str, Any]] = None  # updated in place by long-running jobs
+        self._finished_monotonic: Optional[float] = None
+        self._created_monotonic = time.monotonic()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+            "progress": self.progress
+        }
+
+
+class MenuJobQueue:
+    """Runs jobs on a fixed-size thread pool and keeps their results for polling.
+
+    The number of unfinished (queued + running) jobs is capped so a burst of
+    submissions is rejected up front instead of piling up in memory. Jobs
+    submitted with a key can be found again (find_unfinished) until they
+    finish, so a repeated request joins the job already in flight.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, result_ttl: int, name: str = "menu-job"):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._jobs: Dict[str, MenuJob] = {}
+        self._keyed: Dict[Hashable, MenuJob] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def submit(self, user_id: int, fn: Callable[..., Dict[str, Any]], *args, key: Optional[Hashable] = None,
+               **kwargs) -> MenuJob:
+        """Queue fn(*args, **kwargs) and return its job immediately"""
+        job = MenuJob(user_id, key)
+        with self._lock:
+            self._evict_expired()
+            if self._pending_count() >= self.max_pending:
+                raise QueueFullError(f"The {self.name} queue is full ({self.max_pending} pending jobs)")
+            self._jobs[job.id] = job
+            if key is not None:
+                self._keyed[key] = job
+            job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[MenuJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find_unfinished(self, key: Hashable) -> Optional[MenuJob]:
+        """The queued or running job submitted with key, if any (counted as a coalesced request)"""
+        with self._lock:
+            job = self._keyed.get(key)
+            if job is None or job.done:
+                return None
+            self.coalesced += 1
+            return job
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "completed": statuses.count("completed"),
+            "failed": statuses.count("failed"),
+            "coalesced": self.coalesced
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: MenuJob, fn: Callable[..., Dict[str, Any]], args, kwargs) -> Dict[str, Any]:
+        job.status = "running"
+        if job.user_id is not None:  # batch runs aren't part of /generate-menu latency
+            metrics.MENU_STAGE_SECONDS.labels("queue_wait").observe(time.monotonic() - job._created_monotonic)
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = "completed"
+            return job.result
+        except Exception as e:
+            print(f"Error in {self.name} {job.id}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+            raise
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            job._finished_monotonic = time.monotonic()
+            if job.key is not None:
+                with self._lock:
+                    if self._keyed.get(job.key) is job:
+                        del self._keyed[job.key]
+
+    def _pending_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.done)
+
+    def _evict_expired(self):
+        cutoff = time.monotonic() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job._finished_monotonic is not None and job._finished_monotonic < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+menu_job_queue = MenuJobQueue(
+    max_workers=MENU_JOB_WORKERS,
+    max_pending=MENU_JOB_MAX_PENDING,
+    result_ttl=MENU_JOB_RESULT_TTL_SECONDS
+)
+
+# admission.agent_budget admits at most this many LLM-backed requests, so the cap is never the one that rejects
+llm_job_queue = MenuJobQueue(
+    max_workers=AGENT_MAX_CONCURRENCY,
+    max_pending=AGENT_MAX_CONCURRENCY + AGENT_MAX_QUEUED,
+    result_ttl=MENU_JOB_RESULT_TTL_SECONDS,
+    name="llm-job"
+)
+
+batch_job_queue = MenuJobQueue(
+    max_workers=BATCH_JOB_WORKERS,
+    max_pending=BATCH_JOB_MAX_PENDING,
+    result_ttl=MENU_JOB_RESULT_TTL_SECONDS,
+    name="batch-job"
+)
@@ -1,16 +1,19 @@
+import asyncio
 import json
-from fastapi import FastAPI, Depends, HTTPException
+from datetime import datetime
+from typing import List
+from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 import os
 
-from . import agents
-from . import models, schema, utils, database, auth
+from .planner import menu_planner
+from . import models, schema, utils, database, auth, crud, jobs, cache, generation, batch, web_cache, catalog, metrics, grocery, admission, resilience
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
 
-models.Base.metadata.create_all(bind=database.engine)
 app = FastAPI()
 
 app.add_middleware(
@@ -20,78 +23,71 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.PrometheusMiddleware)
 
-def get_db():
-    db = database.SessionLocal()
+# Same dependency as auth.get_current_user, so a request shares one session with its auth check.
+# Routes await the database on the event loop instead of holding a threadpool worker per query;
+# job workers keep using the sync SessionLocal.
+get_db = database.get_async_db
+
+async def _password_work(fn, *args):
     try:
-        yield db
-    finally:
-        db.close()
+        return await fn(*args)
+    except utils.PasswordPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
+# register/login are async so bcrypt runs on utils.password_pool instead of a request threadpool worker
 @app.post("/register")
-def register(user: schema.UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def register(user: schema.UserCreate, db: AsyncSession = Depends(get_db)):
+    existing_user = await crud.get_user_by_username_async(db, user.username)
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    existing_email = db.query(models.User).filter(models.User.email == user.email).first()
+    existing_email = await crud.get_user_by_email_async(db, user.email)
     if existing_email:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = utils.hash_password(user.password)
-    db_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    hashed_password = await _password_work(utils.password_pool.hash, user.password)
+    await crud.create_user_async(db, user.username, user.email, hashed_password)
     return {"msg": "User registered successfully"}
 
 @app.post("/login", response_model=schema.Token)
-def login(user: schema.UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if not db_user or not utils.verify_password(user.password, db_user.hashed_password):
+async def login(user: schema.UserLogin, db: AsyncSession = Depends(get_db)):
+    db_user = await crud.get_user_by_username_async(db, user.username)
+    if not db_user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
+
+    valid, new_hash = await _password_work(utils.password_pool.verify_and_update, user.password, db_user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    if new_hash:
+        # Stored hash used an outdated cost (BCRYPT_ROUNDS changed); upgrade it transparently
+        await crud.update_password_hash_async(db, db_user, new_hash)
         
-    token = auth.create_access_token(data={"sub": db_user.username})
+    token = auth.create_access_token(data={"sub": db_user.username, "uid": db_user.id})
     return {"access_token": token, "token_type": "bearer"}
 
 @app.post("/preferences")
-def save_preferences(pref: schema.PreferenceCreate, db: Session = Depends(get_db), user: models.User = Depends(auth.get_current_user)):
-    existing = db.query(models.Preference).filter(models.Preference.user_id == user.id).first()
-
-    pref_data = {
-        "diet_type": pref.diet_type,
-        "cuisine": ",".join(pref.cuisine) if pref.cuisine else "",
-        "meals": ",".join(pref.meals) if pref.meals else "",
-        "cooking_time": pref.cooking_time,
-        "health_conditions": ",".join(pref.health_conditions) if pref.health_conditions else "",
-    }
-
-    if existing:
-        for key, value in pref_data.items():
-            setattr(existing, key, value)
-    else:
-        new_pref = models.Preference(user_id=user.id, **pref_data)
-        db.add(new_pref)
-
-    db.commit()
+async def save_preferences(pref: schema.PreferenceCreate, db: AsyncSession = Depends(get_db), user: auth.CurrentUser = Depends(auth.get_current_user)):
+    await crud.save_preferences_async(db, user.id, pref)
     return {"msg": "Preferences saved successfully"}
 
 @app.get("/preferences", response_model=schema.PreferenceCreate)
-def get_preferences(db: Session = Depends(get_db), user: models.User = Depends(auth.get_current_user)):
-    pref = db.query(models.Preference).filter(models.Preference.user_id == user.id).first()
+async def get_preferences(db: AsyncSession = Depends(get_db), user: auth.CurrentUser = Depends(auth.get_current_user)):
+    pref = await crud.get_preferences_dict_async(db, user.id)
     if not pref:
         raise HTTPException(status_code=404, detail="Preferences not found")
 
     return schema.PreferenceCreate(
-        diet_type=pref.diet_type or "",
-        cuisine=pref.cuisine.split(",") if pref.cuisine else [],
-        meals=pref.meals.split(",") if pref.meals else [],
-        cooking_time=pref.cooking_time or "",
-        health_conditions=pref.health_conditions.split(",") if pref.health_conditions else [],
+        diet_type=pref["diet_type"] or "",
+        cuisine=pref["cuisine"],
+        meals=pref["meals"],
+        cooking_time=pref["cooking_time"] or "",
+        health_conditions=pref["health_conditions"],
     )
 
 @app.get("/protected")
-def get_protected_data(user: models.User = Depends(auth.get_current_user)):
+def get_protected_data(user: auth.CurrentUser = Depends(auth.get_current_user)):
     return {
         "message": "This is protected data", 
         "user": user.username,
@@ -101,41 +97,270 @@ def get_protected_data(user: models.User = Depends(auth.get_current_user)):
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 if not TOGETHER_API_KEY:
     print("Warning: TOGETHER_API_KEY not set in .env")
-os.environ["TOGETHER_API_KEY"] = TOGETHER_API_KEY
 
-@app.post("/generate-menu", response_model=schema.MenuResponse)
-def generate_menu(req: schema.MenuGenerateRequest, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    pref = db.query(models.Preference).filter(models.Preference.user_id == current_user.id).first()
-    if not pref:
+def _run_menu_generation(user_id: int, preferences: dict, mode: str = None, force_fresh: bool = False, emit=None) -> dict:
+    """Runs on a job worker thread: generate the menu, then persist it with a fresh session"""
+    with metrics.MENU_STAGE_SECONDS.labels("generate").time():
+        menu_result = generation.generate_menu(preferences, mode=mode, force_fresh=force_fresh, emit=emit)
+
+    db = database.SessionLocal()
+    try:
+        with metrics.MENU_STAGE_SECONDS.labels("save").time():
+            new_menu = crud.save_weekly_menu(db, user_id, menu_result)
+        menu_id = new_menu.id
+    finally:
+        db.close()
+
+    return {
+        "menu": menu_result["menu"],
+        "preferences_used": menu_result["preferences_used"],
+        "generated_at": menu_result["generated_at"],
+        "menu_id": menu_id
+    }
+
+async def _submit_menu_job(db: AsyncSession, user_id: int, req: schema.MenuGenerateRequest, emit=None) -> jobs.MenuJob:
+    with metrics.MENU_STAGE_SECONDS.labels("load_preferences").time():
+        preferences = await crud.get_preferences_dict_async(db, user_id)
+    # Hand the connection back to the pool before waiting on (or streaming) the job
+    await db.close()
+    if not preferences:
         raise HTTPException(status_code=400, detail="Set preferences before generating menu")
 
-    preferences = {
-        "diet_type": pref.diet_type,
-        "cuisine": pref.cuisine.split(","),
-        "meals": pref.meals.split(","),
-        "cooking_time": pref.cooking_time,
-        "health_conditions": pref.health_conditions.split(",")
+    try:
+        mode = generation.resolve_mode(req.generation_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # A repeat of a request still in flight (double submit, client retry) joins that job;
+    # a coalesced stream only gets the final event, not the first one's progress
+    key = (user_id, req.force_fresh, cache.preference_key(preferences, namespace=mode))
+    job = jobs.menu_job_queue.find_unfinished(key) or jobs.llm_job_queue.find_unfinished(key)
+    if job is not None:
+        metrics.GENERATIONS_COALESCED.inc()
+        return job
+
+    # Requests that will wait on the provider get their own workers, so they can't hold up local plans
+    # and cache hits; only they are admitted, since a cached menu costs no provider quota
+    llm_backed = mode != "local" and (
+        req.force_fresh or not await asyncio.to_thread(cache.menu_cache.contains, preferences, mode))
+    if llm_backed:
+        try:
+            admission.admit(user_id)
+        except admission.AdmissionRejected as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+
+    queue = jobs.llm_job_queue if llm_backed else jobs.menu_job_queue
+    try:
+        job = queue.submit(user_id, _run_menu_generation, user_id, preferences, mode, req.force_fresh, emit, key=key)
+    except jobs.QueueFullError as e:
+        if llm_backed:
+            admission.agent_budget.release()
+        raise HTTPException(status_code=503, detail=str(e))
+    if llm_backed:
+        job.future.add_done_callback(lambda _: admission.agent_budget.release())
+    return job
+
+async def _regenerate_slot(db: AsyncSession, user_id: int, menu_row: models.WeeklyMenu, day: str, meal: str) -> dict:
+    """Re-plan one (day, meal) of a stored menu and save the result as a new active version"""
+    stored = await crud.load_menu_async(db, menu_row)
+    menu = stored["menu"]
+
+    day_key = next((d for d in menu if d.lower() == day.strip().lower()), None)
+    meal_key = next((m for m in menu.get(day_key, {}) if m.lower() == meal.strip().lower()), None)
+    if not day_key or not meal_key:
+        raise HTTPException(status_code=400, detail=f"Menu has no {meal} slot on {day}")
+
+    menu[day_key][meal_key] = menu_planner.replace_slot(menu, day_key, meal_key, stored["preferences_used"])
+    menu_result = {
+        "menu": menu,
+        "preferences_used": stored["preferences_used"],
+        "generated_at": datetime.now().isoformat()
     }
+    new_menu = await crud.save_weekly_menu_async(db, user_id, menu_result)
+    return {**menu_result, "menu_id": new_menu.id}
 
-    agent = agents.IndianMenuAgent(together_api_key=TOGETHER_API_KEY)
-    menu_result = agent.generate_weekly_menu(preferences)
+async def _regenerate_active_slot(db: AsyncSession, user_id: int, slot: str) -> dict:
+    day, _, meal = slot.partition("-")
+    menu_row = await crud.get_active_menu_async(db, user_id)
+    if not menu_row:
+        raise HTTPException(status_code=404, detail="No active menu to regenerate")
+    return await _regenerate_slot(db, user_id, menu_row, day, meal)
 
-    db.query(models.WeeklyMenu).filter(models.WeeklyMenu.user_id == current_user.id, models.WeeklyMenu.is_active == 1).update({"is_active": 0})
+@app.get("/menu-history", response_model=schema.MenuHistoryResponse)
+async def get_menu_history(limit: int = Query(10, ge=1, le=100), before_id: int = None, db: AsyncSession = Depends(get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    menus, next_cursor = await crud.get_menu_history_async(db, current_user.id, limit, before_id)
+    return {"menus": menus, "next_cursor": next_cursor}
 
-    new_menu = models.WeeklyMenu(
-        user_id=current_user.id,
-        menu_data=json.dumps(menu_result["menu"]),
-        generation_prompt=json.dumps(menu_result["preferences_used"]),
-        created_at=menu_result["generated_at"],
-        is_active=1
-    )
-    db.add(new_menu)
-    db.commit()
-    db.refresh(new_menu)
+async def _grocery_list(db: AsyncSession, user_id: int, menu_ids: list, servings: int) -> dict:
+    weeks = await crud.get_grocery_totals_async(db, user_id, menu_ids)
+    if weeks is None:
+        raise HTTPException(status_code=404, detail="Menu not found")
+    return {"menu_ids": list(dict.fromkeys(menu_ids)), **grocery.build_grocery_list(weeks, servings)}
 
+@app.get("/menus/{menu_id}/grocery-list", response_model=schema.GroceryListResponse)
+async def get_menu_grocery_list(menu_id: int, servings: int = Query(1, ge=1, le=50), db: AsyncSession = Depends(get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    return await _grocery_list(db, current_user.id, [menu_id], servings)
+
+@app.get("/grocery-list", response_model=schema.GroceryListResponse)
+async def get_grocery_list(menu_ids: List[int] = Query(..., min_items=1, max_items=8), servings: int = Query(1, ge=1, le=50), db: AsyncSession = Depends(get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    """One list for several weeks, e.g. /grocery-list?menu_ids=12&menu_ids=15&servings=4"""
+    return await _grocery_list(db, current_user.id, menu_ids, servings)
+
+@app.post("/regenerate-meal", response_model=schema.MenuResponse)
+async def regenerate_meal(req: schema.MenuRegenerateRequest, db: AsyncSession = Depends(get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    menu_row = await crud.get_user_menu_async(db, current_user.id, req.menu_id)
+    if not menu_row:
+        raise HTTPException(status_code=404, detail="Menu not found")
+    return await _regenerate_slot(db, current_user.id, menu_row, req.day, req.meal)
+
+@app.post("/generate-menu", response_model=schema.MenuResponse)
+async def generate_menu(req: schema.MenuGenerateRequest, db: AsyncSession = Depends(get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    if req.regenerate_meal:
+        # "Monday-lunch": only that slot of the active menu is re-planned
+        return await _regenerate_active_slot(db, current_user.id, req.regenerate_meal)
+
+    # Waits on the job without holding a request threadpool worker or a DB connection
+    job = await _submit_menu_job(db, current_user.id, req)
+    try:
+        return await asyncio.wrap_future(job.future)
+    except Exception:
+        raise HTTPException(status_code=500, detail="Menu generation failed")
+
+def _format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/generate-menu/stream")
+async def generate_menu_stream(req: schema.MenuGenerateRequest, db: AsyncSession = Depends(get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    """Server-Sent Events: progress and slot events while the menu is generated, then a
+    final "complete" event carrying the MenuResponse payload (or an "error" event)."""
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: str, data: dict):
+        # Called from the job worker thread
+        try:
+            loop.call_soon_threadsafe(events.put_nowait, (event, data))
+        except RuntimeError:
+            pass  # event loop is gone; the client disconnected
+
+    job = await _submit_menu_job(db, current_user.id, req, emit)
+
+    def on_done(future):
+        if future.exception() is None:
+            emit("complete", future.result())
+        else:
+            emit("error", {"detail": "Menu generation failed"})
+    job.future.add_done_callback(on_done)
+
+    async def event_stream():
+        yield _format_sse("job", {"job_id": job.id, "status": job.status})
+        while True:
+            event, data = await events.get()
+            yield _format_sse(event, data)
+            if event in ("complete", "error"):
+                break
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/menu-jobs", response_model=schema.MenuJobResponse, status_code=202)
+async def submit_menu_job(req: schema.MenuGenerateRequest, db: AsyncSession = Depends(get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    job = await _submit_menu_job(db, current_user.id, req)
+    return job.to_dict()
+
+@app.get("/menu-jobs/{job_id}", response_model=schema.MenuJobResponse)
+def get_menu_job(job_id: str, current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    job = jobs.menu_job_queue.get(job_id) or jobs.llm_job_queue.get(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Menu job not found")
+    return job.to_dict()
+
+@app.post("/admin/precompute-menus", response_model=schema.BatchJobResponse, status_code=202,
+          dependencies=[Depends(auth.require_admin)])
+async def precompute_menus(req: schema.PrecomputeRequest):
+    """Start a batch run (see app.batch) on the batch job queue; poll it with GET /admin/precompute-menus/{job_id}"""
+    try:
+        mode = generation.resolve_mode(req.generation_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    options = {"mode": mode, "user_ids": req.user_ids, "force_fresh": req.force_fresh, "seed": req.seed}
+    if req.concurrency is not None:
+        options["concurrency"] = req.concurrency
+    if req.rate_per_minute is not None:
+        options["rate_per_minute"] = req.rate_per_minute
+
+    progress = {}
+    try:
+        job = jobs.batch_job_queue.submit(None, batch.precompute_menus, on_progress=progress.update, **options)
+    except jobs.QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    job.progress = progress
+    return job.to_dict()
+
+@app.get("/admin/precompute-menus/{job_id}", response_model=schema.BatchJobResponse,
+         dependencies=[Depends(auth.require_admin)])
+def get_precompute_job(job_id: str):
+    job = jobs.batch_job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job.to_dict()
+
+@app.get("/stats")
+def get_stats():
     return {
-        "menu": menu_result["menu"],
-        "preferences_used": menu_result["preferences_used"],
-        "generated_at": menu_result["generated_at"],
-        "menu_id": new_menu.id
+        "menu_cache": cache.menu_cache.stats(),
+        "auth_cache": auth.principal_cache.stats(),
+        "password_pool": utils.password_pool.stats(),
+        "db_pool": database.pool_status(),
+        "menu_jobs": jobs.menu_job_queue.stats(),
+        "llm_jobs": jobs.llm_job_queue.stats(),
+        "batch_jobs": jobs.batch_job_queue.stats(),
+        "web_tools": web_cache.stats(),
+        "dish_catalog": catalog.dish_catalog.stats(),
+        "grocery": grocery.grocery_index.stats(),
+        "agent": generation.agent_loader.stats(),
+        "admission": admission.stats(),
+        "llm": resilience.stats()
     }
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(agent: bool = False):
+    """Readiness: auth and menu routes need the database; ?agent=true also waits for the LLM agent"""
+    checks = {"database": "ready" if await database.ping_async() else "unavailable",
+              "agent": generation.agent_loader.state}
+    ready = checks["database"] == "ready" and (not agent or generation.agent_loader.ready)
+    return JSONResponse({"status": "ready" if ready else "not_ready", **checks}, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def get_metrics():
+    body, content_type = metrics.latest()
+    return Response(body, headers={"Content-Type": content_type})
+
+@app.on_event("startup")
+def create_schema():
+    # Normally done once per deploy by `python -m migrations`; opt in for local development
+    if database.DB_CREATE_ALL_ON_STARTUP:
+        database.init_db()
+
+@app.on_event("startup")
+def load_discovered_dishes():
+    # Dishes found by earlier agent runs and web searches join the in-memory index
+    catalog.dish_catalog.load()
+
+@app.on_event("startup")
+def warm_up_menu_agent():
+    # LangChain loads in the background, so /login and local menus are served meanwhile
+    if generation.AGENT_WARMUP:
+        generation.agent_loader.warm_up()
+
+@app.on_event("shutdown")
+def shutdown_menu_jobs():
+    jobs.menu_job_queue.shutdown(wait=False)
+    jobs.llm_job_queue.shutdown(wait=False)
+    jobs.batch_job_queue.shutdown(wait=False)
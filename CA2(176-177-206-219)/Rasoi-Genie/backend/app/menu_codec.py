@@ -0,0 +1,102 @@
+# menu_codec.py - compact binary encoding for stored weekly menus
+#
+# A menu {day: {meal: dish}} is stored as its day and meal names plus a
+# day-major grid of dish ids (0 = no dish in that slot), with the names living
+# once in the dishes table. The first byte of the blob names the format so
+# old rows stay readable when the default changes:
+#
+#   0x01  zlib-compressed JSON [days, meals, ids]           (stdlib, default)
+#   0x02  zstd-compressed msgpack [days, meals, ids]        (pip install zstandard msgpack)
+import json
+import os
+import zlib
+from typing import Callable, Dict, List, Sequence
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:  # optional; zlib is always available
+    msgpack = zstandard = None
+
+FORMAT_ZLIB_JSON = 0x01
+FORMAT_ZSTD_MSGPACK = 0x02
+
+FORMATS = {"zlib": FORMAT_ZLIB_JSON, "zstd": FORMAT_ZSTD_MSGPACK}
+
+MENU_BLOB_FORMAT = os.getenv("MENU_BLOB_FORMAT", "zlib")
+
+NO_DISH = 0
+
+
+def default_format() -> int:
+    fmt = FORMATS.get(MENU_BLOB_FORMAT)
+    if fmt is None:
+        print(f"Warning: unknown MENU_BLOB_FORMAT {MENU_BLOB_FORMAT!r}, using zlib")
+        return FORMAT_ZLIB_JSON
+    if fmt == FORMAT_ZSTD_MSGPACK and zstandard is None:
+        print("Warning: MENU_BLOB_FORMAT=zstd needs the zstandard and msgpack packages, using zlib")
+        return FORMAT_ZLIB_JSON
+    return fmt
+
+
+def dish_names(menu: Dict[str, Dict[str, str]]) -> List[str]:
+    """Every distinct dish in a menu, in slot order"""
+    return list(dict.fromkeys(dish for meals in menu.values() for dish in meals.values() if dish))
+
+
+def is_encodable(menu) -> bool:
+    """Only {day: {meal: dish name}} grids are stored as ids"""
+    return isinstance(menu, dict) and all(
+        isinstance(day, str) and isinstance(meals, dict)
+        and all(isinstance(meal, str) and isinstance(dish, str) and dish for meal, dish in meals.items())
+        for day, meals in menu.items()
+    )
+
+
+def encode_menu(menu: Dict[str, Dict[str, str]], dish_ids: Dict[str, int], fmt: int = None) -> bytes:
+    """Encode a menu given the id of every dish in it (see dish_names)"""
+    days = list(menu)
+    meals = list(dict.fromkeys(meal for day_meals in menu.values() for meal in day_meals))
+    ids = [dish_ids[menu[day][meal]] if menu[day].get(meal) else NO_DISH for day in days for meal in meals]
+    payload = [days, meals, ids]
+
+    fmt = BLOB_FORMAT if fmt is None else fmt
+    if fmt == FORMAT_ZSTD_MSGPACK:
+        return bytes([fmt]) + zstandard.ZstdCompressor(level=3).compress(msgpack.packb(payload))
+    return bytes([FORMAT_ZLIB_JSON]) + zlib.compress(json.dumps(payload, separators=(",", ":")).encode())
+
+
+def decode_ids(blob: bytes):
+    """(days, meals, ids) without resolving dish names"""
+    fmt, body = blob[0], blob[1:]
+    if fmt == FORMAT_ZLIB_JSON:
+        days, meals, ids = json.loads(zlib.decompress(body))
+    elif fmt == FORMAT_ZSTD_MSGPACK:
+        if zstandard is None:
+            raise RuntimeError("Menu stored as zstd/msgpack but zstandard and msgpack are not installed")
+        days, meals, ids = msgpack.unpackb(zstandard.ZstdDecompressor().decompress(body))
+    else:
+        raise ValueError(f"Unknown menu blob format 0x{fmt:02x}")
+    return days, meals, ids
+
+
+def decode_menu(blob: bytes, names_for: Callable[[Sequence[int]], Dict[int, str]]) -> Dict[str, Dict[str, str]]:
+    """Decode a blob; names_for maps the ids it contains to dish names"""
+    days, meals, ids = decode_ids(blob)
+    names = names_for([dish_id for dish_id in set(ids) if dish_id != NO_DISH])
+    width = len(meals)
+    return {
+        day: {meal: names[dish_id] for meal, dish_id in zip(meals, ids[row * width:(row + 1) * width]) if dish_id != NO_DISH}
+        for row, day in enumerate(days)
+    }
+
+
+def preview_from_ids(days: Sequence[str], meals: Sequence[str], ids: Sequence[int], names: Dict[int, str]) -> Dict[str, List[str]]:
+    """Day -> dish names straight from a decoded grid (the /menu-history preview shape)"""
+    width = len(meals)
+    return {day: [names[dish_id] for dish_id in ids[row * width:(row + 1) * width] if dish_id != NO_DISH]
+            for row, day in enumerate(days)}
+
+
+# Format new menus are written in
+BLOB_FORMAT = default_format()
@@ -0,0 +1,199 @@
+# metrics.py - Prometheus metrics for the API, database, password hashing and menu generation
+#
+# Served at GET /metrics. Request latency is labelled with the route template
+# ("/menu-jobs/{job_id}"), never the raw path, so ids don't multiply series.
+# /generate-menu is broken down into stages (preference load, job queue wait,
+# generation, save) and each generation into LLM and tool calls. Cache, pool
+# and queue figures come from the stats() the app already keeps, read at
+# scrape time.
+import time
+from typing import Any, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+NAMESPACE = "rasoi"
+
+# Queries and bcrypt; API requests; menu generation (agent runs take minutes)
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+REQUEST_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120)
+SLOW_BUCKETS = (.001, .01, .05, .1, .25, .5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "API request latency by route template",
+    ["method", "route", "status"], namespace=NAMESPACE, buckets=REQUEST_BUCKETS)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Time in cursor.execute, by engine and statement type",
+    ["engine", "statement"], namespace=NAMESPACE, buckets=FAST_BUCKETS)
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "bcrypt time per hash/verify on the password pool",
+    ["operation"], namespace=NAMESPACE, buckets=FAST_BUCKETS)
+PASSWORD_QUEUE_SECONDS = Histogram(
+    "password_queue_wait_seconds", "Time a password operation waited for a pool thread",
+    namespace=NAMESPACE, buckets=FAST_BUCKETS)
+MENU_STAGE_SECONDS = Histogram(
+    "menu_stage_duration_seconds",
+    "Where /generate-menu time goes: load_preferences, queue_wait, agent_slot_wait, generate, save",
+    ["stage"], namespace=NAMESPACE, buckets=SLOW_BUCKETS)
+MENU_GENERATION_SECONDS = Histogram(
+    "menu_generation_duration_seconds", "generation.generate_menu time by mode and outcome",
+    ["mode", "outcome"], namespace=NAMESPACE, buckets=SLOW_BUCKETS)
+MENUS_GENERATED = Counter(
+    "menus_generated", "Menus produced, by mode and outcome (local, cache_hit, llm, fallback, breaker_open)",
+    ["mode", "outcome"], namespace=NAMESPACE)
+GENERATIONS_REJECTED = Counter(
+    "generations_rejected", "LLM-backed generation requests answered 429, by reason (rate_limited, saturated)",
+    ["reason"], namespace=NAMESPACE)
+GENERATIONS_COALESCED = Counter(
+    "generations_coalesced", "Generation requests served by an identical job already in flight", namespace=NAMESPACE)
+LLM_CALL_SECONDS = Histogram(
+    "llm_call_duration_seconds", "Latency of single LLM calls", ["mode"], namespace=NAMESPACE, buckets=SLOW_BUCKETS)
+LLM_TOKENS = Counter(
+    "llm_tokens", "LLM tokens reported by the provider", ["mode", "kind"], namespace=NAMESPACE)
+LLM_CALLS_PER_MENU = Histogram(
+    "llm_calls_per_menu", "LLM calls made to generate one menu", ["mode"], namespace=NAMESPACE,
+    buckets=(0, 1, 2, 3, 4, 6, 8, 10, 12, 15, 20))
+LLM_TOKENS_PER_MENU = Histogram(
+    "llm_tokens_per_menu", "Prompt + completion tokens spent on one menu", ["mode"], namespace=NAMESPACE,
+    buckets=(0, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000))
+LLM_CALL_TIMEOUTS = Counter(
+    "llm_call_timeouts", "LLM calls abandoned after LLM_CALL_TIMEOUT_SECONDS", namespace=NAMESPACE)
+LLM_HEDGES = Counter(
+    "llm_hedges",
+    "Hedged requests to the secondary model: launched, won (answered first), and rate_limited (not sent)",
+    ["outcome"], namespace=NAMESPACE)
+LLM_BREAKER_TRIPS = Counter(
+    "llm_breaker_trips", "Times the LLM circuit breaker opened", namespace=NAMESPACE)
+TOOL_CALL_SECONDS = Histogram(
+    "agent_tool_call_duration_seconds", "Agent tool calls by tool name", ["tool"], namespace=NAMESPACE,
+    buckets=SLOW_BUCKETS)
+
+
+def statement_type(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+class PrometheusMiddleware:
+    """ASGI middleware timing every HTTP request (until the response finishes streaming)"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[Any, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            # The router only records the matched endpoint; map it back to its template
+            self._route_paths = {route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")}
+            path = self._route_paths.get(endpoint, "unmatched")
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(scope["method"], self._route(scope), str(status[0])).observe(time.perf_counter() - start)
+
+
+def record_generation(mode: str, outcome: str, seconds: float):
+    MENUS_GENERATED.labels(mode, outcome).inc()
+    MENU_GENERATION_SECONDS.labels(mode, outcome).observe(seconds)
+
+
+def _cache_counts(stats: Dict[str, Any]) -> Optional[tuple]:
+    """(hits, misses, entries) from a TTLCache/MenuCache or web tool cache stats() dict"""
+    if "fetches" in stats:
+        return stats["calls"] - stats["fetches"], stats["fetches"], stats["memory_size"]
+    return stats["hits"], stats["misses"], stats["size"]
+
+
+class AppStatsCollector:
+    """Cache hit/miss counters, DB pool and job queue gauges, read from stats() at scrape time"""
+
+    def describe(self):
+        # Without this, register() calls collect() right away, importing app modules mid-import
+        return []
+
+    def collect(self):
+        from . import admission, auth, cache, database, grocery, jobs, resilience, utils, web_cache  # these modules import metrics themselves
+
+        hits = CounterMetricFamily(f"{NAMESPACE}_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily(f"{NAMESPACE}_cache_misses", "Cache misses", labels=["cache"])
+        entries = GaugeMetricFamily(f"{NAMESPACE}_cache_entries", "Entries held in process", labels=["cache"])
+        caches = {
+            "menu": cache.menu_cache.stats(),
+            "auth": auth.principal_cache.stats(),
+            "web_search": web_cache.search_cache.stats(),
+            "web_summary": web_cache.summary_cache.stats(),
+            "grocery": grocery.totals_cache.stats(),
+        }
+        for name, stats in caches.items():
+            hit_count, miss_count, size = _cache_counts(stats)
+            hits.add_metric([name], hit_count)
+            misses.add_metric([name], miss_count)
+            entries.add_metric([name], size)
+        yield hits
+        yield misses
+        yield entries
+
+        pool = database.pool_status()
+        checked_out = GaugeMetricFamily(f"{NAMESPACE}_db_pool_checked_out", "Connections in use", labels=["engine"])
+        checked_out.add_metric(["sync"], pool.get("checked_out", 0))
+        checked_out.add_metric(["async"], pool["async"].get("checked_out", 0))
+        yield checked_out
+        timeouts = CounterMetricFamily(f"{NAMESPACE}_db_pool_timeouts", "Pool checkout timeouts", labels=["engine"])
+        timeouts.add_metric(["sync"], pool["timeouts"])
+        timeouts.add_metric(["async"], pool["async"]["timeouts"])
+        yield timeouts
+
+        menu_jobs = GaugeMetricFamily(f"{NAMESPACE}_menu_jobs", "Jobs held by each job queue",
+                                      labels=["queue", "status"])
+        for queue in (jobs.menu_job_queue, jobs.llm_job_queue, jobs.batch_job_queue):
+            queue_stats = queue.stats()
+            for status in ("queued", "running", "completed", "failed"):
+                menu_jobs.add_metric([queue.name, status], queue_stats[status])
+        yield menu_jobs
+
+        budget = admission.agent_budget.stats()
+        generations = GaugeMetricFamily(f"{NAMESPACE}_llm_generations", "LLM-backed generations admitted / running",
+                                        labels=["state"])
+        generations.add_metric(["admitted"], budget["admitted"])
+        generations.add_metric(["running"], budget["running"])
+        yield generations
+
+        breaker = resilience.llm_breaker.stats()
+        state = GaugeMetricFamily(f"{NAMESPACE}_llm_breaker_state", "1 for the LLM circuit breaker's current state",
+                                  labels=["state"])
+        for name in ("closed", "open", "half_open"):
+            state.add_metric([name], 1 if breaker["state"] == name else 0)
+        yield state
+        yield CounterMetricFamily(f"{NAMESPACE}_llm_breaker_short_circuited",
+                                  "Generations planned locally because the breaker was open", value=breaker["short_circuited"])
+
+        passwords = utils.password_pool.stats()
+        yield GaugeMetricFamily(f"{NAMESPACE}_password_pool_in_flight", "Password operations queued or running",
+                                value=passwords["in_flight"])
+        yield CounterMetricFamily(f"{NAMESPACE}_password_pool_rejected", "Password operations rejected as busy",
+                                  value=passwords["rejected"])
+
+
+REGISTRY.register(AppStatsCollector())
+
+
+def latest() -> tuple:
+    """(body, content type) for the /metrics response"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,5 +1,5 @@
 # models.py - CORRECTED VERSION
-from sqlalchemy import Column, ForeignKey, Integer, String, Text
+from sqlalchemy import Column, ForeignKey, Index, Integer, LargeBinary, String, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -19,22 +19,105 @@ class Preference(Base):  # Changed from UserPreferences to match main.py
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True)
 
-    diet_type = Column(String(50))  # veg/non-veg/vegan
-    cuisine = Column(String(200))  # comma-separated values
-    meals = Column(String(100))  # breakfast,lunch,snacks,dinner
+    diet_type = Column(String(50), index=True)  # veg/non-veg/vegan
     cooking_time = Column(String(20))  # Changed from cook_time to cooking_time
-    health_conditions = Column(String(100))  # comma-separated: diabetes,etc
 
     user = relationship("User", back_populates="preference")  # Changed from preferences
+    # cuisine / meals / health_conditions, one row per value; loaded with the preference
+    items = relationship("PreferenceItem", back_populates="preference", cascade="all, delete-orphan",
+                         order_by="PreferenceItem.position", lazy="selectin")
+
+    def values(self, category):
+        return [item.value for item in self.items if item.category == category]
+
+    @property
+    def cuisine(self):
+        return self.values("cuisine")
+
+    @property
+    def meals(self):
+        return self.values("meals")
+
+    @property
+    def health_conditions(self):
+        return self.values("health_conditions")
+
+class PreferenceItem(Base):
+    __tablename__ = 'preference_items'
+
+    CATEGORIES = ("cuisine", "meals", "health_conditions")
+
+    id = Column(Integer, primary_key=True)
+    preference_id = Column(Integer, ForeignKey("preferences.id", ondelete="CASCADE"), nullable=False)
+    category = Column(String(20), nullable=False)  # one of CATEGORIES
+    value = Column(String(50), nullable=False)  # as sent by the frontend, e.g. north-indian
+    position = Column(Integer, nullable=False, default=0)  # keeps the user's order (meals order the menu)
+
+    preference = relationship("Preference", back_populates="items")
+
+    __table_args__ = (
+        UniqueConstraint("preference_id", "category", "value", name="uq_preference_items_value"),
+        # Cohort lookups ("diabetes + gujarati") read only this index
+        Index("ix_preference_items_lookup", "category", "value", "preference_id"),
+    )
+
+# LLM and web dish names are unbounded; longer ones are never stored in dishes
+DISH_NAME_MAX_LENGTH = 200
+
+class Dish(Base):
+    __tablename__ = 'dishes'
+
+    # Stored menus reference dishes by id (see menu_codec)
+    id = Column(Integer, primary_key=True)
+    name = Column(String(DISH_NAME_MAX_LENGTH), unique=True, nullable=False)
+    nutrition_mask = Column(Integer)  # NUTRITIONAL_BALANCE category bits, set for discovered dishes
+
+class DishSlot(Base):
+    __tablename__ = 'dish_slots'
+
+    # Where a discovered dish fits in the catalog (see catalog.py)
+    id = Column(Integer, primary_key=True)
+    dish_id = Column(Integer, ForeignKey("dishes.id"), nullable=False)
+    cuisine = Column(String(50), nullable=False)
+    meal = Column(String(50), nullable=False)
+    diet = Column(String(20), nullable=False)
+    source = Column(String(20), nullable=False)  # "agent" (picked for a menu) or "web" (found in search text)
+    sightings = Column(Integer, nullable=False, default=0)
+    first_seen = Column(String(50))  # ISO format datetime
+    last_seen = Column(String(50))
+
+    dish = relationship("Dish")
+
+    __table_args__ = (
+        UniqueConstraint("dish_id", "cuisine", "meal", "diet", name="uq_dish_slots_slot"),
+    )
+
+class PreferenceSnapshot(Base):
+    __tablename__ = 'preference_snapshots'
+
+    # The preferences a menu was generated from, stored once per distinct dict
+    id = Column(Integer, primary_key=True)
+    digest = Column(String(64), unique=True, nullable=False)  # sha256 of the canonical JSON
+    data = Column(Text, nullable=False)
 
 class WeeklyMenu(Base):
     __tablename__ = 'weekly_menus'
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    menu_data = Column(Text)  # JSON string of the menu
-    generation_prompt = Column(Text)  # JSON string of preferences used
+    menu_data = Column(Text)  # legacy JSON string of the menu; new rows use menu_blob
+    generation_prompt = Column(Text)  # legacy JSON string of preferences used; new rows use snapshot_id
+    menu_blob = Column(LargeBinary)  # menu_codec encoded dish ids
+    snapshot_id = Column(Integer, ForeignKey("preference_snapshots.id"))
     created_at = Column(String(50))  # ISO format datetime
     is_active = Column(Integer, default=1)  # Using Integer instead of Boolean for MySQL compatibility
+    menu_preview = Column(Text)  # JSON {day: [dishes]} precomputed for /menu-history
+    grocery_data = Column(Text)  # JSON per-serving grocery totals (grocery.menu_totals), filled on save or first request
     
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+    __table_args__ = (
+        # History is keyset-paginated on id (insertion order == creation order) within a user
+        Index("ix_weekly_menus_user_id_id", "user_id", "id"),
+        Index("ix_weekly_menus_user_active", "user_id", "is_active"),
+    )
@@ -0,0 +1,125 @@
+# nutrition.py - vectorized nutritional balance scoring
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .dishes import DISH_INDEX, IndianMenuDatabase
+
+# Bit per NUTRITIONAL_BALANCE category, in declaration order
+CATEGORIES = tuple(IndianMenuDatabase.NUTRITIONAL_BALANCE)
+CATEGORY_BITS = {category: np.uint8(1 << i) for i, category in enumerate(CATEGORIES)}
+
+
+def dish_features(dish: str) -> int:
+    """Bitmask of the NUTRITIONAL_BALANCE categories whose keywords appear in the dish name"""
+    mask = 0
+    for i, keywords in enumerate(IndianMenuDatabase.NUTRITIONAL_BALANCE.values()):
+        if any(keyword in dish for keyword in keywords):
+            mask |= 1 << i
+    return mask
+
+
+class NutritionScorer:
+    """Scores weeks of dishes from a precomputed dish -> category bitset table.
+
+    Every catalog dish name is mapped to a small integer id once; a batch of
+    weeks then becomes an (n_weeks, n_dishes) id matrix and every rule in
+    check_nutritional_balance is a column-wise reduction over it. Dishes the
+    table doesn't know (e.g. invented by the LLM) are featurized per batch and
+    get ids past the end of the table, so arbitrary names never grow it.
+    """
+
+    PAD = 0  # id 0 is reserved for padding ragged weeks
+
+    def __init__(self, dishes: Sequence[str] = ()):
+        names = list(dict.fromkeys(dishes))
+        self._ids: Dict[str, int] = {dish: i + 1 for i, dish in enumerate(names)}
+        self._masks = np.concatenate([np.zeros(1, dtype=np.uint8),
+                                      np.fromiter((dish_features(dish) for dish in names), dtype=np.uint8, count=len(names))])
+
+    def encode(self, weeks: Sequence[Sequence[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(id matrix right-padded with PAD, mask per id) for a batch of weeks"""
+        extra: Dict[str, int] = {}
+        width = max((len(week) for week in weeks), default=0)
+        ids = np.full((len(weeks), width), self.PAD, dtype=np.int32)
+        for row, week in enumerate(weeks):
+            row_ids = []
+            for dish in week:
+                dish_id = self._ids.get(dish)
+                if dish_id is None:
+                    dish_id = extra.setdefault(dish, len(self._masks) + len(extra))
+                row_ids.append(dish_id)
+            ids[row, :len(week)] = row_ids
+        if not extra:
+            return ids, self._masks
+        masks = np.fromiter((dish_features(dish) for dish in extra), dtype=np.uint8, count=len(extra))
+        return ids, np.concatenate([self._masks, masks])
+
+    def score_ids(self, encoded: Tuple[np.ndarray, np.ndarray], health_conditions: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Raw per-week rule outcomes for a batch from encode()"""
+        ids, table = encoded
+        masks = table[ids]
+        valid = ids != self.PAD
+        counts = valid.sum(axis=1)
+
+        def category_count(category):
+            return ((masks & CATEGORY_BITS[category]) != 0).sum(axis=1)
+
+        ordered = np.sort(ids, axis=1)
+        has_repeat = ((ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] != self.PAD)).any(axis=1)
+
+        protein_count = category_count("high_protein")
+        fiber_count = category_count("high_fiber")
+        diabetic_count = category_count("diabetic_friendly")
+        protein_ok = protein_count >= 2
+        fiber_ok = fiber_count >= 3
+        variety_ok = ~has_repeat
+        if "diabetes" in health_conditions:
+            diabetic_ok = diabetic_count >= counts * 0.6
+        else:
+            diabetic_ok = np.ones(len(ids), dtype=bool)
+
+        balance_score = 25 * (protein_ok.astype(np.int32) + fiber_ok + variety_ok + diabetic_ok)
+        return {
+            "balance_score": balance_score,
+            "protein_count": protein_count,
+            "fiber_count": fiber_count,
+            "diabetic_count": diabetic_count,
+            "protein_ok": protein_ok,
+            "fiber_ok": fiber_ok,
+            "variety_ok": variety_ok,
+            "diabetic_ok": diabetic_ok
+        }
+
+    def score_weeks(self, weeks: Sequence[Sequence[str]], health_conditions: Sequence[str]) -> List[Dict[str, Any]]:
+        """Batch version of check_nutritional_balance, same result structure per week"""
+        if not weeks:
+            return []
+        raw = self.score_ids(self.encode(weeks), health_conditions)
+        diabetes = "diabetes" in health_conditions
+
+        results = []
+        for i in range(len(weeks)):
+            recommendations = []
+            if not raw["protein_ok"][i]:
+                recommendations.append("Add more protein sources like Dal, Paneer, or Chicken")
+            if not raw["fiber_ok"][i]:
+                recommendations.append("Include more vegetables like Bhindi, Palak, or Mixed Vegetables")
+            if not raw["variety_ok"][i]:
+                recommendations.append("Ensure variety - avoid repeating similar dishes")
+            if diabetes and not raw["diabetic_ok"][i]:
+                recommendations.append("Choose more diabetic-friendly options like Dal and Vegetables")
+
+            balance_score = int(raw["balance_score"][i])
+            results.append({
+                "balance_score": balance_score,
+                "recommendations": recommendations,
+                "is_balanced": balance_score >= 75
+            })
+        return results
+
+    def score_week(self, dishes: Sequence[str], health_conditions: Sequence[str]) -> Dict[str, Any]:
+        return self.score_weeks([list(dishes)], health_conditions)[0]
+
+
+nutrition_scorer = NutritionScorer(DISH_INDEX.dishes)
@@ -0,0 +1,191 @@
+# planner.py - deterministic local menu planner (no LLM round-trip)
+import hashlib
+import os
+import random
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .dishes import DISH_INDEX, IndianMenuDatabase
+from .cache import normalize_preferences, preference_key
+from .nutrition import CATEGORY_BITS, dish_features, nutrition_scorer
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+DEFAULT_MEALS = ["breakfast", "lunch", "dinner"]
+
+# Number of candidate weeks sampled and batch-scored per plan
+PLANNER_CANDIDATES = int(os.getenv("PLANNER_CANDIDATES", 64))
+
+# Dishes from these diets are acceptable for a preference, best match first
+COMPATIBLE_DIETS = {
+    "veg": ("veg", "vegan"),
+    "vegan": ("vegan",),
+    "non_veg": ("non_veg", "veg", "vegan"),
+}
+
+# Dishes to leave out for a health condition whenever enough alternatives remain
+HEALTH_CONDITION_AVOID = {
+    "bp": ("Fry", "Fried", "Pakora", "Pickle", "Chips", "Papad", "Samosa"),
+    "cholesterol": ("Fry", "Fried", "Butter", "Makhani", "Malai", "Pakora", "Samosa", "Bhature",
+                    "Kachori", "Bhaja", "Beguni", "Jalebi", "Keema", "Mutton", "Lamb"),
+}
+
+
+def _normalize_key(value: str) -> str:
+    # The frontend sends "north-indian"/"non-veg"; the catalog uses underscores
+    return value.strip().lower().replace("-", "_").replace(" ", "_")
+
+
+class Candidate(NamedTuple):
+    dish: str
+    weight: float
+
+
+class LocalMenuPlanner:
+    """Fills a week from IndianMenuDatabase without calling the LLM.
+
+    Hard constraints: dishes come from the user's cuisines and compatible diets,
+    and no dish repeats anywhere in the week while the catalog has enough
+    variety. Soft constraints (health conditions, preferring the exact diet,
+    nutritional balance) are handled by weighted sampling of many candidate
+    weeks which are then scored in one vectorized pass with the same rules as
+    check_nutritional_balance; the best week wins.
+
+    The random stream is seeded from the normalized preferences, so the same
+    preferences always produce the same menu unless a seed is given.
+    """
+
+    def __init__(self, candidates: int = PLANNER_CANDIDATES):
+        self.candidates = candidates
+
+    def _resolve(self, preferences: Dict[str, Any]) -> Tuple[str, Tuple[str, ...], List[str], List[str]]:
+        normalized = normalize_preferences(preferences)
+        diet_type = _normalize_key(normalized["diet_type"]) or "veg"
+        if diet_type not in COMPATIBLE_DIETS:
+            diet_type = "veg"
+
+        known_cuisines = IndianMenuDatabase.DISHES.keys()
+        cuisines = tuple(c for c in (_normalize_key(c) for c in preferences.get("cuisine") or []) if c in known_cuisines)
+        if not cuisines:
+            cuisines = tuple(known_cuisines)
+
+        meals = [m for m in (_normalize_key(m) for m in preferences.get("meals") or []) if m]
+        meals = list(dict.fromkeys(meals)) or DEFAULT_MEALS
+        health_conditions = [_normalize_key(h) for h in normalized["health_conditions"]]
+        return diet_type, cuisines, meals, health_conditions
+
+    def candidates_for(self, meal: str, diet_type: str, cuisines: Tuple[str, ...], health_conditions: Sequence[str]) -> List[Candidate]:
+        """Weighted dish candidates for one meal slot"""
+        weights: Dict[str, float] = {}
+        for rank, diet in enumerate(COMPATIBLE_DIETS[diet_type]):
+            for dish in DISH_INDEX.pool(cuisines, meal, diet):
+                if dish not in weights:
+                    weights[dish] = 4.0 if rank == 0 else 1.0
+
+        avoid = tuple(word for condition in health_conditions for word in HEALTH_CONDITION_AVOID.get(condition, ()))
+        if avoid:
+            allowed = {dish: w for dish, w in weights.items() if not any(word in dish for word in avoid)}
+            if len(allowed) >= len(DAYS):
+                weights = allowed
+
+        for dish in weights:
+            mask = dish_features(dish)
+            if "diabetes" in health_conditions and mask & CATEGORY_BITS["diabetic_friendly"]:
+                weights[dish] *= 3.0
+            if avoid and mask & CATEGORY_BITS["low_oil"]:
+                weights[dish] *= 2.0
+            if mask & (CATEGORY_BITS["high_protein"] | CATEGORY_BITS["high_fiber"]):
+                weights[dish] *= 1.5
+        return [Candidate(dish, weight) for dish, weight in weights.items()]
+
+    def slot_candidates(self, preferences: Dict[str, Any]) -> Dict[str, List[Candidate]]:
+        """Weighted candidates for every meal in the preferences, keyed by normalized meal name"""
+        diet_type, cuisines, meals, health_conditions = self._resolve(preferences)
+        return {meal: self.candidates_for(meal, diet_type, cuisines, health_conditions) for meal in meals}
+
+    def _sample_week(self, rng: random.Random, slots: Dict[str, List[Candidate]], meals: List[str]) -> Dict[str, List[str]]:
+        used = set()
+        week = {}
+        for meal in meals:
+            # Weighted sampling without replacement (Efraimidis-Spirakis keys)
+            ranked = sorted(slots[meal], key=lambda c: rng.random() ** (1.0 / c.weight), reverse=True)
+            picks = [c.dish for c in ranked if c.dish not in used][:len(DAYS)]
+            if not picks:
+                picks = [c.dish for c in ranked[:len(DAYS)]]
+            if not picks:
+                picks = [f"Simple {meal.title()}"]
+            # Not enough distinct dishes: cycle through the picks rather than invent placeholders
+            picks = [picks[i % len(picks)] for i in range(len(DAYS))]
+            used.update(picks)
+            week[meal] = picks
+        return week
+
+    def plan(self, preferences: Dict[str, Any], seed: Optional[int] = None,
+             on_slot: Optional[Callable[[str, str, str], None]] = None) -> Dict[str, Any]:
+        """Build a full weekly menu in the same shape generate_weekly_menu returns"""
+        diet_type, cuisines, meals, health_conditions = self._resolve(preferences)
+        if seed is None:
+            seed = int(hashlib.sha256(preference_key(preferences, "planner").encode()).hexdigest()[:16], 16)
+        rng = random.Random(seed)
+
+        slots = {meal: self.candidates_for(meal, diet_type, cuisines, health_conditions) for meal in meals}
+        weeks = [self._sample_week(rng, slots, meals) for _ in range(max(1, self.candidates))]
+
+        flat = [[dish for meal in meals for dish in week[meal]] for week in weeks]
+        raw = nutrition_scorer.score_ids(nutrition_scorer.encode(flat), health_conditions)
+        primary = set(d for c in cuisines for meal in meals for d in DISH_INDEX.lookup(c, meal, diet_type))
+        diet_match = np.array([sum(dish in primary for dish in week) for week in flat])
+        objective = (raw["balance_score"] * 1000
+                     + (raw["protein_count"] + raw["fiber_count"]) * 10
+                     + raw["diabetic_count"] * (10 if "diabetes" in health_conditions else 0)
+                     + diet_match)
+        best_index = int(np.argmax(objective))
+        best = weeks[best_index]
+
+        menu = {}
+        for i, day in enumerate(DAYS):
+            menu[day] = {}
+            for meal in meals:
+                menu[day][meal] = best[meal][i]
+                if on_slot:
+                    on_slot(day, meal, best[meal][i])
+
+        return {
+            "menu": menu,
+            "preferences_used": preferences,
+            "generated_at": datetime.now().isoformat(),
+            "generation_mode": "local",
+            "nutrition": nutrition_scorer.score_week(flat[best_index], health_conditions)
+        }
+
+
+    def replace_slot(self, menu: Dict[str, Dict[str, str]], day: str, meal: str,
+                     preferences: Dict[str, Any], seed: Optional[int] = None) -> str:
+        """Pick a new dish for one (day, meal) slot without repeating anything else in the week.
+
+        Every eligible swap is scored in a single batch so the replacement keeps
+        the week as balanced as possible; ties are broken by the sampling weights.
+        """
+        diet_type, cuisines, _, health_conditions = self._resolve(preferences)
+        rng = random.Random(seed)
+
+        current = menu[day][meal]
+        rest_of_week = [dish for d, meals in menu.items() for m, dish in meals.items() if (d, m) != (day, meal)]
+        taken = set(rest_of_week) | {current}
+
+        options = [c for c in self.candidates_for(_normalize_key(meal), diet_type, cuisines, health_conditions) if c.dish not in taken]
+        if not options:
+            # Every catalog dish for this slot is already in the week; widen to all cuisines
+            options = [c for c in self.candidates_for(_normalize_key(meal), diet_type, tuple(IndianMenuDatabase.DISHES), health_conditions)
+                       if c.dish not in taken]
+        if not options:
+            return current
+
+        raw = nutrition_scorer.score_ids(nutrition_scorer.encode([rest_of_week + [c.dish] for c in options]), health_conditions)
+        tiebreak = np.array([rng.random() ** (1.0 / c.weight) for c in options])
+        objective = raw["balance_score"] * 1000 + (raw["protein_count"] + raw["fiber_count"]) * 10 + tiebreak
+        return options[int(np.argmax(objective))].dish
+
+
+menu_planner = LocalMenuPlanner()
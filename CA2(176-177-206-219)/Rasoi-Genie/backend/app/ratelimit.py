@@ -0,0 +1,62 @@
+# ratelimit.py - token bucket for pacing calls to the LLM provider
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket: refills at `rate` tokens per second up to `capacity`.
+
+    A rate of 0 disables limiting (every acquire succeeds immediately).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens if available; otherwise return the seconds until they will be"""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """Block until tokens are available; False if that would take longer than timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+            with self._lock:
+                self.waited_seconds += wait
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self.enabled:
+                self._refill()
+            return {
+                "rate_per_second": self.rate,
+                "capacity": self.capacity,
+                "available": round(self._tokens, 3),
+                "waited_seconds": round(self.waited_seconds, 3)
+            }
@@ -0,0 +1,221 @@
+# resilience.py - LLM call deadlines, hedged requests and a circuit breaker around the provider
+#
+# Every LLM call goes through call_with_deadline (via agents.ResilientChatModel):
+# it runs on a small thread pool, is abandoned after LLM_CALL_TIMEOUT_SECONDS
+# and, when a secondary model is configured (LLM_HEDGE_MODEL), is raced against
+# a copy sent to it once the primary has taken LLM_HEDGE_AFTER_SECONDS.
+# llm_breaker watches the outcome and latency of those calls; when the error
+# rate or p95 latency over the last LLM_BREAKER_WINDOW calls crosses its
+# threshold it opens, and generation.generate_menu plans menus locally until
+# a probe after LLM_BREAKER_COOLDOWN_SECONDS succeeds. A generation run inside
+# paced_by(limiter) takes one token from limiter per call it sends. No LangChain
+# imports here, so /stats and /metrics can read the breaker without loading the agent.
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import metrics
+from .ratelimit import TokenBucket
+
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", 30))
+# Agent runs stop taking new steps after this long and fall back (a call in progress still gets its timeout)
+LLM_RUN_DEADLINE_SECONDS = float(os.getenv("LLM_RUN_DEADLINE_SECONDS", 120))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 1))
+LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL")  # unset: no hedging
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", 8))
+LLM_CALL_THREADS = int(os.getenv("LLM_CALL_THREADS", 16))
+
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", 20))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", 5))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", 0.5))
+LLM_BREAKER_P95_SECONDS = float(os.getenv("LLM_BREAKER_P95_SECONDS", 20))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", 60))
+
+
+# The probe token allow() handed to this generation, if it is the half_open probe
+_probe_token: "ContextVar[Optional[object]]" = ContextVar("llm_breaker_probe", default=None)
+
+
+class LLMTimeout(Exception):
+    """Raised when no LLM reply (primary or hedge) arrived within the call timeout"""
+
+
+class CircuitBreaker:
+    """closed -> open when the recent error rate or p95 latency is too high -> half_open after cooldown.
+
+    In half_open one probe generation is let through per cooldown; its first
+    LLM call closes the breaker (and clears the window) if it succeeds within
+    p95_seconds, or opens it again. Calls from other generations (stragglers
+    from before the trip) don't count while half_open. The probe is told apart
+    by a token that allow() leaves in the calling thread's context, which is
+    where the generation then makes its calls.
+    """
+
+    def __init__(self, window: int, min_calls: int, error_rate: float, p95_seconds: float, cooldown: float):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.p95_seconds = p95_seconds
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.trips = 0
+        self.short_circuited = 0
+        self.last_trip_reason: Optional[str] = None
+        self._calls: "deque[Tuple[bool, float]]" = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe: Optional[object] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a generation may call the LLM now (False: use the local planner)"""
+        with self._lock:
+            _probe_token.set(None)
+            if self.state == "closed":
+                return True
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                # Let one probe through; the next one waits another cooldown unless this one reports back
+                self.state = "half_open"
+                self._opened_at = time.monotonic()
+                self._probe = object()
+                _probe_token.set(self._probe)
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record(self, ok: bool, seconds: float):
+        with self._lock:
+            if self.state == "half_open":
+                if _probe_token.get() is not self._probe:
+                    return
+                self._probe = None
+                if ok and seconds < self.p95_seconds:
+                    self._calls.clear()
+                    self.state = "closed"
+                else:
+                    self._trip("probe failed" if not ok else f"probe took {seconds:.1f}s")
+                return
+            self._calls.append((ok, seconds))
+            if self.state == "closed" and len(self._calls) >= self.min_calls:
+                reason = self._unhealthy()
+                if reason:
+                    self._trip(reason)
+
+    def _unhealthy(self) -> Optional[str]:
+        errors = sum(1 for ok, _ in self._calls if not ok)
+        if errors / len(self._calls) >= self.error_rate:
+            return f"error rate {errors}/{len(self._calls)}"
+        p95 = self._p95()
+        if p95 >= self.p95_seconds:
+            return f"p95 latency {p95:.1f}s"
+        return None
+
+    def _p95(self) -> float:
+        latencies = sorted(seconds for _, seconds in self._calls)
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else 0.0
+
+    def _trip(self, reason: str):
+        self._opened_at = time.monotonic()
+        self.trips += 1
+        self.last_trip_reason = reason
+        metrics.LLM_BREAKER_TRIPS.inc()
+        self.state = "open"
+        print(f"Warning: LLM circuit breaker open ({reason}), planning menus locally for {self.cooldown:.0f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            errors = sum(1 for ok, _ in self._calls if not ok)
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "short_circuited": self.short_circuited,
+                "last_trip_reason": self.last_trip_reason,
+                "window_calls": len(self._calls),
+                "window_errors": errors,
+                "window_p95_seconds": round(self._p95(), 3),
+                "cooldown_seconds": self.cooldown
+            }
+
+
+llm_breaker = CircuitBreaker(LLM_BREAKER_WINDOW, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_ERROR_RATE,
+                             LLM_BREAKER_P95_SECONDS, LLM_BREAKER_COOLDOWN_SECONDS)
+
+# Abandoned (timed out or out-raced) calls finish here in the background instead of on a job worker
+_call_pool = ThreadPoolExecutor(max_workers=LLM_CALL_THREADS, thread_name_prefix="llm-call")
+
+# Set by paced_by() for the thread running a generation; the agent makes its calls on that thread
+_call_limiter: "ContextVar[Optional[TokenBucket]]" = ContextVar("llm_call_limiter", default=None)
+
+
+@contextmanager
+def paced_by(limiter: Optional[TokenBucket]):
+    """Make every call_with_deadline() inside the block take a token from limiter first"""
+    token = _call_limiter.set(limiter)
+    try:
+        yield
+    finally:
+        _call_limiter.reset(token)
+
+
+def call_with_deadline(primary: Callable[[], Any], timeout: float = LLM_CALL_TIMEOUT_SECONDS,
+                       hedge: Optional[Callable[[], Any]] = None,
+                       hedge_after: float = LLM_HEDGE_AFTER_SECONDS) -> Any:
+    """primary(), or hedge() if that answers first, within timeout seconds.
+
+    hedge is started once primary has run for hedge_after seconds, or straight
+    away if primary fails first. The outcome is recorded on llm_breaker. Under
+    paced_by(limiter), primary waits for a token and hedge is only sent if one
+    is free right then.
+    """
+    limiter = _call_limiter.get()
+    if limiter:
+        limiter.acquire()
+    start = time.monotonic()
+    pending = {_call_pool.submit(primary): "primary"}
+    hedged = hedge is None
+    error: Optional[BaseException] = None
+    try:
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= timeout:
+                metrics.LLM_CALL_TIMEOUTS.inc()
+                raise LLMTimeout(f"No LLM reply within {timeout:g}s")
+            if not hedged and (elapsed >= hedge_after or not pending):
+                hedged = True
+                if limiter and limiter.try_acquire():
+                    metrics.LLM_HEDGES.labels("rate_limited").inc()
+                else:
+                    pending[_call_pool.submit(hedge)] = "hedge"
+                    metrics.LLM_HEDGES.labels("launched").inc()
+            if not pending:
+                raise error
+            wait_for = timeout - elapsed if hedged else min(timeout, hedge_after) - elapsed
+            done, _ = wait(pending, timeout=max(0.0, wait_for), return_when=FIRST_COMPLETED)
+            for future in done:
+                which = pending.pop(future)
+                if future.exception() is None:
+                    if which == "hedge":
+                        metrics.LLM_HEDGES.labels("won").inc()
+                    llm_breaker.record(True, time.monotonic() - start)
+                    return future.result()
+                error = future.exception()
+    except BaseException:
+        llm_breaker.record(False, time.monotonic() - start)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()  # only stops calls still queued for a thread
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "breaker": llm_breaker.stats(),
+        "call_timeout_seconds": LLM_CALL_TIMEOUT_SECONDS,
+        "run_deadline_seconds": LLM_RUN_DEADLINE_SECONDS,
+        "hedge_model": LLM_HEDGE_MODEL,
+        "hedge_after_seconds": LLM_HEDGE_AFTER_SECONDS if LLM_HEDGE_MODEL else None
+    }
@@ -28,6 +28,8 @@ class PreferenceResponse(PreferenceCreate):  # Renamed from PreferencesResponse
 
 class MenuGenerateRequest(BaseModel):
     regenerate_meal: Optional[str] = None  # Optional: specific meal to regenerate like "Monday-lunch"
+    force_fresh: bool = False  # Skip the preference-keyed menu cache and run the agent
+    generation_mode: Optional[str] = None  # "local" (planner, no LLM), "agent" or "structured"; server default if unset
 
 class MenuResponse(BaseModel):
     menu: Dict[str, Dict[str, str]]
@@ -47,4 +49,42 @@ class MenuHistoryItem(BaseModel):
     menu_preview: Dict[str, List[str]]
 
 class MenuHistoryResponse(BaseModel):
-    menus: List[MenuHistoryItem]
\ No newline at end of file
+    menus: List[MenuHistoryItem]
+    next_cursor: Optional[int] = None  # pass as before_id to fetch the next (older) page
+
+class GroceryItem(BaseModel):
+    item: str
+    quantity: float
+    unit: str  # g/kg, ml/l or pcs
+
+class GroceryListResponse(BaseModel):
+    menu_ids: List[int]
+    servings: int
+    weeks: int
+    categories: Dict[str, List[GroceryItem]]  # vegetables, grains_pulses, dairy_proteins, spices_condiments, others
+    unmatched_dishes: List[str] = []  # dishes no ingredient rule knows (e.g. LLM-invented)
+
+class MenuJobResponse(BaseModel):
+    job_id: str
+    status: str  # queued/running/completed/failed
+    created_at: str
+    finished_at: Optional[str] = None
+    result: Optional[MenuResponse] = None
+    error: Optional[str] = None
+
+class PrecomputeRequest(BaseModel):
+    generation_mode: Optional[str] = None  # server default if unset
+    user_ids: Optional[List[int]] = None  # all users with preferences if unset
+    concurrency: Optional[int] = None  # BATCH_CONCURRENCY if unset
+    rate_per_minute: Optional[float] = None  # BATCH_LLM_RATE_PER_MINUTE if unset; 0 = unlimited
+    force_fresh: bool = False
+    seed: Optional[int] = None  # local mode: random per run if unset, or a previous run's seed to repeat it
+
+class BatchJobResponse(BaseModel):
+    job_id: str
+    status: str  # queued/running/completed/failed
+    created_at: str
+    finished_at: Optional[str] = None
+    progress: Optional[Dict[str, Any]] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
@@ -1,8 +1,21 @@
 # utils.py - CREATE THIS FILE
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
 from passlib.context import CryptContext
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from . import metrics
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+# Password hashing context; hashes made with a different cost are rehashed on login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def hash_password(password: str) -> str:
     """Hash a password"""
@@ -10,4 +23,91 @@ def hash_password(password: str) -> str:
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also returns a new hash if the stored one needs upgrading (e.g. cost changed)"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the password pool already has PASSWORD_HASH_MAX_QUEUE jobs waiting or running"""
+
+
+class PasswordHasherPool:
+    """Dedicated, bounded thread pool for bcrypt work.
+
+    bcrypt releases the GIL while hashing, so a couple of threads keep a
+    login burst off the request threadpool (and off the menu/preference
+    endpoints) while the admission cap keeps the backlog from growing without
+    bound.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.run_time_total = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy("Too many password operations in progress")
+
+        submitted_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished_at = time.perf_counter()
+                metrics.PASSWORD_QUEUE_SECONDS.observe(started_at - submitted_at)
+                metrics.PASSWORD_HASH_SECONDS.labels(fn.__name__).observe(finished_at - started_at)
+                with self._lock:
+                    queued = started_at - submitted_at
+                    self.queue_time_total += queued
+                    self.queue_time_max = max(self.queue_time_max, queued)
+                    self.run_time_total += finished_at - started_at
+                    self.completed += 1
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return await asyncio.wrap_future(self._executor.submit(task))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self.run(verify_and_update_password, plain_password, hashed_password)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self.completed
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "completed": completed,
+                "rejected": self.rejected,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "avg_queue_ms": round(self.queue_time_total / completed * 1000, 2) if completed else 0.0,
+                "max_queue_ms": round(self.queue_time_max * 1000, 2),
+                "avg_hash_ms": round(self.run_time_total / completed * 1000, 2) if completed else 0.0
+            }
+
+
+password_pool = PasswordHasherPool(workers=PASSWORD_HASH_WORKERS, max_queue=PASSWORD_HASH_MAX_QUEUE)
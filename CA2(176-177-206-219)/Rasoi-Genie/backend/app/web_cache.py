@@ -0,0 +1,234 @@
+# web_cache.py - persistent cache for the agent's web tools (search and URL summaries)
+#
+# Queries like "latest Punjabi breakfast dishes" repeat across users, and every
+# miss is a network fetch (plus an LLM call for summaries). Results are kept in
+# an in-process LRU in front of a small SQLite file that survives restarts,
+# keyed by the normalized query or URL and expired after a per-tool TTL.
+# Concurrent callers asking for the same key share a single fetch.
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .cache import TTLCache
+
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", "web_tool_cache.db")  # empty = memory only
+WEB_CACHE_MAX_ENTRIES = int(os.getenv("WEB_CACHE_MAX_ENTRIES", 20000))
+WEB_CACHE_MEMORY_ENTRIES = int(os.getenv("WEB_CACHE_MEMORY_ENTRIES", 512))
+WEB_SEARCH_TTL_SECONDS = int(os.getenv("WEB_SEARCH_TTL_SECONDS", 24 * 60 * 60))
+WEB_SUMMARY_TTL_SECONDS = int(os.getenv("WEB_SUMMARY_TTL_SECONDS", 7 * 24 * 60 * 60))
+
+# Expired rows are purged (and the size cap enforced) every this many writes
+PURGE_EVERY_WRITES = 100
+
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace, surrounding quotes and trailing punctuation don't change a search"""
+    query = re.sub(r"\s+", " ", str(query)).strip().strip("\"'").strip()
+    return query.rstrip("?.!").lower()
+
+
+def normalize_url(url: str) -> str:
+    """Lower-case scheme and host, no fragment, trailing slash or utm_* parameters, sorted query"""
+    parts = urlsplit(str(url).strip())
+    params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.lower().startswith("utm_"))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(params), ""))
+
+
+class WebCacheStore:
+    """SQLite table of (key, value, expires_at), shared by every tool cache.
+
+    Uses wall-clock expiry so entries stay valid across restarts. One
+    connection guarded by a lock is plenty for the handful of writes per agent run.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.errors = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS web_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, created_at REAL NOT NULL)")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS ix_web_cache_expires_at ON web_cache (expires_at)")
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: Could not open web tool cache at {path}, using memory only: {e}")
+                self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached value, unless missing or expired"""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT value FROM web_cache WHERE key = ? AND expires_at > ?",
+                                         (key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Warning: web tool cache read failed: {e}")
+            return None
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float):
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO web_cache (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                                   (key, value, now + ttl, now))
+                self._writes += 1
+                if self._writes % PURGE_EVERY_WRITES == 0:
+                    self._purge(now)
+                self._conn.commit()
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Warning: web tool cache write failed: {e}")
+
+    def _purge(self, now: float):
+        self._conn.execute("DELETE FROM web_cache WHERE expires_at <= ?", (now,))
+        # Over the cap: drop the entries closest to expiry
+        self._conn.execute(
+            "DELETE FROM web_cache WHERE key IN (SELECT key FROM web_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def stats(self) -> Dict[str, Any]:
+        size = None
+        if self.enabled:
+            with self._lock:
+                size = self._conn.execute("SELECT COUNT(*) FROM web_cache").fetchone()[0]
+        return {"path": self.path or None, "size": size, "max_entries": self.max_entries, "errors": self.errors}
+
+
+class ToolStats:
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.errors = 0
+        self.fetch_seconds = 0.0
+        self.max_fetch_seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits + self.coalesced
+        calls = hits + self.fetches
+        return {
+            "calls": calls,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "hit_ratio": round(hits / calls, 4) if calls else 0.0,
+            "mean_fetch_ms": round(self.fetch_seconds / self.fetches * 1000, 1) if self.fetches else 0.0,
+            "max_fetch_ms": round(self.max_fetch_seconds * 1000, 1)
+        }
+
+
+class WebToolCache:
+    """Cache for one tool: memory LRU, then the shared store, then a coalesced fetch.
+
+    Only successful results are cached; a fetch that raises is re-raised to every
+    caller waiting on it and tried again next time.
+    """
+
+    def __init__(self, tool: str, ttl: float, normalize: Callable[[str], str], store: WebCacheStore,
+                 memory_entries: int = WEB_CACHE_MEMORY_ENTRIES):
+        self.tool = tool
+        self.ttl = ttl
+        self.normalize = normalize
+        self.store = store
+        self.memory = TTLCache(maxsize=memory_entries, ttl=ttl)
+        self.metrics = ToolStats()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, query: str, load: Callable[[str], str]) -> str:
+        """load(query) on a miss; the result is cached under the normalized query"""
+        if self.ttl <= 0:
+            return self._load(query, load)
+        key = f"{self.tool}:{self.normalize(query)}"
+
+        value = self.memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.metrics.memory_hits += 1
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            with self._lock:
+                self.metrics.coalesced += 1
+            return future.result()
+
+        try:
+            value = self.store.get(key)
+            if value is not None:
+                with self._lock:
+                    self.metrics.disk_hits += 1
+                self.memory.set(key, value)
+            else:
+                value = self._load(query, load)
+                self.store.set(key, value, self.ttl)
+                self.memory.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _load(self, query: str, load: Callable[[str], str]) -> str:
+        start = time.perf_counter()
+        try:
+            return str(load(query))
+        except Exception:
+            with self._lock:
+                self.metrics.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.metrics.fetches += 1
+                self.metrics.fetch_seconds += elapsed
+                self.metrics.max_fetch_seconds = max(self.metrics.max_fetch_seconds, elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.metrics.to_dict(), "ttl_seconds": self.ttl, "memory_size": len(self.memory),
+                "in_flight": len(self._inflight)}
+
+
+web_cache_store = WebCacheStore(WEB_CACHE_PATH, WEB_CACHE_MAX_ENTRIES)
+search_cache = WebToolCache("search", WEB_SEARCH_TTL_SECONDS, normalize_query, web_cache_store)
+summary_cache = WebToolCache("summary", WEB_SUMMARY_TTL_SECONDS, normalize_url, web_cache_store)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "search_for_new_dishes": search_cache.stats(),
+        "summarize_web_content": summary_cache.stats(),
+        "store": web_cache_store.stats()
+    }
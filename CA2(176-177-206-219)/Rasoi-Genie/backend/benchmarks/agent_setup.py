@@ -0,0 +1,52 @@
+# agent_setup.py - per-request agent construction cost, before and after sharing the agent
+#
+# Run from the backend directory:
+#     python -m benchmarks.agent_setup --requests 200
+#
+# No LLM calls are made: constructing ChatTogether, the tools and the executor
+# is purely local, which is exactly the overhead being measured.
+import argparse
+import os
+import statistics
+import time
+
+from app import agents
+
+
+def _time_per_request(build, requests: int):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        build()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label: str, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<30} mean {statistics.mean(samples):8.3f} ms   p50 {statistics.median(samples):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request agent construction benchmark")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    api_key = os.getenv("TOGETHER_API_KEY", "benchmark-key")
+
+    # Before: every /generate-menu call built a complete IndianMenuAgent
+    before = _time_per_request(lambda: agents.IndianMenuAgent(together_api_key=api_key).agent_executor, args.requests)
+
+    # After: the agent is shared and only the per-run executor + memory is created
+    agents.get_menu_agent(api_key)
+    after = _time_per_request(lambda: agents.get_menu_agent(api_key).agent_executor, args.requests)
+
+    print(f"Per-request agent setup over {args.requests} requests")
+    _report("new IndianMenuAgent", before)
+    _report("shared agent (get_menu_agent)", after)
+    print(f"speedup: {statistics.mean(before) / statistics.mean(after):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# fallback_generation.py - throughput of the fallback (non-LLM) menu generator
+#
+# Run from the backend directory:
+#     python -m benchmarks.fallback_generation --menus 2000
+#
+# "legacy" re-implements the pre-index algorithm (a get_dishes_by_criteria
+# call per day x meal x cuisine) so both paths are measured on the same data.
+import argparse
+import random
+import time
+
+from app import agents
+
+PREFERENCES = [
+    {"diet_type": "veg", "cuisine": ["north_indian", "gujarati"], "meals": ["breakfast", "lunch", "dinner"]},
+    {"diet_type": "non_veg", "cuisine": ["bengali", "south_indian", "punjabi"], "meals": ["breakfast", "lunch", "snacks", "dinner"]},
+    {"diet_type": "vegan", "cuisine": ["marathi"], "meals": ["breakfast", "lunch", "dinner"]},
+]
+
+
+def _legacy_get_dishes(cuisine, meal_type, diet_type, count):
+    cuisines = [c.strip() for c in cuisine.split(',') if c.strip()]
+    all_dishes = []
+    for c in cuisines:
+        all_dishes.extend(agents.IndianMenuDatabase.DISHES.get(c, {}).get(meal_type, {}).get(diet_type, []))
+    return random.sample(list(set(all_dishes)), min(count, len(list(set(all_dishes))))) if all_dishes else []
+
+
+def _legacy_fallback(preferences):
+    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    menu = {}
+    used_dishes = set()
+    for day in days:
+        menu[day] = {}
+        for meal in preferences["meals"]:
+            dish_found = False
+            for cuisine in preferences["cuisine"]:
+                dishes = _legacy_get_dishes(cuisine, meal, preferences["diet_type"], 20)
+                available = [dish for dish in dishes if dish not in used_dishes]
+                if available:
+                    menu[day][meal] = random.choice(available)
+                    used_dishes.add(menu[day][meal])
+                    dish_found = True
+                    break
+            if not dish_found:
+                menu[day][meal] = f"Simple {meal.title()} ({preferences['diet_type']})"
+    return menu
+
+
+def _throughput(generate, menus: int) -> float:
+    start = time.perf_counter()
+    for i in range(menus):
+        generate(PREFERENCES[i % len(PREFERENCES)])
+    return menus / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fallback menu generation throughput")
+    parser.add_argument("--menus", type=int, default=2000)
+    args = parser.parse_args()
+
+    agent = agents.IndianMenuAgent.__new__(agents.IndianMenuAgent)  # no LLM client needed for the fallback path
+    legacy = _throughput(_legacy_fallback, args.menus)
+    indexed = _throughput(agent._fallback_menu_generation, args.menus)
+
+    print(f"Fallback generation over {args.menus} menus")
+    print(f"legacy (per-slot criteria scans) {legacy:10.0f} menus/s")
+    print(f"indexed (precomputed pools)      {indexed:10.0f} menus/s")
+    print(f"speedup: {indexed / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# import_time.py - cold import time of the API worker vs the LangChain agent stack
+#
+# Run from the backend directory:
+#     python -m benchmarks.import_time --runs 5
+#     python -m benchmarks.import_time --max-api-ms 1500    # exit 1 over budget (e.g. in CI)
+#
+# Each run is a fresh interpreter under `python -X importtime`, so nothing is
+# cached in sys.modules. app.main is what every uvicorn worker imports before
+# it can serve /login; it must not pull in LangChain (that is app.agents,
+# loaded by generation.agent_loader after startup). The script exits 1 if it does.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = "import {module}, sys; print(int(any(name.split('.')[0].startswith('langchain') for name in sys.modules)))"
+
+
+def _import_once(module: str) -> Tuple[float, Dict[str, int], bool]:
+    """(cumulative ms of `module`, self us per top-level package, whether LangChain got imported)"""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.getenv("PYTHONPATH")])),
+           "TOGETHER_API_KEY": os.getenv("TOGETHER_API_KEY", "benchmark-key")}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+                          cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    total_us, packages = 0, defaultdict(int)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        packages[name.split(".")[0]] += int(self_us)
+        if name == module:
+            total_us = int(cumulative_us)
+    return total_us / 1000, packages, proc.stdout.strip().endswith("1")
+
+
+def _measure(module: str, runs: int) -> Tuple[List[float], Dict[str, int], bool]:
+    samples, packages, langchain = [], defaultdict(int), False
+    for _ in range(runs):
+        ms, run_packages, run_langchain = _import_once(module)
+        samples.append(ms)
+        langchain = langchain or run_langchain
+        for name, us in run_packages.items():
+            packages[name] += us // runs
+    return samples, packages, langchain
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import time of app.main (API worker) vs app.agents (LangChain stack)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="heaviest top-level packages to list per module")
+    parser.add_argument("--max-api-ms", type=float, default=None, help="fail if app.main's median import time exceeds this")
+    args = parser.parse_args()
+
+    api_median, api_langchain = None, False
+    for module in ("app.main", "app.agents"):
+        samples, packages, langchain = _measure(module, args.runs)
+        median = statistics.median(samples)
+        print(f"{module:<11} median {median:8.1f} ms   min {min(samples):8.1f} ms   "
+              f"max {max(samples):8.1f} ms   langchain imported: {'yes' if langchain else 'no'}")
+        heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print("            " + ", ".join(f"{name} {us / 1000:.0f} ms" for name, us in heaviest))
+        if module == "app.main":
+            api_median, api_langchain = median, langchain
+
+    failed = False
+    if api_langchain:
+        print("FAIL: importing app.main loads LangChain; import app.agents lazily (generation.agent_loader)")
+        failed = True
+    if args.max_api_ms is not None and api_median > args.max_api_ms:
+        print(f"FAIL: app.main imports in {api_median:.1f} ms, budget {args.max_api_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+# loadtest.py - offline end-to-end load test of the API: SQLite, scripted LLM and fake web search
+#
+# Run from the backend directory (no network, API key or MySQL needed):
+#     python -m benchmarks.loadtest --requests 1000 --concurrency 32
+#     python -m benchmarks.loadtest --mix login=4,get_preferences=3,generate=3 --generation-mode structured
+#     python -m benchmarks.loadtest --max-p95-ms generate=1500,login=800 --json loadtest.json   # exit 1 on regression
+#
+# The real app (app.main with its middleware, job queue and caches) runs
+# in-process against a throwaway SQLite database and is driven through httpx
+# by --concurrency clients. The shared IndianMenuAgent gets a ScriptedChatModel
+# replaying benchmarks/recordings/weekly_menu.json (plus one web search step)
+# and a FakeSearch, sleeping --llm-latency-ms / --search-latency-ms per call.
+# Accounts are registered and given preferences before the measured phase;
+# per-stage timings are read back from the app's Prometheus metrics.
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+OPERATIONS = ("register", "login", "get_preferences", "save_preferences", "generate")
+DEFAULT_MIX = "register=1,login=2,get_preferences=3,save_preferences=1,generate=3"
+
+# Inserted before the recorded nutrition check, so agent runs exercise the web tool and dish discovery
+SEARCH_STEP = ("Thought: Let me look for a few newer Gujarati breakfast ideas as well.\n"
+               "Action: search_for_new_dishes\n"
+               "Action Input: popular gujarati vegetarian breakfast dishes")
+SEARCH_RESULT = ("Results for {query}: Methi Thepla and Handvo are weekday favourites, while Sev Khamani, "
+                 "Khaman Dhokla and Bajra Rotla turn up in most Gujarati breakfast lists.")
+
+# Recorded in (stage, metric, labels) form; means are over the measured phase only
+STAGE_METRICS = [
+    ("load_preferences", "rasoi_menu_stage_duration_seconds", {"stage": "load_preferences"}),
+    ("queue_wait", "rasoi_menu_stage_duration_seconds", {"stage": "queue_wait"}),
+    ("agent_slot_wait", "rasoi_menu_stage_duration_seconds", {"stage": "agent_slot_wait"}),
+    ("generate", "rasoi_menu_stage_duration_seconds", {"stage": "generate"}),
+    ("save", "rasoi_menu_stage_duration_seconds", {"stage": "save"}),
+    ("llm_call", "rasoi_llm_call_duration_seconds", None),
+    ("tool_call", "rasoi_agent_tool_call_duration_seconds", None),
+    ("db_query_async", "rasoi_db_query_duration_seconds", {"engine": "async"}),
+    ("db_query_sync", "rasoi_db_query_duration_seconds", {"engine": "sync"}),
+    ("password_hash", "rasoi_password_hash_duration_seconds", None),
+    ("password_queue", "rasoi_password_queue_wait_seconds", None),
+]
+
+
+def _weights(text: str) -> Dict[str, float]:
+    weights = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        name, _, value = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        weights[name] = float(value)
+    return weights
+
+
+def _preference_variants(base: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Same diet and cuisines as the recording (so its menu fits), different menu cache keys
+    return [{**base, "cooking_time": cooking_time, "health_conditions": conditions}
+            for cooking_time in ("<30min", "30-60min", ">60min") for conditions in ([], ["diabetes"])]
+
+
+def _react_step(prompt: str) -> int:
+    # Steps already taken = observations in the scratchpad after the question
+    return prompt.rsplit("\nQuestion:", 1)[-1].count("\nObservation:")
+
+
+def _structured_step(prompt: str) -> int:
+    return 1 if "Part of the week is already planned" in prompt else 0
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def _histogram_totals(registry, metric: str, labels: Optional[Dict[str, str]]):
+    """(count, sum) of a histogram, summed over every label set matching `labels`"""
+    count = total = 0.0
+    for family in registry.collect():
+        if family.name != metric:
+            continue
+        for sample in family.samples:
+            if labels and any(sample.labels.get(k) != v for k, v in labels.items()):
+                continue
+            if sample.name == f"{metric}_count":
+                count += sample.value
+            elif sample.name == f"{metric}_sum":
+                total += sample.value
+    return count, total
+
+
+class LoadTest:
+    def __init__(self, client, args, preferences: List[Dict[str, Any]]):
+        self.client = client
+        self.args = args
+        self.preferences = preferences
+        self.rng = random.Random(args.seed)
+        self.users: List[Dict[str, str]] = []
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+        self._registered = 0
+
+    async def _request(self, op: str, method: str, url: str, token: Optional[str] = None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else None
+        start = time.perf_counter()
+        response = await self.client.request(method, url, headers=headers, **kwargs)
+        self.latencies[op].append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            self.errors[op][response.status_code] += 1
+        return response
+
+    def _new_account(self) -> Dict[str, str]:
+        self._registered += 1
+        name = f"load{self._registered}"
+        return {"username": name, "email": f"{name}@loadtest.example.com", "password": f"pw-{name}"}
+
+    async def _register(self, op: str) -> Dict[str, str]:
+        account = self._new_account()
+        await self._request(op, "POST", "/register", json=account)
+        return account
+
+    async def _login(self, op: str, account: Dict[str, str]) -> Optional[str]:
+        response = await self._request(op, "POST", "/login",
+                                       json={"username": account["username"], "password": account["password"]})
+        return response.json()["access_token"] if response.status_code == 200 else None
+
+    async def _save_preferences(self, op: str, token: str):
+        await self._request(op, "POST", "/preferences", token, json=self.rng.choice(self.preferences))
+
+    async def _setup_user(self, slots: asyncio.Semaphore):
+        async with slots:
+            account = await self._register("setup")
+            account["token"] = await self._login("setup", account)
+            await self._save_preferences("setup", account["token"])
+            self.users.append(account)
+
+    async def setup(self):
+        slots = asyncio.Semaphore(self.args.concurrency)
+        await asyncio.gather(*(self._setup_user(slots) for _ in range(self.args.users)))
+
+    async def run_operation(self, op: str):
+        user = self.rng.choice(self.users)
+        if op == "register":
+            await self._register(op)
+        elif op == "login":
+            await self._login(op, user)
+        elif op == "get_preferences":
+            await self._request(op, "GET", "/preferences", user["token"])
+        elif op == "save_preferences":
+            await self._save_preferences(op, user["token"])
+        elif op == "generate":
+            body = {"generation_mode": self.args.generation_mode,
+                    "force_fresh": self.rng.random() < self.args.force_fresh_ratio}
+            await self._request(op, "POST", "/generate-menu", user["token"], json=body)
+
+    async def run(self, operations: List[str]) -> float:
+        pending = iter(operations)
+
+        async def client():
+            for op in pending:
+                await self.run_operation(op)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(self.args.concurrency)))
+        return time.perf_counter() - start
+
+
+def _configure_environment(args):
+    # app modules read these at import time
+    workdir = tempfile.mkdtemp(prefix="rasoi-loadtest-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+    os.environ["TOGETHER_API_KEY"] = "offline"
+    os.environ["WEB_CACHE_PATH"] = ""  # memory only, so every run starts cold
+    os.environ["AGENT_WARMUP"] = "false"  # the scripted agent is installed below instead
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # A handful of test users generate far more often than real ones; 429s show up under errors by status
+    os.environ["GENERATE_RATE_PER_MINUTE"] = str(args.user_rate_per_minute)
+
+
+def _install_agent(args, recording):
+    from app import agents, generation
+    from benchmarks.recorded_llm import FakeSearch, ScriptedChatModel
+
+    if args.generation_mode == "structured":
+        llm = ScriptedChatModel(responses=recording["structured"], step=_structured_step, latency=args.llm_latency_ms / 1000)
+    else:
+        steps = recording["agent"][:-2] + [SEARCH_STEP] + recording["agent"][-2:]
+        llm = ScriptedChatModel(responses=steps, step=_react_step, latency=args.llm_latency_ms / 1000)
+    search = FakeSearch(SEARCH_RESULT, latency=args.search_latency_ms / 1000)
+    agents.set_menu_agent(agents.IndianMenuAgent(together_api_key="offline", llm=llm, search=search))
+    generation.agent_loader.load()
+    return llm, search
+
+
+def _report(test: LoadTest, elapsed: float, stages: Dict[str, Dict[str, float]], extra: Dict[str, Any]) -> Dict[str, Any]:
+    results = {"elapsed_seconds": round(elapsed, 3), "operations": {}, "stages": stages, **extra}
+    print(f"{'operation':<17}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    measured = {op: test.latencies.get(op, []) for op in OPERATIONS}
+    measured["all"] = [ms for samples in measured.values() for ms in samples]
+    for op, samples in measured.items():
+        if not samples:
+            continue
+        samples = sorted(samples)
+        errors = sum(count for name, counter in test.errors.items() if op in (name, "all") and name != "setup"
+                     for count in counter.values())
+        row = {"count": len(samples), "errors": errors, "p50_ms": round(_percentile(samples, 50), 2),
+               "p95_ms": round(_percentile(samples, 95), 2), "p99_ms": round(_percentile(samples, 99), 2),
+               "mean_ms": round(statistics.mean(samples), 2)}
+        results["operations"][op] = row
+        print(f"{op:<17}{row['count']:>7}{row['errors']:>8}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+              f"{row['p99_ms']:>10.1f}{row['mean_ms']:>10.1f}")
+    total = results["operations"].get("all", {}).get("count", 0)
+    results["rps"] = round(total / elapsed, 2) if elapsed else 0.0
+    print(f"{total} requests in {elapsed:.2f} s = {results['rps']:.1f} req/s")
+    statuses = {f"{op} {status}": count for op, counter in test.errors.items() if op != "setup"
+                for status, count in counter.items()}
+    if statuses:
+        print("errors by status: " + ", ".join(f"{name}: {count}" for name, count in sorted(statuses.items())))
+    results["errors_by_status"] = statuses
+
+    print(f"\n{'stage':<17}{'count':>7}{'mean ms':>10}")
+    for stage, row in stages.items():
+        if row["count"]:
+            print(f"{stage:<17}{row['count']:>7.0f}{row['mean_ms']:>10.2f}")
+    print(f"\n{extra['llm_calls']} LLM calls, {extra['web_searches']} web searches, "
+          f"menu cache hit ratio {extra['menu_cache_hit_ratio']:.2f}")
+    return results
+
+
+def _check_budgets(results: Dict[str, Any], budgets: Dict[str, float], max_error_rate: float) -> bool:
+    ok = True
+    for op, budget in budgets.items():
+        p95 = results["operations"].get(op, {}).get("p95_ms")
+        if p95 is not None and p95 > budget:
+            print(f"FAIL: {op} p95 {p95:.1f} ms over budget {budget:.1f} ms")
+            ok = False
+    overall = results["operations"].get("all", {})
+    if overall.get("count") and overall["errors"] / overall["count"] > max_error_rate:
+        print(f"FAIL: error rate {overall['errors'] / overall['count']:.2%} over {max_error_rate:.2%}")
+        ok = False
+    return ok
+
+
+async def _main(args) -> int:
+    import httpx
+    from prometheus_client import REGISTRY
+
+    from app import cache, database, main as api
+    from benchmarks.recorded_llm import load_recording
+
+    recording = load_recording("weekly_menu")
+    database.init_db()
+    llm, search = _install_agent(args, recording) if args.generation_mode != "local" else (None, None)
+
+    test = LoadTest(None, args, _preference_variants(recording["preferences"]))
+    rng = random.Random(args.seed)
+    names, weights = zip(*args.mix.items())
+    operations = rng.choices(names, weights=weights, k=args.requests)
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    await api.app.router.startup()
+    try:
+        async with httpx.AsyncClient(app=api.app, base_url="http://loadtest", limits=limits, timeout=None) as client:
+            test.client = client
+            await test.setup()
+            before = {stage: _histogram_totals(REGISTRY, metric, labels) for stage, metric, labels in STAGE_METRICS}
+            llm_before = llm.calls if llm else 0
+            cache_before = cache.menu_cache.stats()
+            # The ReAct executor runs verbose; keep its transcript out of the report
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+                elapsed = await test.run(operations)
+    finally:
+        await api.app.router.shutdown()
+
+    stages = {}
+    for stage, metric, labels in STAGE_METRICS:
+        count, total = (a - b for a, b in zip(_histogram_totals(REGISTRY, metric, labels), before[stage]))
+        stages[stage] = {"count": count, "mean_ms": round(total / count * 1000, 3) if count else 0.0}
+    cache_after = cache.menu_cache.stats()
+    hits, misses = cache_after["hits"] - cache_before["hits"], cache_after["misses"] - cache_before["misses"]
+    extra = {
+        "concurrency": args.concurrency, "users": args.users, "generation_mode": args.generation_mode,
+        "llm_latency_ms": args.llm_latency_ms, "llm_calls": (llm.calls - llm_before) if llm else 0,
+        "web_searches": search.calls if search else 0,
+        "menu_cache_hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+    }
+    print(f"{args.requests} requests, mix {dict(args.mix)}, {args.concurrency} clients, {args.users} users, "
+          f"{args.generation_mode} generation, {args.llm_latency_ms:.0f} ms per LLM call\n")
+    results = _report(test, elapsed, stages, extra)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if _check_budgets(results, args.max_p95_ms, args.max_error_rate) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end API load test with a scripted LLM, fake search and SQLite")
+    parser.add_argument("--requests", type=int, default=1000, help="requests in the measured phase")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--users", type=int, default=50, help="accounts registered (with preferences) before the run")
+    parser.add_argument("--mix", type=_weights, default=_weights(DEFAULT_MIX),
+                        help=f"operation weights, default {DEFAULT_MIX}")
+    parser.add_argument("--generation-mode", choices=("agent", "structured", "local"), default="agent")
+    parser.add_argument("--force-fresh-ratio", type=float, default=0.1, help="share of /generate-menu calls that skip the menu cache")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="simulated provider round-trip per LLM call")
+    parser.add_argument("--search-latency-ms", type=float, default=200.0, help="simulated web search latency")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--user-rate-per-minute", type=float, default=0,
+                        help="per-user /generate-menu rate limit (0 = off; the global agent budget still applies)")
+    parser.add_argument("--database-url", default=None, help="sync SQLAlchemy URL; a temporary SQLite file if unset")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--max-p95-ms", type=lambda text: {k: float(v) for k, _, v in (p.partition("=") for p in text.split(",") if p)},
+                        default={}, help="per-operation p95 budgets, e.g. generate=1500,login=800")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the agent transcripts")
+    args = parser.parse_args()
+
+    _configure_environment(args)
+    sys.exit(asyncio.run(_main(args)))
+
+
+if __name__ == "__main__":
+    main()
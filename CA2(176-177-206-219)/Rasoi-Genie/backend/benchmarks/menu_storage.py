@@ -0,0 +1,152 @@
+# menu_storage.py - weekly_menus table size and row read latency, JSON text vs compact blobs
+#
+# Run from the backend directory:
+#     python -m benchmarks.menu_storage                    # 1,000,000 synthetic menus
+#     python -m benchmarks.menu_storage --menus 100000 --reads 5000
+#
+# Builds two SQLite files with the current schema. "json" fills menu_data /
+# generation_prompt the way rows were written before the compact format;
+# "compact" goes through the same encoding as crud.save_weekly_menu (dish ids +
+# a preference snapshot, with history previews decoded from the blob). Reads
+# are random point lookups decoded with crud.load_menu, plus one
+# /menu-history page per read, with warm process caches.
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, menu_codec, models
+from app.dishes import DISH_INDEX
+from app.planner import DAYS, DEFAULT_MEALS
+
+BATCH_SIZE = 10000
+DIETS = ["veg", "non-veg", "vegan"]
+CUISINES = ["north-indian", "south-indian", "gujarati", "bengali", "punjabi", "maharashtrian"]
+CONDITIONS = ["diabetes", "bp", "cholesterol"]
+
+
+def _preference_pool(rng: random.Random, size: int):
+    return [{
+        "diet_type": rng.choice(DIETS),
+        "cuisine": rng.sample(CUISINES, rng.randint(1, 3)),
+        "meals": DEFAULT_MEALS,
+        "cooking_time": rng.choice(["<15min", "<30min", "<45min"]),
+        "health_conditions": rng.sample(CONDITIONS, rng.randint(0, 2)),
+    } for _ in range(size)]
+
+
+def _menus(rng: random.Random, count: int, dishes, preferences):
+    for _ in range(count):
+        picks = iter(rng.sample(dishes, len(DAYS) * len(DEFAULT_MEALS)))
+        menu = {day: {meal: next(picks) for meal in DEFAULT_MEALS} for day in DAYS}
+        yield menu, rng.choice(preferences)
+
+
+def _build(path: str, layout: str, count: int, seed: int, users: int) -> float:
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    rng = random.Random(seed)
+    dishes = list(DISH_INDEX.dishes)
+    preferences = _preference_pool(rng, 500)
+    if layout == "compact":
+        dish_ids = crud.dish_ids_for(db, dishes)
+        snapshot_ids = [crud.snapshot_id_for(db, pref) for pref in preferences]
+        snapshot_of = {id(pref): snapshot_id for pref, snapshot_id in zip(preferences, snapshot_ids)}
+        db.commit()
+
+    table = models.WeeklyMenu.__table__
+    start = time.perf_counter()
+    batch = []
+    for n, (menu, pref) in enumerate(_menus(rng, count, dishes, preferences)):
+        row = {"user_id": n % users + 1, "created_at": "2024-01-01T00:00:00", "is_active": 0}
+        if layout == "compact":
+            row.update(menu_blob=menu_codec.encode_menu(menu, dish_ids), snapshot_id=snapshot_of[id(pref)],
+                       menu_data=None, generation_prompt=None, menu_preview=None)
+        else:
+            row.update(menu_data=json.dumps(menu), generation_prompt=json.dumps(pref),
+                       menu_preview=json.dumps(crud.build_menu_preview(menu)), menu_blob=None, snapshot_id=None)
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.execute(insert(table), batch)
+            batch = []
+    if batch:
+        db.execute(insert(table), batch)
+    db.commit()
+    db.close()
+    engine.dispose()
+    return time.perf_counter() - start
+
+
+def _table_bytes(path: str) -> int:
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.connect() as connection:
+        try:
+            # Per-table size when SQLite is built with the dbstat virtual table
+            return connection.execute(text(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name IN ('weekly_menus', 'dishes', 'preference_snapshots')")).scalar()
+        except Exception:
+            return os.path.getsize(path)
+        finally:
+            engine.dispose()
+
+
+def _percentiles(latencies):
+    latencies = sorted(latencies)
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+def _read_latencies(path: str, count: int, users: int, reads: int, seed: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Session = sessionmaker(bind=engine)
+    rng = random.Random(seed)
+    menu_reads, history_reads = [], []
+    with Session() as db:
+        for _ in range(reads):
+            start = time.perf_counter()
+            crud.load_menu(db, db.get(models.WeeklyMenu, rng.randint(1, count)))
+            menu_reads.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            crud.get_menu_history(db, rng.randint(1, users), 10)
+            history_reads.append(time.perf_counter() - start)
+            db.expunge_all()
+    engine.dispose()
+    return _percentiles(menu_reads), _percentiles(history_reads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="weekly_menus size and read latency, JSON text vs compact storage")
+    parser.add_argument("--menus", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--dir", default=None, help="where to put the SQLite files (needs a few GB at 1M menus)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp()
+    results = {}
+    for layout in ("json", "compact"):
+        path = os.path.join(directory, f"menus_{layout}.db")
+        if os.path.exists(path):
+            os.remove(path)
+        load_seconds = _build(path, layout, args.menus, args.seed, args.users)
+        size = _table_bytes(path)
+        (menu_p50, menu_p95), (history_p50, history_p95) = _read_latencies(path, args.menus, args.users, args.reads, args.seed)
+        results[layout] = size
+        print(f"{layout:8s} {size / 1e6:10.1f} MB  {size / args.menus:6.0f} B/menu  "
+              f"menu read p50/p95 {menu_p50 * 1e6:5.0f}/{menu_p95 * 1e6:5.0f} us  "
+              f"history page p50/p95 {history_p50 * 1e6:5.0f}/{history_p95 * 1e6:5.0f} us  (load {load_seconds:.0f}s)")
+
+    print(f"{args.menus} menus; compact is {results['compact'] / results['json']:.2f}x the size "
+          f"(codec: {'zstd/msgpack' if menu_codec.BLOB_FORMAT == menu_codec.FORMAT_ZSTD_MSGPACK else 'zlib/json'})")
+
+
+if __name__ == "__main__":
+    main()
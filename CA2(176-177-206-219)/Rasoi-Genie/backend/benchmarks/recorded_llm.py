@@ -0,0 +1,73 @@
+# recorded_llm.py - replays recorded LLM replies so the LLM generation modes run offline
+#
+#     llm = RecordedChatModel(responses=load_recording("weekly_menu")["structured"], latency=1.2)
+#     agent = agents.IndianMenuAgent(together_api_key="offline", llm=llm)
+#
+# Replies come back in recorded order (cycling), after `latency` seconds to
+# stand in for the provider round-trip. ScriptedChatModel instead picks the
+# reply from the prompt, for many concurrent runs sharing one model, and
+# FakeSearch stands in for the web search tool. Recordings live in
+# benchmarks/recordings.
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from langchain_community.chat_models.fake import FakeListChatModel
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), "recordings")
+
+
+def load_recording(name: str) -> Dict[str, Any]:
+    with open(os.path.join(RECORDINGS_DIR, f"{name}.json")) as f:
+        return json.load(f)
+
+
+class RecordedChatModel(FakeListChatModel):
+    """FakeListChatModel with a simulated round-trip and a call counter"""
+
+    latency: float = 0.0
+    calls: int = 0
+    _lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "recorded-chat-model"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            return super()._call(messages, stop, run_manager, **kwargs)
+
+
+class ScriptedChatModel(RecordedChatModel):
+    """Replies with responses[step(prompt)], so interleaved runs each get the reply for their own step"""
+
+    step: Callable[[str], int]
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+        return self.responses[self.step(messages[-1].content) % len(self.responses)]
+
+
+class FakeSearch:
+    """Stands in for DuckDuckGoSearchRun: `text` (formatted with the query) after `latency` seconds"""
+
+    def __init__(self, text: str, latency: float = 0.0):
+        self.text = text
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def run(self, query: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+        return self.text.format(query=query)
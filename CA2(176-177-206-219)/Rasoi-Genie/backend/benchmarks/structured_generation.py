@@ -0,0 +1,62 @@
+# structured_generation.py - LLM round-trips and latency per menu, ReAct agent vs structured mode
+#
+# Run from the backend directory (no network or API key needed):
+#     python -m benchmarks.structured_generation --menus 20
+#     python -m benchmarks.structured_generation --llm-latency-ms 0    # local overhead only
+#
+# Both modes run against benchmarks/recordings/weekly_menu.json through
+# RecordedChatModel, which sleeps --llm-latency-ms per call in place of the
+# Together round-trip. The structured recording's first reply repeats a dish,
+# leaves a slot out and puts a non-veg catalog dish in a veg week, so every
+# menu also exercises one repair call.
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+from app import agents
+from benchmarks.recorded_llm import RecordedChatModel, load_recording
+
+
+def _run(mode: str, recording, menus: int, latency: float):
+    calls, seconds, planner_slots = [], [], 0
+    for _ in range(menus):
+        llm = RecordedChatModel(responses=recording[mode], latency=latency)
+        agent = agents.IndianMenuAgent(together_api_key="offline", llm=llm)
+        start = time.perf_counter()
+        # The ReAct executor runs verbose; keep its transcript out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            if mode == "structured":
+                result = agent.generate_structured_menu(recording["preferences"])
+            else:
+                result = agent.generate_weekly_menu(recording["preferences"])
+        seconds.append(time.perf_counter() - start)
+        calls.append(llm.calls)
+        planner_slots += result.get("planner_slots", 0)
+        assert not result.get("fallback_used"), f"{mode} fell back: {result.get('message')}"
+    return calls, seconds, planner_slots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM calls and latency per weekly menu, ReAct agent vs structured generation")
+    parser.add_argument("--menus", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=1200.0, help="simulated provider round-trip per LLM call")
+    args = parser.parse_args()
+
+    recording = load_recording("weekly_menu")
+    latency = args.llm_latency_ms / 1000
+    results = {}
+    for mode in ("agent", "structured"):
+        calls, seconds, planner_slots = _run(mode, recording, args.menus, latency)
+        results[mode] = statistics.mean(seconds)
+        print(f"{mode:<11} {statistics.mean(calls):5.1f} LLM calls/menu   "
+              f"mean {statistics.mean(seconds) * 1000:8.1f} ms   max {max(seconds) * 1000:8.1f} ms   "
+              f"planner-filled slots {planner_slots}")
+
+    print(f"{args.menus} menus, {args.llm_latency_ms:.0f} ms per LLM call; "
+          f"structured is {results['agent'] / results['structured']:.1f}x faster per menu")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# migrations - idempotent schema upgrades for databases created before a model change
+#
+# Fresh databases get the full schema from Base.metadata.create_all; these
+# scripts bring existing tables up to date. Each module exposes
+# upgrade(connection) and is safe to run more than once.
+#
+#     python -m migrations    # create missing tables, then apply every migration
+#
+# In Kubernetes this is the backend pods' initContainer. Replicas starting
+# together take turns through migration_lock, so the DDL and re-encoding
+# migrations never run concurrently.
+import os
+from contextlib import contextmanager
+from importlib import import_module
+
+from sqlalchemy import text
+
+MIGRATION_LOCK_NAME = "rasoi_migrations"
+MIGRATION_LOCK_TIMEOUT_SECONDS = int(os.getenv("MIGRATION_LOCK_TIMEOUT_SECONDS", 600))
+
+MIGRATIONS = [
+    "m001_weekly_menu_history",
+    "m002_preference_items",
+    "m003_compact_menus",
+    "m004_dish_catalog",
+    "m005_grocery_lists",
+]
+
+
+def upgrade_all(engine):
+    for name in MIGRATIONS:
+        module = import_module(f"{__name__}.{name}")
+        with engine.begin() as connection:
+            module.upgrade(connection)
+        print(f"Applied migration {name}")
+
+
+@contextmanager
+def migration_lock(engine):
+    """Held while migrating: a MySQL named lock (SQLite allows a single writer anyway)"""
+    if engine.dialect.name != "mysql":
+        yield
+        return
+    with engine.connect() as connection:
+        params = {"name": MIGRATION_LOCK_NAME, "timeout": MIGRATION_LOCK_TIMEOUT_SECONDS}
+        if connection.execute(text("SELECT GET_LOCK(:name, :timeout)"), params).scalar() != 1:
+            raise RuntimeError(f"Another replica held the migration lock for over {MIGRATION_LOCK_TIMEOUT_SECONDS}s")
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT RELEASE_LOCK(:name)"), params)
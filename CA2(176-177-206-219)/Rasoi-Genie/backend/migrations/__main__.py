@@ -0,0 +1,7 @@
+from app import database
+
+from . import migration_lock, upgrade_all
+
+with migration_lock(database.engine):
+    database.init_db()
+    upgrade_all(database.engine)
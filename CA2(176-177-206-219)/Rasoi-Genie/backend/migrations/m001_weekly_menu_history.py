@@ -0,0 +1,38 @@
+# m001_weekly_menu_history.py - menu_preview column and history indexes on weekly_menus
+import json
+
+from sqlalchemy import inspect, text
+
+from app import crud, models
+
+BATCH_SIZE = 500
+
+
+def upgrade(connection):
+    inspector = inspect(connection)
+    columns = {column["name"] for column in inspector.get_columns("weekly_menus")}
+    if "menu_preview" not in columns:
+        connection.execute(text("ALTER TABLE weekly_menus ADD COLUMN menu_preview TEXT"))
+
+    existing = {index["name"] for index in inspector.get_indexes("weekly_menus")}
+    for index in models.WeeklyMenu.__table__.indexes:
+        if index.name not in existing:
+            index.create(connection)
+
+    # Backfill previews in batches so large tables aren't loaded at once
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            text("SELECT id, menu_data FROM weekly_menus WHERE menu_preview IS NULL AND menu_data IS NOT NULL "
+                 "AND id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        for menu_id, menu_data in rows:
+            preview = crud.build_menu_preview(json.loads(menu_data))
+            connection.execute(
+                text("UPDATE weekly_menus SET menu_preview = :preview WHERE id = :id"),
+                {"preview": json.dumps(preview), "id": menu_id}
+            )
+        last_id = rows[-1][0]
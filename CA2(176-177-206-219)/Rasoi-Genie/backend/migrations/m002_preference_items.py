@@ -0,0 +1,47 @@
+# m002_preference_items.py - move comma-joined preference columns into preference_items
+from sqlalchemy import inspect, text
+
+from app import models
+
+BATCH_SIZE = 500
+LEGACY_COLUMNS = ("cuisine", "meals", "health_conditions")
+
+
+def upgrade(connection):
+    models.PreferenceItem.__table__.create(connection, checkfirst=True)
+
+    inspector = inspect(connection)
+    existing = {index["name"] for index in inspector.get_indexes("preferences")}
+    for index in models.Preference.__table__.indexes:
+        if index.name not in existing:
+            index.create(connection)
+
+    columns = {column["name"] for column in inspector.get_columns("preferences")}
+    legacy = [column for column in LEGACY_COLUMNS if column in columns]
+    if not legacy:
+        return
+
+    # Copy in batches; preferences that already have items (a previous partial run) are skipped
+    items = models.PreferenceItem.__table__
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            text(f"SELECT id, {', '.join(legacy)} FROM preferences p WHERE id > :last_id "
+                 "AND NOT EXISTS (SELECT 1 FROM preference_items i WHERE i.preference_id = p.id) "
+                 "ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        values = []
+        for row in rows:
+            for category, joined in zip(legacy, row[1:]):
+                parts = dict.fromkeys(part.strip() for part in (joined or "").split(",") if part.strip())
+                values.extend({"preference_id": row[0], "category": category, "value": value, "position": position}
+                              for position, value in enumerate(parts))
+        if values:
+            connection.execute(items.insert(), values)
+        last_id = rows[-1][0]
+
+    for column in legacy:
+        connection.execute(text(f"ALTER TABLE preferences DROP COLUMN {column}"))
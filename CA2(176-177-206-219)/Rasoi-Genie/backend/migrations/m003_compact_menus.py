@@ -0,0 +1,46 @@
+# m003_compact_menus.py - dishes / preference_snapshots tables and menu_blob storage for weekly_menus
+import json
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from app import crud, menu_codec, models
+
+BATCH_SIZE = 500
+
+
+def upgrade(connection):
+    models.Dish.__table__.create(connection, checkfirst=True)
+    models.PreferenceSnapshot.__table__.create(connection, checkfirst=True)
+
+    columns = {column["name"] for column in inspect(connection).get_columns("weekly_menus")}
+    if "menu_blob" not in columns:
+        blob_type = models.WeeklyMenu.__table__.c.menu_blob.type.compile(dialect=connection.dialect)
+        connection.execute(text(f"ALTER TABLE weekly_menus ADD COLUMN menu_blob {blob_type}"))
+    if "snapshot_id" not in columns:
+        connection.execute(text("ALTER TABLE weekly_menus ADD COLUMN snapshot_id INTEGER REFERENCES preference_snapshots(id)"))
+
+    # Re-encode legacy rows in batches; rows whose menu isn't a plain grid keep their JSON
+    db = Session(bind=connection)
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            text("SELECT id, menu_data, generation_prompt FROM weekly_menus "
+                 "WHERE menu_blob IS NULL AND snapshot_id IS NULL AND id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        for menu_id, menu_data, generation_prompt in rows:
+            values = {"id": menu_id, "snapshot_id": crud.snapshot_id_for(db, json.loads(generation_prompt) if generation_prompt else {})}
+            menu = json.loads(menu_data) if menu_data else None
+            if menu is not None and crud.is_encodable_menu(menu):
+                values["menu_blob"] = menu_codec.encode_menu(menu, crud.dish_ids_for(db, menu_codec.dish_names(menu)))
+                connection.execute(
+                    text("UPDATE weekly_menus SET menu_blob = :menu_blob, snapshot_id = :snapshot_id, "
+                         "menu_data = NULL, generation_prompt = NULL, menu_preview = NULL WHERE id = :id"), values)
+            else:
+                connection.execute(
+                    text("UPDATE weekly_menus SET snapshot_id = :snapshot_id, generation_prompt = NULL WHERE id = :id"), values)
+        last_id = rows[-1][0]
+    db.close()
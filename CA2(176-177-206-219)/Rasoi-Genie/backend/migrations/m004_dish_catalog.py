@@ -0,0 +1,11 @@
+# m004_dish_catalog.py - dish_slots table and dishes.nutrition_mask for discovered dishes
+from sqlalchemy import inspect, text
+
+from app import models
+
+
+def upgrade(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("dishes")}
+    if "nutrition_mask" not in columns:
+        connection.execute(text("ALTER TABLE dishes ADD COLUMN nutrition_mask INTEGER"))
+    models.DishSlot.__table__.create(connection, checkfirst=True)
@@ -0,0 +1,11 @@
+# m005_grocery_lists.py - grocery_data column on weekly_menus
+#
+# No backfill: older menus get their grocery totals computed and stored the
+# first time their grocery list is requested.
+from sqlalchemy import inspect, text
+
+
+def upgrade(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("weekly_menus")}
+    if "grocery_data" not in columns:
+        connection.execute(text("ALTER TABLE weekly_menus ADD COLUMN grocery_data TEXT"))
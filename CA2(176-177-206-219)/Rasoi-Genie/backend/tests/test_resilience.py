@@ -0,0 +1,39 @@
+# test_resilience.py - the LLM circuit breaker's half_open probe
+import contextvars
+import time
+
+from app.resilience import CircuitBreaker
+
+COOLDOWN = 0.05
+
+
+def _tripped_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(window=10, min_calls=2, error_rate=0.5, p95_seconds=1.0, cooldown=COOLDOWN)
+    breaker.record(False, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == "open"
+    time.sleep(COOLDOWN)
+    return breaker
+
+
+def test_only_the_probe_decides_half_open():
+    breaker = _tripped_breaker()
+    # A generation that passed allow() before the trip, running in its own context
+    straggler = contextvars.copy_context()
+    assert breaker.allow()  # this context is the probe now
+    assert breaker.state == "half_open"
+
+    straggler.run(breaker.record, True, 0.1)
+    straggler.run(breaker.record, False, 0.1)
+    assert breaker.state == "half_open"
+
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed"
+
+
+def test_slow_probe_keeps_breaker_open():
+    breaker = _tripped_breaker()
+    assert breaker.allow()
+    breaker.record(True, 1.5)  # succeeded, but above p95_seconds
+    assert breaker.state == "open"
+    assert breaker.trips == 2
@@ -0,0 +1,46 @@
+# test_structured_generation.py - structured mode's slot checks against recorded replies
+#
+#     python -m pytest tests
+import json
+
+from app import agents
+from app.planner import DAYS
+from benchmarks.recorded_llm import RecordedChatModel, load_recording
+
+PREFERENCES = load_recording("weekly_menu")["preferences"]  # veg, breakfast/lunch/dinner
+
+# New dishes (not in the catalog) the model suggests on Monday
+NON_VEG_DISH = "Chettinad Chicken Pepper Fry"
+VEG_DISH = "Lauki Chana Dal Sabzi"
+
+
+def _reply(menu):
+    return f"Here is the plan:\n```json\n{json.dumps(menu)}\n```"
+
+
+def _generate(responses):
+    llm = RecordedChatModel(responses=responses)
+    agent = agents.IndianMenuAgent(together_api_key="offline", llm=llm)
+    return agent.generate_structured_menu(PREFERENCES), llm
+
+
+def _full_week():
+    # A valid week from the local planner, for a test to alter
+    week = agents.menu_planner.plan(PREFERENCES)["menu"]
+    return {day: dict(week[day]) for day in DAYS}
+
+
+def test_new_non_veg_dish_is_rejected_for_veg_user():
+    first = _full_week()
+    first["Monday"]["lunch"] = NON_VEG_DISH
+    first["Monday"]["dinner"] = VEG_DISH
+    # The repair call answers the re-asked slot with the same dish again
+    repair = {"Monday": {"lunch": NON_VEG_DISH}}
+    result, llm = _generate([_reply(first), _reply(repair)])
+
+    assert agents.DISH_INDEX.attributes(NON_VEG_DISH) is None
+    assert not result.get("fallback_used")
+    assert NON_VEG_DISH not in {dish for meals in result["menu"].values() for dish in meals.values()}
+    assert result["menu"]["Monday"]["lunch"]  # filled by a repair or the planner
+    assert result["menu"]["Monday"]["dinner"] == VEG_DISH
+    assert llm.calls >= 2  # the rejected slot was asked for again
@@ -105,11 +105,28 @@ class ApiService {
     });
   }
 
-  // Future: Not implemented yet
-  async generateGroceryList(token, menuId) {
-    throw new Error('Grocery list generation not yet implemented');
+  // Grocery lists (quantities scaled to servings)
+  async generateGroceryList(token, menuId, servings = 1) {
+    return this.request(`/menus/${menuId}/grocery-list?servings=${servings}`, {
+      method: 'GET',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+    });
+  }
+
+  async getGroceryListForWeeks(token, menuIds, servings = 1) {
+    const params = new URLSearchParams({ servings });
+    menuIds.forEach((id) => params.append('menu_ids', id));
+    return this.request(`/grocery-list?${params}`, {
+      method: 'GET',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+    });
   }
 
+  // Future: Not implemented yet
   async getRecipeVideos(token, dishName) {
     throw new Error('Recipe video search not yet implemented');
   }